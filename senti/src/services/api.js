@@ -1,12 +1,30 @@
 import axios from 'axios';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
+const TOKEN_KEY = 'authToken';
+
+// After Google sign-in the backend redirects to /dashboard#token=...; keep the token and drop it from the URL
+const redirectToken = new URLSearchParams(window.location.hash.slice(1)).get('token');
+if (redirectToken) {
+    localStorage.setItem(TOKEN_KEY, redirectToken);
+    window.history.replaceState(null, '', window.location.pathname + window.location.search);
+}
+
+// The API is cross-origin and no cookies are sent, so the signed-in user travels as a bearer token
+const client = axios.create();
+client.interceptors.request.use((config) => {
+    const token = localStorage.getItem(TOKEN_KEY);
+    if (token) {
+        config.headers.Authorization = `Bearer ${token}`;
+    }
+    return config;
+});
 
 export const api = {
     // Authentication
     getAuthUrl: async () => {
         try {
-            const response = await axios.get(`${API_URL}/auth/google`);
+            const response = await client.get(`${API_URL}/auth/google`);
             return response.data.url;
         } catch (error) {
             console.error('Auth Error:', error);
@@ -17,7 +35,7 @@ export const api = {
     // Send a message to the agent
     sendMessage: async (message, file = null) => {
         try {
-            const response = await axios.post(`${API_URL}/chat`, {
+            const response = await client.post(`${API_URL}/chat`, {
                 message,
                 file, // { name, type, data: base64 }
                 user_id: "demo_user" // Backend will override if logged in
@@ -32,7 +50,7 @@ export const api = {
     // Get Agent Memory
     getMemory: async (userId = 'demo_user') => {
         try {
-            const response = await axios.get(`${API_URL}/memory?user_id=${userId}`);
+            const response = await client.get(`${API_URL}/memory?user_id=${userId}`);
             return response.data;
         } catch (error) {
             console.error("Memory Error:", error);
@@ -43,7 +61,7 @@ export const api = {
     // Check server health
     checkHealth: async () => {
         try {
-            const response = await axios.get(`${API_URL}/`);
+            const response = await client.get(`${API_URL}/`);
             return response.data;
         } catch (error) {
             console.error('Health Check Error:', error);
@@ -54,16 +72,18 @@ export const api = {
     // Logout
     logout: async () => {
         try {
-            await axios.get(`${API_URL}/logout`);
+            await client.get(`${API_URL}/logout`);
         } catch (error) {
             console.error('Logout error:', error);
+        } finally {
+            localStorage.removeItem(TOKEN_KEY);
         }
     },
 
     // Get User Profile
     getUserProfile: async () => {
         try {
-            const response = await axios.get(`${API_URL}/me`);
+            const response = await client.get(`${API_URL}/me`);
             return response.data;
         } catch (error) {
             console.error('Fetch profile error:', error);
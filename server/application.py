@@ -1,28 +1,59 @@
 import os
 import sys
 import json
-from flask import Flask, request, jsonify, redirect, session, url_for
+from flask import Flask, Response, request, jsonify, redirect, session, stream_with_context, url_for
 from flask_cors import CORS
 from langchain_core.messages import HumanMessage
 import base64
+import datetime
+import hashlib
 import io
-from pypdf import PdfReader
+import itertools
+import mimetypes
+import threading
+from functools import wraps
 from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 
 # Ensure we can import from lang directory
-from lang.agent import agent, get_all_memories
+from lang.agent import (
+    MEMORY_PAGE_BATCH, agent, attachment_cache, calendar_cache, calendar_zones, checkpointer, context_window, document_store, embedding_function, extraction_cache, iter_memories, mailbox_index, memory_filter, memory_index, memory_queue, memory_version, response_cache, stream_agent_events,
+    MEMORY_FIELDS
+)
+from lang.attachment_cache import digest_bytes
+from lang.documents import DocumentTooLarge, MAX_UPLOAD_BYTES, check_size, format_document_context, format_excerpts
+from lang.credential_store import credential_store
+from lang.google_clients import UserServices, service_cache, save_credentials, delete_credentials
+from lang.lazy import is_loaded, status as component_status, warm_up
+from lang.telemetry import render as render_metrics, span, tracing
+from lang.cache import LRUCache
 
 from dotenv import load_dotenv
 
+# Load environment variables
+load_dotenv()
+
 application = Flask(__name__)
 app=application
-app.secret_key = os.urandom(24)
+# Sign-in tokens and the session are signed with this key, so every worker, instance and
+# restart must share it. Only the local dev server (python application.py, or FLASK_DEBUG=1)
+# may fall back to a random key.
+SECRET_KEY = os.getenv("FLASK_SECRET_KEY")
+if not SECRET_KEY:
+    if __name__ != '__main__' and os.getenv("FLASK_DEBUG") != "1":
+        raise RuntimeError("FLASK_SECRET_KEY is not set; every worker needs the same secret to verify sign-in tokens")
+    print("[WARN] FLASK_SECRET_KEY is not set; using a random key, sign-ins end when the server restarts")
+    SECRET_KEY = os.urandom(24).hex()
+app.secret_key = SECRET_KEY
+# Base64 attachments in /chat JSON are ~4/3 of the file size
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES * 3 // 2
 CORS(app, supports_credentials=True)
 
-# Load environment variables
-load_dotenv()
+# The frontend is cross-origin and sends no cookies: after the OAuth callback it receives a
+# signed token carrying a session id and sends it back as "Authorization: Bearer <token>".
+# The session lives in the credential store, so /logout on any worker revokes the token.
+AUTH_TOKEN_MAX_AGE = int(os.getenv("AUTH_TOKEN_MAX_AGE", str(30 * 24 * 3600)))
+auth_tokens = URLSafeTimedSerializer(SECRET_KEY, salt="auth-token")
 
 # Google Auth Configuration
 SCOPES = [
@@ -39,6 +70,13 @@ SCOPES = [
 # When running locally, allow HTTP for OAuth
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
+# Google userinfo per signed-in user, filled at OAuth callback time
+IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', '3600'))
+identity_cache = LRUCache(max_entries=256, ttl=IDENTITY_CACHE_TTL)
+
+MEMORY_PAGE_DEFAULT = 100
+MEMORY_PAGE_MAX = 1000
+
 @app.route('/')
 def home():
     # Update this string to verify deployment
@@ -116,24 +154,57 @@ def callback():
         flow.fetch_token(authorization_response=authorization_response)
         
         credentials = flow.credentials
-        
-        with open('token.json', 'w') as token:
-            token.write(credentials.to_json())
+
+        # The Google account is the tenant: stored credentials, caches and the sign-in token are keyed by its email.
+        # Resolving the identity here also means chat turns never call userinfo themselves.
+        user_info = UserServices(None, credentials).oauth2.userinfo().get().execute()
+        user_id = user_info['email']
+        save_credentials(user_id, credentials)
+        service_cache.invalidate(user_id)
+        identity_cache.set(user_id, user_info)
+        session_id = credential_store.start_session(user_id, max_age=AUTH_TOKEN_MAX_AGE)
+        session['sid'] = session_id
             
         frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
-        return redirect(f"{frontend_url}/dashboard?auth=success")
+        # In the fragment, the token never reaches a server log or a Referer header
+        return redirect(f"{frontend_url}/dashboard?auth=success#token={auth_tokens.dumps({'sid': session_id})}")
         
     except Exception as e:
         return f"Authentication failed: {e}", 400
 
-def get_google_service(service_name, version):
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-        return build(service_name, version, credentials=creds)
+def current_user_id():
+    """The signed-in Google account: from the bearer token, else the session (same-origin clients), else None.
+
+    Either one carries a session id, checked against the credential store on every
+    request, so a logout on another worker takes effect immediately.
+    """
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        try:
+            session_id = auth_tokens.loads(header[len('Bearer '):], max_age=AUTH_TOKEN_MAX_AGE).get('sid')
+        except (BadSignature, AttributeError):
+            return None
+    else:
+        session_id = session.get('sid')
+    return credential_store.session_user(session_id) if session_id else None
+
+def login_required(view):
+    """Answers 401 unless the request comes from a signed-in user."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user_id():
+            return jsonify({"error": "Not logged in"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def get_google_service(service_name, version, user_id=None):
+    services = service_cache.get(user_id or current_user_id())
+    if services:
+        return services.service(service_name, version)
     return None
 
-def get_current_user_info():
-    service = get_google_service('oauth2', 'v2')
+def fetch_user_info(user_id):
+    service = get_google_service('oauth2', 'v2', user_id)
     if service:
         try:
             return service.userinfo().get().execute()
@@ -141,6 +212,12 @@ def get_current_user_info():
             return None
     return None
 
+def get_current_user_info():
+    user_id = current_user_id()
+    if not user_id:
+        return None
+    return identity_cache.get_or_load(user_id, lambda: fetch_user_info(user_id))
+
 @app.route('/me')
 def get_current_user():
     user_info = get_current_user_info()
@@ -152,88 +229,196 @@ def get_current_user():
         })
     return jsonify({"error": "Not logged in"}), 401
 
+def build_content_parts(data, user_id):
+    """Turns a /chat JSON body (message + optional base64 file) into LLM content blocks.
+
+    PDF and text files go through the document store, and only the excerpts relevant
+    to the message are added to the prompt. `document_ids` from /documents uploads
+    are handled the same way.
+    """
+    user_input = data.get("message", "")
+    file_data = data.get("file") # {name, type, data: base64}
+    document_ids = data.get("document_ids") or []
+    
+    content_parts = []
+    
+    # 1. Handle User Text
+    if user_input:
+        content_parts.append({"type": "text", "text": user_input})
+        
+    # 2. Handle File Attachment
+    if file_data:
+        try:
+            fname = file_data.get('name', 'file')
+            ftype = file_data.get('type', '')
+            b64_data = file_data.get('data', '')
+            
+            # Strip header if present
+            if ',' in b64_data:
+                header, encoded = b64_data.split(',', 1)
+            else:
+                encoded = b64_data
+                # Reconstruct header for OpenAI if missing but needed? 
+                # Actually OpenAI image_url needs the data URI scheme usually e.g. "data:image/jpeg;base64,..."
+                # If incoming data HAS header, we keep it for OpenAI URL, but strip it for decoding bytes.
+            
+            check_size(fname, len(encoded) * 3 // 4)
+            file_bytes = base64.b64decode(encoded)
+            
+            if ftype.startswith('image/'):
+                 # Images are not parsed; the cache records type and size and counts repeats
+                 digest = digest_bytes(file_bytes)
+                 entry = attachment_cache.get(digest)
+                 if entry is None:
+                     entry = {"kind": "image", "mime_type": ftype, "bytes": len(file_bytes)}
+                     attachment_cache.put(digest, entry)
+                 # Pass full data uri to LLM
+                 url = b64_data if b64_data.startswith('data:') else f"data:{entry['mime_type']};base64,{encoded}"
+                 content_parts.append({
+                    "type": "image_url",
+                    "image_url": {"url": url}
+                 })
+            elif ftype == 'application/pdf' or ftype.startswith('text/'):
+                summary = document_store.ingest(user_id, fname, ftype, io.BytesIO(file_bytes))
+                chunks = document_store.relevant_chunks(user_id, [summary["doc_id"]], user_input)
+                content_parts.append({"type": "text", "text": format_document_context(summary, chunks)})
+        except Exception as e:
+            print(f"Error processing file: {e}")
+            content_parts.append({"type": "text", "text": f"[System: Failed to process attached file {fname}: {str(e)}]"})
+
+    # 3. Handle previously uploaded documents
+    if document_ids:
+        chunks = document_store.relevant_chunks(user_id, document_ids, user_input)
+        if chunks:
+            content_parts.append({"type": "text", "text": "\n\n[Excerpts from uploaded documents]\n" + format_excerpts(chunks)})
+
+    return content_parts
+
+def get_chat_user_id():
+    # Use authenticated user email if available
+    user_info = get_current_user_info()
+    return user_info.get('email') if user_info else "demo_user"
+
+def trace_requested():
+    """X-Trace: 1 or ?trace=1 asks for the per-stage timings of this request in the answer."""
+    return request.headers.get('X-Trace') == '1' or request.args.get('trace') == '1'
+
 @app.route('/chat', methods=['POST'])
 def chat_endpoint():
     try:
         data = request.json
         if not data:
             return jsonify({"error": "No input data provided"}), 400
-            
-        user_input = data.get("message", "")
-        file_data = data.get("file") # {name, type, data: base64}
-        
-        content_parts = []
-        
-        # 1. Handle User Text
-        if user_input:
-            content_parts.append({"type": "text", "text": user_input})
-            
-        # 2. Handle File Attachment
-        if file_data:
-            try:
-                fname = file_data.get('name', 'file')
-                ftype = file_data.get('type', '')
-                b64_data = file_data.get('data', '')
-                
-                # Strip header if present
-                if ',' in b64_data:
-                    header, encoded = b64_data.split(',', 1)
-                else:
-                    encoded = b64_data
-                    # Reconstruct header for OpenAI if missing but needed? 
-                    # Actually OpenAI image_url needs the data URI scheme usually e.g. "data:image/jpeg;base64,..."
-                    # If incoming data HAS header, we keep it for OpenAI URL, but strip it for decoding bytes.
-                
-                file_bytes = base64.b64decode(encoded)
-                
-                if ftype.startswith('image/'):
-                     # Pass full data uri to LLM
-                     content_parts.append({
-                        "type": "image_url",
-                        "image_url": {"url": b64_data}
-                     })
-                elif ftype == 'application/pdf':
-                    reader = PdfReader(io.BytesIO(file_bytes))
-                    pdf_text = ""
-                    for page in reader.pages:
-                        pdf_text += page.extract_text() + "\n"
-                    content_parts.append({"type": "text", "text": f"\n\n[Attached PDF: {fname}]\n{pdf_text}"})
-                elif ftype.startswith('text/'):
-                    text_content = file_bytes.decode('utf-8')
-                    content_parts.append({"type": "text", "text": f"\n\n[Attached File: {fname}]\n{text_content}"})
-            except Exception as e:
-                print(f"Error processing file: {e}")
-                content_parts.append({"type": "text", "text": f"[System: Failed to process attached file {fname}: {str(e)}]"})
 
-        if not content_parts:
-             return jsonify({"error": "Empty message"}), 400
+        traced = trace_requested()
+        with tracing(request="/chat", enabled=traced) as trace, span("request", "/chat"):
+            user_id = get_chat_user_id()
+            content_parts = build_content_parts(data, user_id)
 
-        # Use authenticated user email if available
-        user_info = get_current_user_info()
-        user_id = user_info.get('email') if user_info else "demo_user"
+            if not content_parts:
+                 return jsonify({"error": "Empty message"}), 400
+
+            response = agent.invoke(
+                {"messages": [HumanMessage(content=content_parts)], "user_id": user_id},
+                config={"configurable": {"thread_id": user_id}}
+            )
 
-        response = agent.invoke(
-            {"messages": [HumanMessage(content=content_parts)], "user_id": user_id},
-            config={"configurable": {"thread_id": user_id}}
-        )
-        
         last_msg = response["messages"][-1]
         response_text = last_msg.content
-        
-        return jsonify({
+
+        result = {
             "response": response_text,
             "user_id": user_id
-        })
+        }
+        if traced:
+            result["trace"] = trace.to_dict()
+        return jsonify(result)
+
+    except Exception as e:
+        print(f"Error processing request: {e}")
+        return jsonify({"error": str(e)}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream_endpoint():
+    """Same input as /chat, answered as Server-Sent Events while the graph runs."""
+    data = request.json
+    if not data:
+        return jsonify({"error": "No input data provided"}), 400
+
+    try:
+        user_id = get_chat_user_id()
+        content_parts = build_content_parts(data, user_id)
     except Exception as e:
         print(f"Error processing request: {e}")
         return jsonify({"error": str(e)}), 500
+    if not content_parts:
+        return jsonify({"error": "Empty message"}), 400
+
+    traced = trace_requested()
+
+    def generate():
+        with tracing(request="/chat/stream", enabled=traced) as trace:
+            done = None
+            try:
+                with span("request", "/chat/stream"):
+                    for event, payload in stream_agent_events(
+                        {"messages": [HumanMessage(content=content_parts)], "user_id": user_id},
+                        config={"configurable": {"thread_id": user_id}}
+                    ):
+                        if event == "done":
+                            # Held back so the trace, which needs the finished request span, goes first
+                            done = {**payload, "user_id": user_id}
+                            continue
+                        yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            except Exception as e:
+                print(f"Error streaming request: {e}")
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            if traced:
+                yield f"event: trace\ndata: {json.dumps(trace.to_dict())}\n\n"
+            if done is not None:
+                yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/documents', methods=['POST'])
+def upload_document():
+    """Multipart upload (field "file"), parsed page by page into the document store.
+
+    Returns the document id to pass as `document_ids` in later /chat requests.
+    """
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({"error": "No file uploaded"}), 400
+    mime_type = upload.mimetype
+    if mime_type in ('', 'application/octet-stream'):
+        mime_type = mimetypes.guess_type(upload.filename or '')[0] or ''
+    try:
+        summary = document_store.ingest(get_chat_user_id(), upload.filename or 'file', mime_type, upload.stream)
+    except DocumentTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        # Unsupported type, or a PDF pypdf cannot read (UnreadableDocument)
+        return jsonify({"error": str(e)}), 400
+    return jsonify(summary)
 
 @app.route('/logout')
 def logout():
+    user_id = current_user_id()
     session.clear()
-    if os.path.exists('token.json'):
-         os.remove('token.json')
+    if not user_id:
+        return jsonify({"message": "Logged out successfully"})
+    service_cache.invalidate(user_id)
+    identity_cache.pop(user_id)
+    delete_credentials(user_id)
+    if mailbox_index:
+        mailbox_index.forget(user_id)
+    if calendar_cache:
+        calendar_cache.forget(user_id)
+    calendar_zones.pop(user_id)
     return jsonify({"message": "Logged out successfully"})
 
 @app.route('/memory', methods=['GET'])
@@ -244,8 +429,114 @@ def get_memory():
         return jsonify({"memories": []})
         
     user_id = user_info.get('email')
-    memories = get_all_memories(user_id)
-    return jsonify({"memories": memories})
+
+    # Query params: limit, cursor, source, since/until (ISO 8601 or epoch), fields (comma separated).
+    # Without limit and cursor every memory is returned, as clients that do not paginate expect.
+    try:
+        cursor = request.args.get('cursor')
+        if 'limit' in request.args or cursor:
+            limit = max(1, min(int(request.args.get('limit', MEMORY_PAGE_DEFAULT)), MEMORY_PAGE_MAX))
+        else:
+            limit = None
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor))["offset"]) if cursor else 0
+        if offset < 0:
+            raise ValueError("cursor offset must not be negative")
+        since = parse_time_param(request.args.get('since'))
+        until = parse_time_param(request.args.get('until'))
+        fields = tuple(f for f in request.args.get('fields', ','.join(MEMORY_FIELDS)).split(',') if f)
+        if not fields or any(f not in MEMORY_FIELDS for f in fields):
+            raise ValueError(f"fields must be a subset of {','.join(MEMORY_FIELDS)}")
+    except Exception as e:
+        return jsonify({"error": f"Invalid memory query: {e}"}), 400
+    source = request.args.get('source')
+
+    try:
+        # The ETag changes whenever this user's stored memories change (or the query changes)
+        query_key = json.dumps([offset, limit, source, since, until, fields])
+        etag = hashlib.sha1(f"{memory_version(user_id)}|{query_key}".encode()).hexdigest()
+        if etag in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+        # Read one extra record to know whether another page exists. The first batch is read
+        # before the 200 goes out, so a failing store gets a proper error status.
+        memories = iter_memories(user_id, offset, None if limit is None else limit + 1, source, since, until, fields)
+        first_batch = list(itertools.islice(memories, MEMORY_PAGE_BATCH))
+    except Exception as e:
+        print(f"[ERROR] Memory listing failed: {e}")
+        return jsonify({"error": "Could not read memories"}), 500
+
+    def generate():
+        yield '{"memories": ['
+        count = 0
+        try:
+            for memory in itertools.chain(first_batch, memories):
+                if count == limit:
+                    next_cursor = base64.urlsafe_b64encode(json.dumps({"offset": offset + limit}).encode()).decode()
+                    yield f'], "next_cursor": "{next_cursor}"}}'
+                    return
+                yield (', ' if count else '') + json.dumps(memory)
+                count += 1
+        except Exception as e:
+            # The status is already sent; end with valid JSON that says the list is cut short
+            print(f"[ERROR] Memory listing failed after {count} records: {e}")
+            yield f'], "next_cursor": null, "error": {json.dumps("Could not read all memories")}}}'
+            return
+        yield '], "next_cursor": null}'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/json',
+        headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    )
+
+def parse_time_param(value):
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+@app.route('/stats', methods=['GET'])
+@login_required
+def get_stats():
+    return jsonify({
+        "identity_cache": identity_cache.stats(),
+        "credential_store": credential_store.stats(),
+        "memory_queue": memory_queue.stats(),
+        "memory_filter": memory_filter.stats() if memory_filter else None,
+        "memory_search": memory_index.stats() if is_loaded(memory_index) else None,
+        # Lazy components report None until something has used them
+        "embedding_cache": embedding_function.stats() if is_loaded(embedding_function) else None,
+        "attachment_cache": attachment_cache.stats() if is_loaded(attachment_cache) else None,
+        "checkpointer": checkpointer.stats() if is_loaded(checkpointer) else None,
+        "context_window": context_window.stats(),
+        "mailbox_index": mailbox_index.stats() if is_loaded(mailbox_index) else None,
+        "calendar_cache": calendar_cache.stats() if calendar_cache else None,
+        "llm_cache": {"agent": response_cache.stats(), "extraction": extraction_cache.stats()},
+        "components": component_status(),
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Stage latencies, LLM tokens and cache lookups of this process, in Prometheus text format."""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/warmup', methods=['POST'])
+@login_required
+def warmup():
+    """Builds the agent's lazy components (vector store, models, graph) so the next chat is fast.
+
+    Optional JSON {"components": [names]}; answers 503 when any of them fails. It needs
+    a sign-in token; unattended instances preload with AGENT_PRELOAD=1 instead.
+    """
+    names = (request.get_json(silent=True) or {}).get("components")
+    report = warm_up(names)
+    failed = any("error" in result for result in report.values())
+    return jsonify({"components": report}), 503 if failed else 200
+
+# AGENT_PRELOAD=1 builds the components in the background right after boot
+if os.getenv("AGENT_PRELOAD", "0") == "1":
+    threading.Thread(target=warm_up, name="agent-preload", daemon=True).start()
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
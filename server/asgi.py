@@ -0,0 +1,201 @@
+"""ASGI entry point: /chat and /chat/stream run on the event loop, every other route on the Flask app.
+
+    uvicorn asgi:application --port 5000
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:application
+
+The chat routes keep the JSON / SSE contract of application.py but drive the graph
+with ainvoke/astream, so a turn waiting on OpenAI holds no thread. Blocking work
+(Google API tools, identity lookups, document parsing, SQLite checkpoints) runs
+in a sized thread pool. Each user may have CHAT_USER_CONCURRENCY turns
+in flight, plus CHAT_USER_QUEUE waiting; beyond that requests get a 429.
+"""
+import asyncio
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from langchain_core.messages import HumanMessage
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import application as flask_app
+from lang.agent import agent, astream_agent_events
+from lang.telemetry import span, tracing
+
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "32"))
+CHAT_USER_CONCURRENCY = int(os.getenv("CHAT_USER_CONCURRENCY", "1"))
+CHAT_USER_QUEUE = int(os.getenv("CHAT_USER_QUEUE", "4"))
+
+
+class UserBusy(Exception):
+    pass
+
+
+class UserLimiter:
+    """Per-user cap on concurrent chat turns, with a short waiting line.
+
+    With the default of one turn per user, turns on the same thread never interleave
+    their checkpoints. Event-loop only, so no locking is needed.
+    """
+
+    def __init__(self, per_user=CHAT_USER_CONCURRENCY, max_waiting=CHAT_USER_QUEUE):
+        self.per_user = per_user
+        self.max_waiting = max_waiting
+        self._semaphores = {}
+        self._counts = defaultdict(int)
+        self.rejected = 0
+
+    def busy(self, user_id):
+        return self._counts[user_id] >= self.per_user + self.max_waiting
+
+    @asynccontextmanager
+    async def slot(self, user_id):
+        if self.busy(user_id):
+            self.rejected += 1
+            raise UserBusy(f"Too many requests in flight for {user_id}")
+        self._counts[user_id] += 1
+        semaphore = self._semaphores.setdefault(user_id, asyncio.Semaphore(self.per_user))
+        try:
+            async with semaphore:
+                yield
+        finally:
+            self._counts[user_id] -= 1
+            if not self._counts[user_id]:
+                del self._counts[user_id]
+                self._semaphores.pop(user_id, None)
+
+    def stats(self):
+        return {"users_active": len(self._counts), "in_flight": sum(self._counts.values()), "rejected": self.rejected}
+
+
+limiter = UserLimiter()
+
+
+async def resolve_user(request):
+    """The chat user id, from the bearer token or session cookie; the identity lookup may call Google, so it runs in the pool."""
+    headers = {name: request.headers[name] for name in ("authorization", "cookie") if name in request.headers}
+
+    def lookup():
+        with flask_app.app.test_request_context(headers=headers):
+            return flask_app.get_chat_user_id()
+    return await asyncio.to_thread(lookup)
+
+
+async def read_chat_request(request):
+    """Returns (user_id, content_parts) or an error response, mirroring the Flask /chat checks."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data:
+        return None, JSONResponse({"error": "No input data provided"}, status_code=400)
+    user_id = await resolve_user(request)
+    content_parts = await asyncio.to_thread(flask_app.build_content_parts, data, user_id)
+    if not content_parts:
+        return None, JSONResponse({"error": "Empty message"}, status_code=400)
+    return (user_id, content_parts), None
+
+
+def trace_requested(request):
+    return request.headers.get('x-trace') == '1' or request.query_params.get('trace') == '1'
+
+
+async def chat(request):
+    try:
+        traced = trace_requested(request)
+        with tracing(request="/chat", enabled=traced) as trace, span("request", "/chat"):
+            parsed, error = await read_chat_request(request)
+            if error:
+                return error
+            user_id, content_parts = parsed
+            async with limiter.slot(user_id):
+                response = await agent.ainvoke(
+                    {"messages": [HumanMessage(content=content_parts)], "user_id": user_id},
+                    config={"configurable": {"thread_id": user_id}}
+                )
+        result = {"response": response["messages"][-1].content, "user_id": user_id}
+        if traced:
+            result["trace"] = trace.to_dict()
+        return JSONResponse(result)
+    except UserBusy as e:
+        return JSONResponse({"error": str(e)}, status_code=429)
+    except Exception as e:
+        print(f"Error processing request: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def chat_stream(request):
+    # Errors before the stream starts still get a status code and a JSON body, like chat()
+    try:
+        parsed, error = await read_chat_request(request)
+    except Exception as e:
+        print(f"Error processing request: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+    if error:
+        return error
+    user_id, content_parts = parsed
+    if limiter.busy(user_id):
+        limiter.rejected += 1
+        return JSONResponse({"error": f"Too many requests in flight for {user_id}"}, status_code=429)
+
+    traced = trace_requested(request)
+
+    async def generate():
+        with tracing(request="/chat/stream", enabled=traced) as trace:
+            done = None
+            try:
+                with span("request", "/chat/stream"):
+                    async with limiter.slot(user_id):
+                        async for event, payload in astream_agent_events(
+                            {"messages": [HumanMessage(content=content_parts)], "user_id": user_id},
+                            config={"configurable": {"thread_id": user_id}}
+                        ):
+                            if event == "done":
+                                done = {**payload, "user_id": user_id}
+                                continue
+                            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            except Exception as e:
+                print(f"Error streaming request: {e}")
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            if traced:
+                yield f"event: trace\ndata: {json.dumps(trace.to_dict())}\n\n"
+            if done is not None:
+                yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # asyncio.to_thread and LangChain's sync tool fallback both use the loop's default executor
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(BLOCKING_WORKERS, thread_name_prefix="blocking")
+    )
+    yield
+
+
+chat_app = Starlette(
+    routes=[Route('/chat', chat, methods=['POST']), Route('/chat/stream', chat_stream, methods=['POST'])],
+    # Same policy as flask-cors with supports_credentials: reflect the caller's origin
+    middleware=[Middleware(CORSMiddleware, allow_origin_regex='.*', allow_credentials=True, allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+wsgi_app = WSGIMiddleware(flask_app.app)
+ASYNC_PATHS = {'/chat', '/chat/stream'}
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan" or scope.get("path") in ASYNC_PATHS:
+        await chat_app(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
@@ -0,0 +1,103 @@
+"""Peak memory and prompt size of PDF attachments: whole-text prompt vs chunked retrieval.
+
+Run from the server directory:  python -m bench.attachments --pages 10 100 300
+
+Uses generated PDFs, a deterministic fake embedder and a throwaway Chroma directory,
+so it runs offline. Peak memory is measured with tracemalloc (Python allocations).
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+
+import chromadb
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from lang.documents import DocumentStore, format_document_context
+
+WORDS = "budget meeting quarterly roadmap hiring vendor contract review launch metrics travel invoice".split()
+NEEDLE = "The project codename for the Lisbon offsite is BLUE HERON."
+
+
+def make_pdf(pages, lines_per_page=45, needle_page=None, seed=7):
+    """Builds a text PDF with Helvetica lines of random words (plus one needle sentence)."""
+    rng = random.Random(seed)
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for number in range(1, pages + 1):
+        page = writer.add_blank_page(612, 792)
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        if number == needle_page:
+            lines[lines_per_page // 2] = NEEDLE
+        content = DecodedStreamObject()
+        content.set_data(b"BT /F1 10 Tf 50 760 Td 14 TL " + b" ".join(f"({line}) '".encode() for line in lines) + b" ET")
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def legacy_prompt(b64_data):
+    """The pre-chunking /chat path: decode everything and concatenate every page."""
+    reader = PdfReader(io.BytesIO(base64.b64decode(b64_data)))
+    pdf_text = ""
+    for page in reader.pages:
+        pdf_text += page.extract_text() + "\n"
+    return f"\n\n[Attached PDF: bench.pdf]\n{pdf_text}"
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"seconds": round(elapsed, 3), "peak_mb": round(peak / 2**20, 2)}
+
+
+def run(page_counts):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DocumentStore(Chroma(
+            client=chromadb.PersistentClient(path=tmp),
+            collection_name="bench_documents",
+            embedding_function=DeterministicFakeEmbedding(size=256),
+        ))
+        for pages in page_counts:
+            pdf = make_pdf(pages, needle_page=max(1, pages // 2))
+            b64_data = base64.b64encode(pdf).decode()
+
+            prompt, legacy = measure(lambda: legacy_prompt(b64_data))
+            legacy["prompt_chars"] = len(prompt)
+
+            def chunked():
+                summary = store.ingest("bench", "bench.pdf", "application/pdf", io.BytesIO(base64.b64decode(b64_data)))
+                chunks = store.relevant_chunks("bench", [summary["doc_id"]], "What is the Lisbon offsite codename?")
+                return format_document_context(summary, chunks)
+
+            prompt, chunked_stats = measure(chunked)
+            chunked_stats["prompt_chars"] = len(prompt)
+            results.append({"pages": pages, "pdf_kb": len(pdf) // 1024, "legacy": legacy, "chunked": chunked_stats})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 300])
+    args = parser.parse_args()
+    print(json.dumps(run(args.pages), indent=2))
@@ -0,0 +1,154 @@
+"""Free/busy lookups answered by the calendar cache vs listing events live, plus a sync check.
+
+Run from the server directory:  python -m bench.calendar_cache --events 600 --latency 0.05
+
+A fake Calendar server holds `--events` one-hour meetings starting today. Random
+ranges are answered both from the cache (including the freshness check, which
+replays the sync token once `--fresh-seconds` have passed) and from a live `events.list`. The two answers must agree.
+Then the report checks that writes show up without re-listing, that
+a change made elsewhere arrives with one incremental sync, and that an expired
+sync token (410) leads to a full resync. The last section times IntervalIndex
+against a linear scan.
+"""
+import argparse
+import datetime
+import json
+import random
+import statistics
+import time
+
+from bench.fake_google import FakeCalendar
+from lang.calendar_cache import CalendarCache, IntervalIndex, free_busy
+
+USER = "bench@example.com"
+HOUR = 3600
+
+
+def live_events(service, low, high):
+    events, token = [], None
+    while True:
+        page = service.events().list(
+            calendarId='primary', singleEvents=True, orderBy='startTime', pageToken=token,
+            timeMin=datetime.datetime.utcfromtimestamp(low).isoformat() + 'Z',
+            timeMax=datetime.datetime.utcfromtimestamp(high).isoformat() + 'Z',
+        ).execute()
+        events.extend(page.get('items', []))
+        token = page.get('nextPageToken')
+        if not token:
+            return events
+
+
+def busy_ids(events, low, high):
+    busy, _ = free_busy(events, low, high)
+    return [[e["id"] for e in block[2]] for block in busy]
+
+
+def compare_ranges(cache, service, ranges):
+    cached_ms, live_ms, agree = [], [], 0
+    for low, high in ranges:
+        start = time.perf_counter()
+        local = cache.ensure_fresh(service, USER) and cache.events_between(USER, low, high)
+        cached_ms.append(1000 * (time.perf_counter() - start))
+        start = time.perf_counter()
+        live = live_events(service, low, high)
+        live_ms.append(1000 * (time.perf_counter() - start))
+        agree += busy_ids(local, low, high) == busy_ids(live, low, high)
+    return {
+        "ranges": len(ranges),
+        "cache_p50_ms": round(statistics.median(cached_ms), 2),
+        "live_p50_ms": round(statistics.median(live_ms), 2),
+        "answers_agree": agree,
+    }
+
+
+def index_vs_scan(count, queries):
+    rng = random.Random(7)
+    spans = [(i, start, start + rng.choice([0.5, 1, 2, 24]) * HOUR)
+             for i, start in enumerate(rng.uniform(0, 365 * 24 * HOUR) for _ in range(count))]
+    index = IntervalIndex()
+    for key, start, end in spans:
+        index.add(key, start, end)
+    windows = [(low, low + 8 * HOUR) for low in (rng.uniform(0, 365 * 24 * HOUR) for _ in range(queries))]
+    start = time.perf_counter()
+    indexed = [index.overlapping(low, high) for low, high in windows]
+    index_s = time.perf_counter() - start
+    start = time.perf_counter()
+    scanned = [[key for key, s, e in spans if s < high and e > low] for low, high in windows]
+    scan_s = time.perf_counter() - start
+    return {
+        "intervals": count,
+        "index_us_per_query": round(1e6 * index_s / queries, 1),
+        "scan_us_per_query": round(1e6 * scan_s / queries, 1),
+        "same_results": [sorted(a) for a in indexed] == [sorted(b) for b in scanned],
+    }
+
+
+def run(event_count, latency, queries, fresh_seconds):
+    today = datetime.datetime.now(datetime.timezone.utc).replace(hour=9, minute=0, second=0, microsecond=0)
+    fake = FakeCalendar(event_count=event_count, latency=latency, first_day=today).start()
+    cache = CalendarCache(fresh_seconds=fresh_seconds)
+    rng = random.Random(3)
+    report = {}
+    try:
+        service = fake.build_service()
+        fake.round_trips = 0
+        start = time.perf_counter()
+        cache.sync(service, USER)
+        report["full_sync"] = {"seconds": round(time.perf_counter() - start, 3), "round_trips": fake.round_trips}
+
+        now = time.time()
+        ranges = [(low, low + rng.choice([1, 4, 8, 24, 72]) * HOUR)
+                  for low in (now + rng.uniform(0, event_count / 3 * 24 * HOUR) for _ in range(queries))]
+        report["free_busy"] = compare_ranges(cache, service, ranges)
+
+        # Writes through the API, applied to the cache the way the agent tools do
+        slot = today + datetime.timedelta(days=1, hours=1)
+        created = service.events().insert(calendarId='primary', body={
+            "summary": "Focus time",
+            "start": {"dateTime": slot.isoformat()},
+            "end": {"dateTime": (slot + datetime.timedelta(hours=1)).isoformat()},
+        }).execute()
+        cache.apply(USER, created)
+        low, high = slot.timestamp(), slot.timestamp() + HOUR
+        seen_after_create = created["id"] in [e["id"] for e in cache.events_between(USER, low, high)]
+        service.events().delete(calendarId='primary', eventId=created["id"]).execute()
+        cache.remove(USER, created["id"])
+        gone_after_delete = created["id"] not in [e["id"] for e in cache.events_between(USER, low, high)]
+        report["write_through"] = {"seen_after_create": seen_after_create, "gone_after_delete": gone_after_delete}
+
+        # A change made in another client
+        elsewhere = fake.add_event("Dentist", slot, slot + datetime.timedelta(minutes=30))
+        fake.round_trips = 0
+        cache.sync(service, USER)
+        report["incremental_sync"] = {
+            "round_trips": fake.round_trips,
+            "change_arrived": elsewhere in [e["id"] for e in cache.events_between(USER, low, high)],
+        }
+
+        fake.cancel_event(elsewhere)
+        fake.expire_sync_tokens()
+        full_syncs = cache.full_syncs
+        cache.sync(service, USER)
+        report["expired_token"] = {
+            "resynced": cache.full_syncs == full_syncs + 1,
+            "cancelled_event_gone": elsewhere not in [e["id"] for e in cache.events_between(USER, low, high)],
+        }
+        report["stats"] = cache.stats()
+    finally:
+        fake.stop()
+    report["interval_index"] = index_vs_scan(10_000, 1_000)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=600)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per Calendar round trip")
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--fresh-seconds", type=float, default=60, help="0 replays the sync token on every lookup")
+    args = parser.parse_args()
+    print(json.dumps(run(args.events, args.latency, args.queries, args.fresh_seconds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
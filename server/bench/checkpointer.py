@@ -0,0 +1,82 @@
+"""Checkpoint write/read latency and on-disk size as a conversation grows.
+
+Run from the server directory:  python -m bench.checkpointer --turns 500
+
+Drives a one-node message graph (no LLM) for N turns against MemorySaver and the
+tiered SQLite saver, and reports per-turn invoke latency, cold get_state latency
+(hot tier bypassed) and database size at a few checkpoints along the way.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Annotated, List, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+
+from lang.checkpointer import TieredSqliteSaver
+
+
+class State(TypedDict):
+    messages: Annotated[List, add_messages]
+
+
+def build_graph(checkpointer):
+    workflow = StateGraph(State)
+    workflow.add_node("reply", lambda state: {"messages": [AIMessage(content="ok " * 60)]})
+    workflow.set_entry_point("reply")
+    workflow.add_edge("reply", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def run(saver, turns, marks):
+    graph = build_graph(saver)
+    config = {"configurable": {"thread_id": "bench"}}
+    rows, window = [], []
+    for turn in range(1, turns + 1):
+        start = time.perf_counter()
+        graph.invoke({"messages": [HumanMessage(content=f"turn {turn} " + "lorem ipsum " * 40)]}, config)
+        window.append(time.perf_counter() - start)
+        if turn in marks:
+            if isinstance(saver, TieredSqliteSaver):
+                saver._hot.clear()
+            start = time.perf_counter()
+            graph.get_state(config)
+            cold_read = time.perf_counter() - start
+            rows.append({
+                "turn": turn,
+                "invoke_ms_median": round(1000 * statistics.median(window), 3),
+                "cold_read_ms": round(1000 * cold_read, 3),
+            })
+            window = []
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--keep", type=int, default=20, help="checkpoints kept per thread")
+    args = parser.parse_args()
+    marks = {t for t in (10, 50, 100, 250, 500, 1000, 2000, 5000) if t <= args.turns} | {args.turns}
+
+    results = {"memory_saver": run(MemorySaver(), args.turns, marks)}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkpoints.sqlite3")
+        saver = TieredSqliteSaver.from_path(path, max_checkpoints=args.keep)
+        results["tiered_sqlite"] = run(saver, args.turns, marks)
+        results["tiered_sqlite_stats"] = saver.stats()
+        with saver.cursor(transaction=False) as cur:
+            cur.execute("SELECT COUNT(*) FROM checkpoints")
+            results["tiered_sqlite_stats"]["checkpoints_on_disk"] = cur.fetchone()[0]
+        saver.compact(vacuum=True)
+        results["tiered_sqlite_stats"]["db_kb_after_vacuum"] = os.path.getsize(path) // 1024
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Prompt size over a long synthetic thread, with and without the context window.
+
+Run from the server directory:  python -m bench.context_window --turns 1000
+
+Replays N turns (every third one a tool call plus its ToolMessage) through the same
+fold-and-remove cycle agent_node uses, with a fake summarizer. Every `--huge-every`th
+turn pastes a long document, and its tool result (if any) is just as long, so the
+current turn alone is over budget. The window is fitted on every hop, as agent_node
+does. It reports prompt tokens over time and exits non-zero if the prompt ever exceeds
+the window's bound or a ToolMessage reaches the prompt without the AIMessage that
+called it.
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, ToolMessage
+from langgraph.graph.message import add_messages
+
+from lang.context_window import ContextWindow, approx_tokens
+
+
+def fake_summarize(summary, transcript):
+    # Grows with input but is clipped by the window's summary_max_tokens
+    return (summary + " " + transcript[:400]).strip()
+
+
+def synthetic_turn(n, huge_every=50):
+    huge = huge_every and n % huge_every == 0
+    messages = [HumanMessage(content=f"Turn {n}: please look at " + "the quarterly roadmap and vendor contract " * 8)]
+    if huge:
+        messages[0].content += "\n" + "Clause 4.2: the vendor shall deliver on time. " * 1100  # ~50k chars
+    if n % 3 == 0:
+        call_id = f"call_{uuid.uuid4().hex[:8]}"
+        messages.append(AIMessage(content="", tool_calls=[{"id": call_id, "name": "read_inbox", "args": {"max_results": 5}}]))
+        messages.append(ToolMessage(content="Subject: invoice, From: vendor\n" * (1600 if huge else 30),
+                                    tool_call_id=call_id, name="read_inbox"))
+    messages.append(AIMessage(content="Here is what I found. " * 25))
+    return messages
+
+
+def pairs_intact(messages):
+    called = {call["id"] for m in messages if isinstance(m, AIMessage) for call in m.tool_calls}
+    return all(m.tool_call_id in called for m in messages if isinstance(m, ToolMessage))
+
+
+def run(turns, huge_every=50, **window_kwargs):
+    window = ContextWindow(fake_summarize, **window_kwargs)
+    bound = window.max_tokens + window.summary_max_tokens
+    state, summary, unbounded = [], "", 0
+    samples, violations, fits, fit_seconds = [], [], 0, 0.0
+    for n in range(1, turns + 1):
+        turn = synthetic_turn(n, huge_every)
+        # One agent hop per model call: after the question and after each tool result
+        hops = [i + 1 for i, m in enumerate(turn) if isinstance(m, (HumanMessage, ToolMessage))]
+        added = 0
+        for end in hops:
+            state = add_messages(state, turn[added:end])
+            unbounded += approx_tokens(turn[added:end])
+            added = end
+            start = time.perf_counter()
+            fitted = window.fit(state, summary)
+            fit_seconds += time.perf_counter() - start
+            fits += 1
+            prompt_tokens = approx_tokens(fitted.messages) + len(fitted.summary) // 4
+            if prompt_tokens > bound or not pairs_intact(fitted.messages):
+                violations.append(n)
+            if fitted.folded:
+                summary = fitted.summary
+                state = add_messages(state, [RemoveMessage(id=m.id) for m in fitted.folded])
+        state = add_messages(state, turn[added:])
+        if n in (1, 10, 100) or n % 250 == 0:
+            samples.append({"turn": n, "prompt_tokens": prompt_tokens, "unbounded_tokens": unbounded, "state_messages": len(state)})
+        unbounded += approx_tokens(turn[added:])
+    return {
+        "bound_tokens": bound,
+        "samples": samples,
+        "folds": window.folds,
+        "clipped_messages": window.clipped_messages,
+        "avg_fit_ms": round(1000 * fit_seconds / fits, 3),
+        "violations": sorted(set(violations))[:10],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--max-tokens", type=int, default=6000)
+    parser.add_argument("--keep-turns", type=int, default=6)
+    parser.add_argument("--huge-every", type=int, default=50, help="every Nth turn is over budget on its own; 0 to disable")
+    args = parser.parse_args()
+    result = run(args.turns, args.huge_every, max_tokens=args.max_tokens, keep_turns=args.keep_turns)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result["violations"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Credential lookups and token refreshes with the encrypted per-user store.
+
+Run from the server directory:  python -m bench.credentials --users 1000 --threads 32
+
+Everything runs in a temporary directory. The report has:
+- per-lookup latency: reading a token.json file (the old single-user path), a
+  store lookup that reads SQLite and decrypts, and a cached store lookup;
+- the time to save `--users` users and load them all back;
+- single-flight refresh: `--threads` threads ask GoogleServiceCache for the same
+  user whose token has expired. Google's token endpoint is replaced by a counter
+  that sleeps `--refresh-latency`, so the number of refreshes is visible (1 is
+  the goal). The same is repeated for `--threads` different users.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from google.oauth2.credentials import Credentials
+
+from lang.credential_store import CredentialStore
+import lang.google_clients as google_clients
+
+
+def make_credentials(n, expired=False):
+    expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=-1 if expired else 1)
+    return Credentials(
+        token=f"access-{n}", refresh_token=f"refresh-{n}", client_id="client.apps.googleusercontent.com",
+        client_secret="secret", token_uri="https://oauth2.googleapis.com/token", expiry=expiry,
+    )
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(1e6 * (time.perf_counter() - start))
+    return round(statistics.median(samples), 1)
+
+
+class FakeTokenEndpoint:
+    """Stands in for Credentials.refresh: counts calls and extends the expiry after `latency`."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, creds, request):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        creds.token = f"{creds.token}+"
+        creds.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+
+def concurrent_gets(cache, user_ids):
+    barrier = threading.Barrier(len(user_ids))
+    tokens = [None] * len(user_ids)
+
+    def worker(i):
+        barrier.wait()
+        services = cache.get(user_ids[i])
+        tokens[i] = services.creds.token if services else None
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(user_ids))]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return tokens, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--refresh-latency", type=float, default=0.2, help="seconds per token refresh")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_credentials_")
+    token_file = os.path.join(workdir, "token.json")
+    with open(token_file, "w") as f:
+        f.write(make_credentials(0).to_json())
+    store = CredentialStore(path=os.path.join(workdir, "credentials.sqlite3"), key_file=os.path.join(workdir, "key"))
+    store.save("user0@example.com", make_credentials(0))
+
+    def uncached():
+        store.forget_cached("user0@example.com")
+        store.load("user0@example.com")
+
+    report = {"lookup_us": {
+        "token_json_file": timed(lambda: Credentials.from_authorized_user_file(token_file), args.repeat),
+        "store_sqlite_decrypt": timed(uncached, args.repeat),
+        "store_cached": timed(lambda: store.load("user0@example.com"), args.repeat),
+    }}
+
+    start = time.perf_counter()
+    for n in range(args.users):
+        store.save(f"user{n}@example.com", make_credentials(n))
+    saved = time.perf_counter() - start
+    store.forget_cached()
+    start = time.perf_counter()
+    loaded = sum(store.load(f"user{n}@example.com").token == f"access-{n}" for n in range(args.users))
+    report["users"] = {
+        "count": args.users,
+        "save_ms_each": round(1000 * saved / args.users, 3),
+        "load_ms_each": round(1000 * (time.perf_counter() - start) / args.users, 3),
+        "loaded_correctly": loaded,
+    }
+
+    endpoint = FakeTokenEndpoint(args.refresh_latency)
+    Credentials.refresh = lambda creds, request: endpoint(creds, request)
+    google_clients.credential_store = store
+    refresh = {}
+    for label, user_ids in (("same_user", ["hot@example.com"] * args.threads),
+                            ("distinct_users", [f"cold{i}@example.com" for i in range(args.threads)])):
+        for user_id in set(user_ids):
+            store.save(user_id, make_credentials(user_id, expired=True))
+        before = endpoint.calls
+        tokens, seconds = concurrent_gets(google_clients.GoogleServiceCache(), user_ids)
+        refresh[label] = {
+            "requests": len(user_ids),
+            "refreshes": endpoint.calls - before,
+            "seconds": round(seconds, 3),
+            "all_got_fresh_token": all(t and t.endswith("+") for t in tokens),
+        }
+    report["refresh"] = refresh
+    report["store"] = store.stats()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""Offline end-to-end benchmark: the compiled graph and the Flask chat routes against fake backends.
+
+Run from the server directory:
+    python -m bench.e2e --output report.json
+    python -m bench.e2e --compare report.json --max-regression 0.2   # on the other branch
+
+Nothing leaves the machine. The chat model and memory extractor are the fakes of
+bench/fake_models.py with `--llm-latency`; embeddings are deterministic fakes of
+`--embedding-size` dimensions behind the real embedding cache; the tools talk to
+the local Gmail and Calendar servers of bench/fake_google.py with
+`--google-latency` per round trip. Chroma, checkpoints and caches live in a
+temporary directory.
+
+Phases:
+- graph: `--conversations` conversations of `--turns` turns through `agent.invoke`
+  on `--workers` threads. A conversation is one LangGraph thread whose turns run
+  in order. The turns cycle through small talk, inbox and calendar lookups (tool
+  calls) and "Remember that ..." messages (memory writes).
+- flask_chat: the same workload through POST /chat (Flask test client).
+- flask_stream: the same workload through POST /chat/stream, with time to first token.
+- chroma: one user's memories grow through `--memory-counts`. At each size it
+  times the raw Chroma query and the full retrieve_memory_from_db (BM25 plus
+  vector fusion). Inserting the 100k step takes minutes; --memory-counts
+  10,100,1000 keeps a run short.
+
+Each chat phase reports throughput, p50/p95/p99 turn latency, RSS and checkpoint
+database growth per conversation thread, and the time per pipeline stage from
+lang/telemetry.py. The report is one JSON document. With --compare the
+baseline's latencies and throughputs are set next to these. With
+--max-regression the script exits with 1 when a p95 grew, or a throughput fell,
+by more than that fraction.
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.chdir(tempfile.mkdtemp(prefix="bench_e2e_"))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+os.environ.setdefault("FLASK_SECRET_KEY", "bench-secret")
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import HumanMessage
+
+import application as flask_app
+import lang.agent as agent_module
+from bench.fake_google import FakeCalendar, FakeGmail
+from bench.fake_models import FakeChatModel, FakeExtractor
+from lang.lazy import resolve
+from lang.telemetry import STAGE_SECONDS
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCALE_USER = "bench-scale-user"
+TOPICS = ["roadmap", "budget", "hiring", "vendor", "offsite", "launch", "security", "design"]
+NAMES = ["Alice", "Bob", "Chen", "Dana", "Emeka", "Fatima", "Goran", "Hana"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+PHASES = ("graph", "flask_chat", "flask_stream")
+
+
+# ==========================================
+# Fakes
+# ==========================================
+
+def install_fakes(llm_latency, google_latency, embedding_size):
+    agent_module.llm = FakeChatModel(latency=llm_latency, cache=agent_module.response_cache)
+    agent_module.summarizer = FakeChatModel(latency=llm_latency)
+    agent_module.extractor = FakeExtractor(latency=llm_latency)
+    agent_module.embedding_function.underlying = DeterministicFakeEmbedding(size=embedding_size)
+
+    gmail = FakeGmail(message_count=50, latency=google_latency).start()
+    calendar = FakeCalendar(event_count=50, latency=google_latency).start()
+    services = (gmail.build_service(), calendar.build_service())
+    agent_module.get_services = lambda user_id=None: services
+    return gmail, calendar
+
+
+def message_for(conversation, turn):
+    topic = TOPICS[(conversation + turn) % len(TOPICS)]
+    kind = (conversation + turn) % 4
+    if kind == 0:
+        return f"Hi, can you help me prepare for the {topic} review?"
+    if kind == 1:
+        return "What is in my inbox?"
+    if kind == 2:
+        return f"Remember that I prefer {topic} meetings on {DAYS[turn % len(DAYS)]} mornings."
+    return "What is on my calendar this week?"
+
+
+# ==========================================
+# Measurements
+# ==========================================
+
+def percentiles(seconds):
+    ordered = sorted(seconds)
+    if not ordered:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {f"p{p}_ms": round(1000 * ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 2) for p in (50, 95, 99)}
+
+
+def rss_bytes():
+    """Resident set size now (Linux), else the peak RSS."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def checkpoint_bytes(prefix):
+    """Checkpoint and pending-write payload bytes stored for the threads starting with `prefix`.
+
+    Counted in SQLite rather than from the file size, which the WAL makes noisy;
+    history older than the checkpointer's per-thread cap is already pruned.
+    """
+    saver = resolve(agent_module.checkpointer)
+    pattern = prefix.replace("_", r"\_") + "%"
+    with saver.lock:
+        stored = saver.conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints WHERE thread_id LIKE ? ESCAPE '\\'",
+            (pattern,)).fetchone()[0]
+        writes = saver.conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes WHERE thread_id LIKE ? ESCAPE '\\'", (pattern,)).fetchone()[0]
+    return stored + writes
+
+
+def stage_split(before, after):
+    """{"stage:name": {count, mean_ms, total_s}} of the spans closed between two snapshots."""
+    split = {}
+    for labels, (count, total) in after.items():
+        count -= before.get(labels, (0, 0.0))[0]
+        total -= before.get(labels, (0, 0.0))[1]
+        if count:
+            split[":".join(labels)] = {"count": count, "mean_ms": round(1000 * total / count, 2), "total_s": round(total, 3)}
+    return dict(sorted(split.items(), key=lambda item: item[1]["total_s"], reverse=True))
+
+
+# ==========================================
+# Chat phases
+# ==========================================
+
+def graph_turn(user_id, message):
+    start = time.perf_counter()
+    agent_module.agent.invoke(
+        {"messages": [HumanMessage(content=message)], "user_id": user_id},
+        config={"configurable": {"thread_id": user_id}},
+    )
+    return {"seconds": time.perf_counter() - start, "ok": True}
+
+
+_flask_user = threading.local()
+
+
+def flask_turn(user_id, message):
+    _flask_user.id = user_id
+    start = time.perf_counter()
+    response = flask_app.app.test_client().post('/chat', json={"message": message})
+    return {"seconds": time.perf_counter() - start, "ok": response.status_code == 200}
+
+
+def flask_stream_turn(user_id, message):
+    _flask_user.id = user_id
+    start = time.perf_counter()
+    response = flask_app.app.test_client().post('/chat/stream', json={"message": message}, buffered=False)
+    first_token, done = None, False
+    try:
+        for chunk in response.response:
+            text = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if first_token is None and text.startswith("event: token"):
+                first_token = time.perf_counter() - start
+            done = done or text.startswith("event: done")
+    finally:
+        response.close()
+    return {"seconds": time.perf_counter() - start, "ok": response.status_code == 200 and done, "first_token": first_token}
+
+
+TURNS = {"graph": graph_turn, "flask_chat": flask_turn, "flask_stream": flask_stream_turn}
+
+
+def run_phase(phase, conversations, turns, workers):
+    turn_fn = TURNS[phase]
+    prefix = f"bench-{phase}-"
+
+    def conversation(c):
+        user_id = f"{prefix}{c}"
+        return [turn_fn(user_id, message_for(c, t)) for t in range(turns)]
+
+    gc.collect()
+    rss_before, stages_before = rss_bytes(), STAGE_SECONDS.snapshot()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        results = [r for turns_of_one in pool.map(conversation, range(conversations)) for r in turns_of_one]
+    elapsed = time.perf_counter() - start
+    # Extraction and memory writes run behind the turns; count what they cost too
+    agent_module.memory_queue.flush()
+    gc.collect()
+    rss_growth = rss_bytes() - rss_before
+
+    report = {
+        "turns": len(results),
+        "ok": sum(r["ok"] for r in results),
+        "seconds": round(elapsed, 2),
+        "throughput_tps": round(len(results) / elapsed, 2),
+        **percentiles([r["seconds"] for r in results]),
+        "rss_growth_bytes": rss_growth,
+        "rss_growth_per_thread_bytes": rss_growth // conversations,
+        "checkpoint_bytes_per_thread": checkpoint_bytes(prefix) // conversations,
+        "stages": stage_split(stages_before, STAGE_SECONDS.snapshot()),
+    }
+    if phase == "flask_stream":
+        report["first_token"] = percentiles([r["first_token"] for r in results if r["first_token"] is not None])
+    return report
+
+
+# ==========================================
+# Chroma scaling
+# ==========================================
+
+def synthetic_memory(i):
+    return (f"{NAMES[i % len(NAMES)]} prefers {TOPICS[(i // len(NAMES)) % len(TOPICS)]} updates "
+            f"on {DAYS[(i // 3) % len(DAYS)]}; reference {i:06d}.")
+
+
+def unit_vectors(rng, count, dim):
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def grow_memories(col, start, stop, dim, rng):
+    batch = min(5000, resolve(agent_module.chroma_client).get_max_batch_size())
+    now = datetime.datetime.now()
+    for low in range(start, stop, batch):
+        high = min(stop, low + batch)
+        ids = [f"{SCALE_USER}-{i}" for i in range(low, high)]
+        texts = [synthetic_memory(i) for i in range(low, high)]
+        col.add(
+            ids=ids,
+            embeddings=unit_vectors(rng, high - low, dim),
+            documents=texts,
+            metadatas=[{"user_id": SCALE_USER, "source": "bench", "timestamp": now.isoformat(), "ts": now.timestamp()}] * (high - low),
+        )
+        if agent_module.memory_index is not None:
+            for memory_id, text in zip(ids, texts):
+                agent_module.memory_index.add(SCALE_USER, memory_id, text)
+
+
+def run_chroma(counts, queries, dim, seed=7):
+    rng = np.random.default_rng(seed)
+    col = agent_module.memory_collection()
+    sizes, stored = [], 0
+    for count in sorted(counts):
+        start = time.perf_counter()
+        grow_memories(col, stored, count, dim, rng)
+        insert_seconds = time.perf_counter() - start
+        stored = count
+
+        raw, retrieve = [], []
+        for i, vector in enumerate(unit_vectors(rng, queries, dim)):
+            begin = time.perf_counter()
+            col.query(query_embeddings=[vector], n_results=5, where={"user_id": SCALE_USER})
+            raw.append(time.perf_counter() - begin)
+            question = f"What does the user prefer for {TOPICS[i % len(TOPICS)]} updates, query {i}?"
+            begin = time.perf_counter()
+            agent_module.retrieve_memory_from_db(SCALE_USER, question)
+            retrieve.append(time.perf_counter() - begin)
+        sizes.append({
+            "memories": count,
+            "insert_seconds": round(insert_seconds, 3),
+            "chroma_query": percentiles(raw),
+            "retrieve": percentiles(retrieve),
+        })
+        print(f"[bench] chroma at {count} memories: query p50 {sizes[-1]['chroma_query']['p50_ms']} ms", file=sys.stderr)
+    return {"dimensions": dim, "queries_per_size": queries, "sizes": sizes}
+
+
+# ==========================================
+# Report
+# ==========================================
+
+def environment():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = None
+    return {
+        "revision": revision or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "started": datetime.datetime.now().astimezone().isoformat(timespec="seconds"),
+    }
+
+
+def headline(report):
+    """{metric path: (value, higher is better)} of the figures compared across runs."""
+    figures = {}
+    for phase in PHASES:
+        if phase in report:
+            figures[f"{phase}.p95_ms"] = (report[phase]["p95_ms"], False)
+            figures[f"{phase}.throughput_tps"] = (report[phase]["throughput_tps"], True)
+    for size in report.get("chroma", {}).get("sizes", []):
+        figures[f"chroma.{size['memories']}.query_p95_ms"] = (size["chroma_query"]["p95_ms"], False)
+        figures[f"chroma.{size['memories']}.retrieve_p95_ms"] = (size["retrieve"]["p95_ms"], False)
+    return figures
+
+
+def compare(report, baseline, max_regression):
+    current, previous = headline(report), headline(baseline)
+    comparison, regressions = {}, []
+    for key, (value, higher_is_better) in current.items():
+        old = previous.get(key, (None, None))[0]
+        if not old or value is None:
+            continue
+        ratio = round(value / old, 3)
+        comparison[key] = {"baseline": old, "current": value, "ratio": ratio}
+        if max_regression is None:
+            continue
+        worse = ratio < 1 / (1 + max_regression) if higher_is_better else ratio > 1 + max_regression
+        if worse:
+            regressions.append(key)
+    return {"baseline_revision": baseline.get("environment", {}).get("revision"), "metrics": comparison, "regressions": regressions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=6, help="turns per conversation")
+    parser.add_argument("--workers", type=int, default=8, help="conversations in flight")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--google-latency", type=float, default=0.02)
+    parser.add_argument("--embedding-size", type=int, default=1536)
+    parser.add_argument("--memory-counts", default="10,100,1000,10000,100000", help="comma-separated; empty skips the chroma phase")
+    parser.add_argument("--queries", type=int, default=50, help="queries per memory count")
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=list(PHASES))
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="a report of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, help="with --compare: exit 1 past this fraction, e.g. 0.2")
+    args = parser.parse_args()
+
+    gmail, calendar = install_fakes(args.llm_latency, args.google_latency, args.embedding_size)
+    report = {"environment": environment(), "config": vars(args)}
+    try:
+        # The first turns build the graph, Chroma, SQLite and the Google clients, and the first
+        # worker threads grow the allocator; keep that out of the figures
+        with ThreadPoolExecutor(args.workers) as pool:
+            list(pool.map(lambda c: [graph_turn(f"bench-warmup-{c}", message_for(c, t)) for t in range(4)], range(args.workers)))
+        flask_app.get_chat_user_id = lambda: _flask_user.id
+        for phase in args.phases:
+            report[phase] = run_phase(phase, args.conversations, args.turns, args.workers)
+            print(f"[bench] {phase}: {report[phase]['throughput_tps']} turns/s, p95 {report[phase]['p95_ms']} ms", file=sys.stderr)
+        counts = [int(c) for c in args.memory_counts.split(",") if c.strip()]
+        if counts:
+            report["chroma"] = run_chroma(counts, args.queries, args.embedding_size)
+    finally:
+        gmail.stop()
+        calendar.stop()
+
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f), args.max_regression)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    failed = any(report[phase]["ok"] < report[phase]["turns"] for phase in args.phases)
+    sys.exit(1 if failed or report.get("comparison", {}).get("regressions") else 0)
+
+
+if __name__ == "__main__":
+    main()
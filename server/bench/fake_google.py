@@ -0,0 +1,339 @@
+"""Local stand-ins for the Gmail and Calendar REST APIs, built from the bundled discovery documents.
+
+FakeGmail serves `messages.list`, `messages.get`, `getProfile`, `history.list` and the
+`/batch` endpoint; FakeCalendar serves `events.list` (with sync tokens), `insert`
+and `delete`. Both listen over HTTP on 127.0.0.1, so the real googleapiclient request
+path (serialization, batching, response parsing) is exercised end to end with an
+injectable per-round-trip latency. `add_message`, `set_labels` and `delete_message`
+change the mailbox and append to the history feed like Gmail does; `add_event`
+and `cancel_event` change the calendar and advance its sync token.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+import urllib.parse
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import googleapiclient
+import httplib2
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+
+DISCOVERY_DIR = os.path.join(os.path.dirname(googleapiclient.__file__), 'discovery_cache', 'documents')
+MESSAGES_PATH = '/gmail/v1/users/me/messages'
+HISTORY_PATH = '/gmail/v1/users/me/history'
+PROFILE_PATH = '/gmail/v1/users/me/profile'
+CALENDAR_PATH = '/calendar/v3/calendars/primary'
+EVENTS_PATH = CALENDAR_PATH + '/events'
+BASE_INTERNAL_DATE = 1_700_000_000_000
+NOT_FOUND = {"error": {"code": 404, "message": "Requested entity was not found."}}
+
+
+class FakeGoogleApi:
+    """HTTP server plumbing shared by the fakes; subclasses implement `handle`."""
+    DISCOVERY = None
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self._server = None
+
+    def handle(self, method, path, body=None):
+        """Returns (status, body_dict) for a single API call."""
+        raise NotImplementedError
+
+    def handle_batch(self, content_type, body):
+        """Splits a multipart/mixed batch, answers every part, and re-wraps the responses."""
+        envelope = BytesParser(policy=policy.compat32).parsebytes(
+            b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body
+        )
+        boundary = "batch_fake_boundary"
+        parts = []
+        for part in envelope.get_payload():
+            request_line = part.get_payload().split('\n', 1)[0].strip()
+            method, path, _ = request_line.split(' ', 2)
+            status, payload = self.handle(method, path)
+            content_id = part['Content-ID'].replace('<', '<response-', 1)
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(payload)}\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+        return f"multipart/mixed; boundary={boundary}", "".join(parts).encode()
+
+    # ---- server lifecycle -------------------------------------------------
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _answer(self, method):
+                fake.round_trips += 1
+                time.sleep(fake.latency)
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if method == 'POST' and self.path.startswith('/batch'):
+                    content_type, payload = fake.handle_batch(self.headers['Content-Type'], body)
+                    self._reply(200, content_type, payload)
+                    return
+                status, payload = fake.handle(method, self.path, json.loads(body) if body else None)
+                self._reply(status, 'application/json', b'' if payload is None else json.dumps(payload).encode())
+
+            def do_GET(self):
+                self._answer('GET')
+
+            def do_POST(self):
+                self._answer('POST')
+
+            def do_DELETE(self):
+                self._answer('DELETE')
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def root_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/"
+
+    def build_service(self):
+        """Builds a real googleapiclient resource pointed at this fake.
+
+        Like lang/google_clients.py, every thread sends its requests over its own
+        httplib2.Http, so one service object may be shared across threads.
+        """
+        with open(os.path.join(DISCOVERY_DIR, self.DISCOVERY)) as f:
+            doc = json.load(f)
+        doc['rootUrl'] = self.root_url
+        doc['baseUrl'] = self.root_url + doc['servicePath']
+        local = threading.local()
+
+        def build_request(http, *args, **kwargs):
+            if not hasattr(local, "http"):
+                local.http = httplib2.Http()
+            return HttpRequest(local.http, *args, **kwargs)
+
+        return build_from_document(doc, http=httplib2.Http(), requestBuilder=build_request)
+
+
+class FakeGmail(FakeGoogleApi):
+    """In-memory mailbox that speaks the Gmail wire format."""
+    DISCOVERY = 'gmail.v1.json'
+
+    def __init__(self, message_count=100, latency=0.0, failing_ids=()):
+        super().__init__(latency)
+        self.failing_ids = set(failing_ids)
+        self.messages = {}
+        self.history_id = 1000
+        self.history = []  # [(history_id, record)] in Gmail's history.list format
+        self.oldest_history_id = self.history_id
+        for i in range(message_count):
+            self._put(f"msg{i:05d}", f"Subject {i}", f"sender{i % 7}@example.com", f"Snippet of message {i}", ["INBOX", "UNREAD"])
+
+    # ---- mailbox changes (recorded in the history feed) -------------------
+
+    def _put(self, msg_id, subject, sender, snippet, labels):
+        self.history_id += 1
+        self.messages[msg_id] = {
+            "id": msg_id,
+            "threadId": msg_id,
+            "labelIds": list(labels),
+            "snippet": snippet,
+            "historyId": str(self.history_id),
+            "internalDate": str(BASE_INTERNAL_DATE + 60_000 * self.history_id),
+            "payload": {"headers": [
+                {"name": "Subject", "value": subject},
+                {"name": "From", "value": sender},
+            ]},
+        }
+        return self.messages[msg_id]
+
+    def _record(self, kind, message, **extra):
+        ref = {"id": message["id"], "threadId": message["threadId"], "labelIds": list(message["labelIds"])}
+        self.history.append((self.history_id, {
+            "id": str(self.history_id),
+            "messages": [{"id": message["id"], "threadId": message["threadId"]}],
+            kind: [{"message": ref, **extra}],
+        }))
+
+    def add_message(self, subject, sender, snippet="", labels=("INBOX", "UNREAD")):
+        message = self._put(f"new{self.history_id + 1:06d}", subject, sender, snippet, labels)
+        self._record("messagesAdded", message)
+        return message["id"]
+
+    def set_labels(self, msg_id, add=(), remove=()):
+        message = self.messages[msg_id]
+        self.history_id += 1
+        message["labelIds"] = [label for label in message["labelIds"] if label not in remove] + [label for label in add if label not in message["labelIds"]]
+        message["historyId"] = str(self.history_id)
+        if add:
+            self._record("labelsAdded", message, labelIds=list(add))
+        if remove:
+            self._record("labelsRemoved", message, labelIds=list(remove))
+
+    def delete_message(self, msg_id):
+        message = self.messages.pop(msg_id)
+        self.history_id += 1
+        self._record("messagesDeleted", message)
+
+    def expire_history(self):
+        """Forgets the feed so far; an older startHistoryId now gets a 404, as after ~a week in Gmail."""
+        self.history = []
+        self.oldest_history_id = self.history_id
+
+    # ---- request handling -------------------------------------------------
+
+    def handle(self, method, path, body=None):
+        parsed = urllib.parse.urlparse(path)
+        params = urllib.parse.parse_qs(parsed.query)
+        if method == 'GET' and parsed.path == MESSAGES_PATH:
+            # Newest first, with label filtering, `from:` queries and page tokens
+            limit = int(params.get('maxResults', ['100'])[0])
+            offset = int(params.get('pageToken', ['0'])[0])
+            labels = set(params.get('labelIds', []))
+            query = params.get('q', [''])[0]
+            ids = [m["id"] for m in sorted(self.messages.values(), key=lambda m: int(m["internalDate"]), reverse=True)
+                   if labels <= set(m["labelIds"])
+                   and (not query.startswith('from:') or query[5:] in m["payload"]["headers"][1]["value"])]
+            page = ids[offset:offset + limit]
+            reply = {"messages": [{"id": i, "threadId": i} for i in page], "resultSizeEstimate": len(page)}
+            if offset + limit < len(ids):
+                reply["nextPageToken"] = str(offset + limit)
+            return 200, reply
+        if method == 'GET' and parsed.path == PROFILE_PATH:
+            return 200, {"emailAddress": "me@example.com", "messagesTotal": len(self.messages), "historyId": str(self.history_id)}
+        if method == 'GET' and parsed.path == HISTORY_PATH:
+            start = int(params['startHistoryId'][0])
+            if start < self.oldest_history_id:
+                return 404, NOT_FOUND
+            limit = int(params.get('maxResults', ['100'])[0])
+            offset = int(params.get('pageToken', ['0'])[0])
+            records = [record for history_id, record in self.history if history_id > start]
+            reply = {"history": records[offset:offset + limit], "historyId": str(self.history_id)}
+            if offset + limit < len(records):
+                reply["nextPageToken"] = str(offset + limit)
+            return 200, reply
+        if method == 'GET' and parsed.path.startswith(MESSAGES_PATH + '/'):
+            msg_id = urllib.parse.unquote(parsed.path.rsplit('/', 1)[1])
+            if msg_id in self.failing_ids or msg_id not in self.messages:
+                return 404, NOT_FOUND
+            message = dict(self.messages[msg_id])
+            if params.get('format', ['full'])[0] == 'metadata':
+                wanted = set(params.get('metadataHeaders', []))
+                message['payload'] = {"headers": [h for h in message['payload']['headers'] if h['name'] in wanted]}
+            return 200, message
+        return 404, {"error": {"code": 404, "message": f"No fake route for {method} {parsed.path}"}}
+
+
+def _rfc3339(value):
+    return value.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _parse_rfc3339(value):
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class FakeCalendar(FakeGoogleApi):
+    """In-memory primary calendar that speaks the Calendar wire format, sync tokens included."""
+    DISCOVERY = 'calendar.v3.json'
+
+    def __init__(self, event_count=100, latency=0.0, first_day=None, time_zone="UTC"):
+        super().__init__(latency)
+        self.time_zone = time_zone
+        self.sequence = 0
+        self.oldest_token = 0
+        self.events = {}  # id -> (sequence of last change, event)
+        first_day = first_day or datetime.datetime(2025, 1, 6, 9, tzinfo=datetime.timezone.utc)
+        for i in range(event_count):
+            # Three one-hour meetings a day, two hours apart
+            start = first_day + datetime.timedelta(days=i // 3, hours=2 * (i % 3))
+            self.add_event(f"Meeting {i}", start, start + datetime.timedelta(hours=1))
+
+    # ---- calendar changes (each one advances the sync token) ---------------
+
+    def _store(self, event):
+        self.sequence += 1
+        event["updated"] = _rfc3339(datetime.datetime.now(datetime.timezone.utc))
+        self.events[event["id"]] = (self.sequence, event)
+        return event
+
+    def add_event(self, summary, start, end, transparency="opaque"):
+        return self._store({
+            "id": f"evt{self.sequence + 1:06d}",
+            "status": "confirmed",
+            "summary": summary,
+            "transparency": transparency,
+            "start": {"dateTime": _rfc3339(start)},
+            "end": {"dateTime": _rfc3339(end)},
+        })["id"]
+
+    def cancel_event(self, event_id):
+        _, event = self.events[event_id]
+        self._store({"id": event_id, "status": "cancelled", "start": event["start"], "end": event["end"]})
+
+    def expire_sync_tokens(self):
+        """Invalidates every token issued so far; the next incremental sync gets a 410."""
+        self.oldest_token = self.sequence
+
+    # ---- request handling -------------------------------------------------
+
+    def handle(self, method, path, body=None):
+        parsed = urllib.parse.urlparse(path)
+        params = urllib.parse.parse_qs(parsed.query)
+        if method == 'GET' and parsed.path == EVENTS_PATH:
+            limit = int(params.get('maxResults', ['250'])[0])
+            offset = int(params.get('pageToken', ['0'])[0])
+            if 'syncToken' in params:
+                token = int(params['syncToken'][0])
+                if token < self.oldest_token:
+                    return 410, {"error": {"code": 410, "message": "Sync token is no longer valid, a full sync is required."}}
+                items = [event for seq, event in sorted(self.events.values(), key=lambda e: e[0]) if seq > token]
+            else:
+                low = _parse_rfc3339(params['timeMin'][0]) if 'timeMin' in params else None
+                high = _parse_rfc3339(params['timeMax'][0]) if 'timeMax' in params else None
+                items = sorted(
+                    (event for _, event in self.events.values() if event["status"] == "confirmed"
+                     and (low is None or _parse_rfc3339(event["end"]["dateTime"]) > low)
+                     and (high is None or _parse_rfc3339(event["start"]["dateTime"]) < high)),
+                    key=lambda event: event["start"]["dateTime"],
+                )
+            reply = {"kind": "calendar#events", "timeZone": self.time_zone, "items": items[offset:offset + limit]}
+            if offset + limit < len(items):
+                reply["nextPageToken"] = str(offset + limit)
+            else:
+                reply["nextSyncToken"] = str(self.sequence)
+            return 200, reply
+        if method == 'GET' and parsed.path == CALENDAR_PATH:
+            return 200, {"kind": "calendar#calendar", "id": "primary", "timeZone": self.time_zone}
+        if method == 'POST' and parsed.path == EVENTS_PATH:
+            start, end = _parse_rfc3339(body["start"]["dateTime"]), _parse_rfc3339(body["end"]["dateTime"])
+            event_id = self.add_event(body.get("summary", ""), start, end)
+            return 200, {**self.events[event_id][1], "htmlLink": f"{self.root_url}event?eid={event_id}"}
+        if method == 'DELETE' and parsed.path.startswith(EVENTS_PATH + '/'):
+            event_id = urllib.parse.unquote(parsed.path.rsplit('/', 1)[1])
+            if event_id not in self.events:
+                return 404, NOT_FOUND
+            if self.events[event_id][1]["status"] == "cancelled":
+                return 410, {"error": {"code": 410, "message": "Resource has been deleted"}}
+            self.cancel_event(event_id)
+            return 204, None
+        return 404, {"error": {"code": 404, "message": f"No fake route for {method} {parsed.path}"}}
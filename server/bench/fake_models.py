@@ -0,0 +1,116 @@
+"""Deterministic stand-ins for the OpenAI chat models, shared by the benchmarks.
+
+FakeChatModel plays the agent: after `latency` seconds it asks for read_inbox when
+the user mentions the inbox, for list_calendar_events when they mention the
+calendar, sums up a ToolMessage, and otherwise gives a fixed answer. FakeExtractor
+plays the memory extractor: "Remember ..." messages yield a fact, anything else
+"None". Both report usage_metadata (about four characters per token) so the token
+counters in /metrics move like they do against OpenAI. Streaming yields the answer
+word by word after the same latency, so /chat/stream sends token events. Tool call
+ids come from a counter, so two runs of the same workload send the same conversations.
+"""
+import asyncio
+import itertools
+import json
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_call_ids = itertools.count(1)
+
+
+def text_of(message):
+    content = message.content
+    if isinstance(content, list):
+        return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content or ""
+
+
+def with_usage(messages, answer):
+    prompt_chars = sum(len(text_of(m)) for m in messages)
+    output_chars = len(answer.content or "") + 20 * len(answer.tool_calls)
+    answer.usage_metadata = {
+        "input_tokens": prompt_chars // 4,
+        "output_tokens": max(1, output_chars // 4),
+        "total_tokens": prompt_chars // 4 + max(1, output_chars // 4),
+    }
+    return answer
+
+
+class _SleepyModel(BaseChatModel):
+    latency: float = 0.3
+
+    def _reply(self, messages):
+        raise NotImplementedError
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=with_usage(messages, self._reply(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=with_usage(messages, self._reply(messages)))])
+
+    def _chunks(self, messages):
+        answer = with_usage(messages, self._reply(messages))
+        pieces = re.findall(r"\S+\s*", answer.content) or [""]
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=piece,
+                tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": n}
+                    for n, call in enumerate(answer.tool_calls)
+                ] if last else [],
+                usage_metadata=answer.usage_metadata if last else None,
+            ))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class FakeChatModel(_SleepyModel):
+    """Answers after `latency` seconds, calling the inbox or calendar tool when asked about them."""
+
+    @property
+    def _llm_type(self):
+        return "fake-agent"
+
+    def _reply(self, messages):
+        last = messages[-1]
+        if isinstance(last, HumanMessage):
+            text = text_of(last).lower()
+            for keyword, tool_name in (("inbox", "read_inbox"), ("calendar", "list_calendar_events")):
+                if keyword in text:
+                    call = {"id": f"call_{next(_call_ids)}", "name": tool_name, "args": {"count": 5}}
+                    return AIMessage(content="", tool_calls=[call])
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"I found {text_of(last).count(chr(10)) + 1} items for you.")
+        return AIMessage(content="Noted, I will take care of it.")
+
+
+class FakeExtractor(_SleepyModel):
+    """Memory extractor: "Remember (that) X" gives a fact about X, everything else "None"."""
+
+    @property
+    def _llm_type(self):
+        return "fake-extractor"
+
+    def _reply(self, messages):
+        text = text_of(messages[-1]).strip()
+        match = re.match(r"remember(?: that)?\s+(.+)", text, re.IGNORECASE)
+        return AIMessage(content=f"The user said: {match.group(1)}" if match else "None")
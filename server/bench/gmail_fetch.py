@@ -0,0 +1,47 @@
+"""Compares serial per-message Gmail fetches with the batched metadata fetch.
+
+Run from the server directory:  python -m bench.gmail_fetch --count 25 --latency 0.05
+"""
+import argparse
+import json
+import time
+
+from bench.fake_google import FakeGmail
+from lang.gmail import fetch_message_metadata
+
+
+def fetch_serial(service, message_ids):
+    """The pre-batching code path: one full `messages().get()` per message."""
+    return [service.users().messages().get(userId='me', id=i).execute() for i in message_ids]
+
+
+def run(count, latency, repeat):
+    fake = FakeGmail(message_count=count, latency=latency, failing_ids={"msg00003"}).start()
+    try:
+        service = fake.build_service()
+        listing = service.users().messages().list(userId='me', maxResults=count).execute()
+        ids = [m['id'] for m in listing['messages'] if m['id'] != "msg00003"]
+        results = {}
+        for name, fn in (("serial", fetch_serial), ("batched", fetch_message_metadata)):
+            fake.round_trips = 0
+            start = time.perf_counter()
+            for _ in range(repeat):
+                fn(service, ids)
+            elapsed = (time.perf_counter() - start) / repeat
+            results[name] = {"seconds": round(elapsed, 4), "round_trips": fake.round_trips // repeat}
+
+        # Per-message failures must be reported without dropping the rest
+        fetched = fetch_message_metadata(service, ["msg00000", "msg00003", "msg00001"])
+        results["failures_reported"] = [msg_id for msg_id, _, error in fetched if error is not None]
+        return results
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per HTTP round trip")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps({"count": args.count, "latency": args.latency, **run(args.count, args.latency, args.repeat)}, indent=2))
@@ -0,0 +1,161 @@
+"""Model calls saved by ResponseCache on a memory-extraction workload, plus its safety rules.
+
+Run from the server directory:  python -m bench.llm_cache --messages 2000 --similarity 0.95 0.99
+
+The workload mimics what update_memory_node submits. Most messages come from a
+small pool of greetings, acknowledgements and recurring tool outputs; some are
+copies with different spacing or punctuation; the rest are unique. The model is
+a counting stand-in with `--latency` per call. Each cache mode runs the same
+sequence through the real extraction prompt and reports model calls, hit rate,
+wall time, and answers that differ from the uncached run. The semantic tier uses
+a bag-of-words embedding so that similar text embeds close together offline.
+The checks at the end confirm that a send_email call is never replayed, and
+that the same prompt with a different tool schema misses.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+
+from lang.llm_cache import ResponseCache
+
+REPEATED = [
+    "hi", "thanks!", "ok", "Good morning", "sounds good, thank you",
+    "From: alerts@bank.example | Subject: Your statement is ready | Snippet: Your monthly statement is available",
+    "From: noreply@github.com | Subject: [repo] CI passed | Snippet: All checks have passed",
+    "Event created: https://calendar.google.com/event?eid=abc",
+    "No unread messages found.",
+    "I prefer morning meetings",
+]
+
+
+class CountingModel(BaseChatModel):
+    """Answers after `latency` seconds, or with a fixed tool call when asked to; counts calls.
+
+    Notes get a fact quoting the note, everything else 'None', so a wrong replay is visible.
+    """
+    latency: float = 0.2
+    calls: int = 0
+    tool_call: str = ""
+
+    @property
+    def _llm_type(self):
+        return "counting-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[t.name for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.tool_call:
+            message = AIMessage(content="", tool_calls=[{"id": f"call_{self.calls}", "name": self.tool_call, "args": {}}])
+        else:
+            text = messages[-1].content
+            message = AIMessage(content=f"Remember: {text}" if text.startswith("Note") else "None")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class BagOfWords(Embeddings):
+    """Hashed word counts; texts sharing most words embed close together."""
+
+    def __init__(self, size=512):
+        self.size = size
+
+    def embed_query(self, text):
+        vector = np.zeros(self.size)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.size] += 1
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def workload(count, seed=11):
+    rng = random.Random(seed)
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.6:
+            yield rng.choice(REPEATED)
+        elif roll < 0.7:
+            text = rng.choice(REPEATED)
+            yield rng.choice([text.upper(), f"  {text}  ", text.replace(" ", "  "), text + "!!"])
+        else:
+            yield f"Note {i}: the {rng.choice(['budget', 'offsite', 'launch', 'hiring'])} review moved to day {rng.randint(1, 28)}"
+
+
+def extraction_prompt(content):
+    # Same messages as lang.agent.extraction_prompt (importing lang.agent would open the app's Chroma store)
+    instructions = "Extract important personal preferences, facts, or tasks from the user's text.\nReturn ONLY the fact/preference as a concise sentence. If nothing worth remembering, return 'None'."
+    return [SystemMessage(content=instructions), HumanMessage(content=content)]
+
+
+def run_mode(messages, cache, latency, expected=None):
+    model = CountingModel(latency=latency, cache=cache if cache is not None else False)
+    start = time.perf_counter()
+    answers = [model.invoke(extraction_prompt(content)).content for content in messages]
+    elapsed = time.perf_counter() - start
+    result = {"model_calls": model.calls, "seconds": round(elapsed, 2), "answers": answers}
+    if expected is not None:
+        result["wrong_answers"] = sum(a != b for a, b in zip(answers, expected))
+    if cache is not None:
+        result.update(cache.stats())
+        result["lookup_overhead_ms"] = round(1000 * (elapsed - model.calls * latency) / len(messages), 3)
+    return result
+
+
+def safety_checks():
+    @tool
+    def send_email(to: str):
+        """Stand-in."""
+
+    @tool
+    def read_inbox(count: int = 5):
+        """Stand-in."""
+
+    cache = ResponseCache(cacheable_tools={"read_inbox"})
+    writer = CountingModel(latency=0, tool_call="send_email", cache=cache).bind_tools([send_email, read_inbox])
+    writer.invoke("email bob"), writer.invoke("email bob")
+    reader = CountingModel(latency=0, tool_call="read_inbox", cache=cache)
+    reader.bind_tools([send_email, read_inbox]).invoke("check mail")
+    reader.bind_tools([send_email, read_inbox]).invoke("check mail")
+    reader.bind_tools([read_inbox]).invoke("check mail")
+    return {
+        "send_email_calls_replayed": 2 - writer.bound.calls,
+        "read_inbox_model_calls": reader.calls,  # 1 miss, 1 hit, 1 miss for the other tool schema
+        "not_cacheable": cache.not_cacheable,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds per model call")
+    parser.add_argument("--similarity", type=float, nargs="+", default=[0.95, 0.99])
+    args = parser.parse_args()
+
+    messages = list(workload(args.messages))
+    report = {"no_cache": run_mode(messages, None, args.latency)}
+    expected = report["no_cache"]["answers"]
+    report["exact"] = run_mode(messages, ResponseCache(max_entries=4096), args.latency, expected)
+    for threshold in args.similarity:
+        cache = ResponseCache(max_entries=4096, embeddings=BagOfWords(), similarity=threshold)
+        report[f"semantic_{threshold}"] = run_mode(messages, cache, args.latency, expected)
+    for result in report.values():
+        del result["answers"]
+    report["safety"] = safety_checks()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
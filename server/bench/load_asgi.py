@@ -0,0 +1,155 @@
+"""Chat throughput and tail latency: threaded WSGI (Flask) vs the async ASGI app.
+
+Run from the server directory:
+    python -m bench.load_asgi --requests 400 --concurrency 64 --threads 8 --llm-latency 1.0
+
+Everything slow is stubbed: the chat model sleeps `--llm-latency` per call, one in
+`--tool-every` turns reads the inbox from a local fake Gmail server that adds
+`--google-latency` per round trip, and embeddings are deterministic fakes. The
+WSGI run pushes the requests through `--threads` worker threads (like gunicorn
+--threads); the ASGI run sends them all at once through an in-process ASGI transport.
+State (Chroma, checkpoints, caches) goes to a temporary directory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.chdir(tempfile.mkdtemp(prefix="bench_load_"))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+os.environ.setdefault("FLASK_SECRET_KEY", "bench-secret")
+
+import httpx
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+
+import application as flask_app
+import asgi
+import lang.agent as agent_module
+from bench.fake_google import FakeGmail
+from bench.fake_models import FakeChatModel
+
+
+class NothingToRemember:
+    """Memory extractor stub: keeps the background queue busy without writing memories."""
+
+    def invoke(self, prompt):
+        return AIMessage(content="None")
+
+
+def install_stubs(llm_latency, google_latency):
+    agent_module.llm = FakeChatModel(latency=llm_latency)
+    agent_module.summarizer = FakeChatModel(latency=llm_latency)
+    agent_module.extractor = NothingToRemember()
+    agent_module.embedding_function.underlying = DeterministicFakeEmbedding(size=1536)
+
+    gmail = FakeGmail(message_count=50, latency=google_latency).start()
+    local = threading.local()
+
+    def get_services(user_id=None):
+        # httplib2 connections are not thread-safe; one fake client per thread
+        if not hasattr(local, "gmail"):
+            local.gmail = gmail.build_service()
+        return local.gmail, None
+
+    agent_module.get_services = get_services
+    return gmail
+
+
+def workload(total, users, tool_every):
+    for i in range(total):
+        message = "What is in my inbox?" if tool_every and i % tool_every == 0 else f"Remember item {i} for the offsite."
+        yield f"bench-user-{i % users}", {"message": message}
+
+
+def summarize(latencies, statuses, elapsed):
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return round(1000 * ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else None
+
+    return {
+        "requests": len(latencies),
+        "ok": statuses.count(200),
+        "rejected_429": statuses.count(429),
+        "errors": len(statuses) - statuses.count(200) - statuses.count(429),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": round(1000 * statistics.fmean(ordered), 1) if ordered else None,
+    }
+
+
+def run_wsgi(jobs, threads):
+    users = {}
+    flask_app.get_chat_user_id = lambda: users[threading.get_ident()]
+
+    def one(job):
+        user_id, body = job
+        users[threading.get_ident()] = user_id
+        start = time.perf_counter()
+        response = flask_app.app.test_client().post('/chat', json=body)
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(one, jobs))
+    return summarize([r[0] for r in results], [r[1] for r in results], time.perf_counter() - start)
+
+
+async def run_asgi(jobs, concurrency):
+    async def resolve_user(request):
+        return request.headers["x-bench-user"]
+
+    asgi.resolve_user = resolve_user
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(asgi.BLOCKING_WORKERS))
+    gate = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=asgi.application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(job):
+            user_id, body = job
+            async with gate:
+                start = time.perf_counter()
+                response = await client.post('/chat', json=body, headers={"x-bench-user": user_id})
+                return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(job) for job in jobs))
+    return summarize([r[0] for r in results], [r[1] for r in results], time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight on the ASGI run")
+    parser.add_argument("--threads", type=int, default=8, help="worker threads on the WSGI run")
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--tool-every", type=int, default=4, help="every Nth turn calls read_inbox (0 = never)")
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--google-latency", type=float, default=0.05)
+    parser.add_argument("--mode", choices=["both", "wsgi", "asgi"], default="both")
+    args = parser.parse_args()
+
+    gmail = install_stubs(args.llm_latency, args.google_latency)
+    jobs = list(workload(args.requests, args.users, args.tool_every))
+    results = {"config": vars(args)}
+    try:
+        if args.mode in ("both", "wsgi"):
+            results["wsgi"] = run_wsgi(jobs, args.threads)
+        if args.mode in ("both", "asgi"):
+            results["asgi"] = asyncio.run(run_asgi(jobs, args.concurrency))
+    finally:
+        gmail.stop()
+        agent_module.memory_queue.flush()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Mailbox lookups answered by the local index vs the live Gmail API, plus a sync check.
+
+Run from the server directory:  python -m bench.mailbox_index --messages 500 --latency 0.05
+
+A fake Gmail server holds `--messages` messages. After the initial full sync,
+every query is timed both through the index (including the freshness check) and
+through the live list + batched metadata path. Then the mailbox changes under the index:
+a message arrives, one is read, one is deleted, and one is moved to the trash.
+The report checks that one incremental sync brings the index in line with
+Gmail, and that an expired historyId falls back to a full resync.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from bench.fake_google import FakeGmail
+from lang.gmail import summarize_messages
+from lang.mailbox_index import MailboxIndex
+
+USER = "bench@example.com"
+QUERIES = ["in:inbox is:unread", "from:sender3@example.com", "subject:\"Subject 42\"", "is:unread after:2023/01/01",
+           "Snippet message", "from:sender1 -subject:foo"]
+
+
+def live(service, query, count):
+    listing = service.users().messages().list(userId='me', q=query, maxResults=count).execute()
+    return summarize_messages(service, listing.get('messages', []))
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, round(1000 * statistics.median(samples), 2)
+
+
+def matches(index, fake, count=5):
+    """Whether index and fake agree on the newest `count` unread inbox messages."""
+    local = index.search(USER, "in:inbox is:unread", count)
+    expected = sorted((m for m in fake.messages.values() if {"INBOX", "UNREAD"} <= set(m["labelIds"])),
+                      key=lambda m: int(m["internalDate"]), reverse=True)[:count]
+    return local is not None and [line.split(" | ")[1] for line in local] == [
+        f"Subject: {m['payload']['headers'][0]['value']}" for m in expected]
+
+
+def run(message_count, latency, repeat, count):
+    fake = FakeGmail(message_count=message_count, latency=latency).start()
+    index = MailboxIndex(path=os.path.join(tempfile.mkdtemp(prefix="bench_mailbox_"), "mailbox.sqlite3"),
+                         fresh_seconds=0)
+    report = {}
+    try:
+        service = fake.build_service()
+        fake.round_trips = 0
+        start = time.perf_counter()
+        index.sync(service, USER)
+        report["full_sync"] = {"seconds": round(time.perf_counter() - start, 3), "round_trips": fake.round_trips}
+
+        queries = {}
+        for query in QUERIES:
+            fake.round_trips = 0
+            local, local_ms = timed(lambda: index.ensure_fresh(service, USER) and index.search(USER, query, count), repeat)
+            round_trips = fake.round_trips // repeat
+            _, live_ms = timed(lambda: live(service, query, count), repeat)
+            queries[query] = {"answered_locally": bool(local), "index_ms": local_ms,
+                              "index_round_trips": round_trips, "live_ms": live_ms}
+        report["queries"] = queries
+
+        newest = max(fake.messages.values(), key=lambda m: int(m["internalDate"]))["id"]
+        oldest = min(fake.messages.values(), key=lambda m: int(m["internalDate"]))["id"]
+        fake.add_message("Quarterly plan", "boss@example.com", "Please review the plan")
+        fake.set_labels(newest, remove=["UNREAD"])
+        fake.delete_message(oldest)
+        second = sorted(fake.messages.values(), key=lambda m: int(m["internalDate"]))[-3]["id"]
+        fake.set_labels(second, add=["TRASH"], remove=["INBOX"])
+        fake.round_trips = 0
+        index.sync(service, USER)
+        report["incremental_sync"] = {
+            "round_trips": fake.round_trips,
+            "index_matches_gmail": matches(index, fake),
+            "new_message_found": bool(index.search(USER, "from:boss@example.com subject:plan", 1)),
+        }
+
+        fake.add_message("After expiry", "late@example.com", "Arrived after the feed expired")
+        fake.expire_history()
+        full_syncs = index.full_syncs
+        index.sync(service, USER)
+        report["expired_history"] = {
+            "resynced": index.full_syncs == full_syncs + 1,
+            "index_matches_gmail": matches(index, fake),
+        }
+        report["stats"] = index.stats()
+        return report
+    finally:
+        fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per Gmail round trip")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--count", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.messages, args.latency, args.repeat, args.count), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Offline evaluation of the memory pre-filter against labeled messages.
+
+Run from the server directory:
+    python -m bench.memory_filter --samples bench/memory_samples.jsonl --thresholds 0.3 0.5 0.7
+
+Each line of the samples file is {"kind": "human" | "tool", "text": ..., "label": 0 | 1},
+where label 1 means extraction should find something worth remembering. For each
+threshold (applied to both kinds, unless --tool-threshold is given) the report
+shows precision and recall of "send to extraction" and the share of extraction
+calls avoided. With --errors it also lists the misclassified samples with their
+scores and matched features. No network is used.
+"""
+import argparse
+import json
+import os
+
+from lang.memory_filter import MemoryFilter, features, score
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(__file__), "memory_samples.jsonl")
+
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(samples, threshold, tool_threshold):
+    memory_filter = MemoryFilter(threshold=threshold, tool_threshold=tool_threshold)
+    tp = fp = fn = tn = 0
+    errors = []
+    for sample in samples:
+        predicted = memory_filter.worth_extracting(sample["text"], sample["kind"])
+        actual = bool(sample["label"])
+        tp += predicted and actual
+        fp += predicted and not actual
+        fn += actual and not predicted
+        tn += not predicted and not actual
+        if predicted != actual:
+            errors.append({
+                "kind": sample["kind"],
+                "label": sample["label"],
+                "score": round(score(sample["text"], sample["kind"]), 3),
+                "features": [name for name, _ in features(sample["text"], sample["kind"])],
+                "text": sample["text"][:120],
+            })
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return {
+        "threshold": threshold,
+        "tool_threshold": tool_threshold,
+        "precision": round(precision, 3),
+        "recall": round(recall, 3),
+        "f1": round(2 * precision * recall / (precision + recall), 3) if precision + recall else 0.0,
+        "calls_avoided": round((tn + fn) / len(samples), 3),
+        "confusion": {"tp": tp, "fp": fp, "fn": fn, "tn": tn},
+    }, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.3, 0.4, 0.5, 0.6, 0.7])
+    parser.add_argument("--tool-threshold", type=float, default=None, help="defaults to each --thresholds value")
+    parser.add_argument("--errors", action="store_true", help="list misclassified samples")
+    args = parser.parse_args()
+
+    samples = load(args.samples)
+    report = {
+        "samples": len(samples),
+        "positives": sum(s["label"] for s in samples),
+        "by_kind": {kind: sum(1 for s in samples if s["kind"] == kind) for kind in sorted({s["kind"] for s in samples})},
+        "results": [],
+    }
+    for threshold in args.thresholds:
+        result, errors = evaluate(samples, threshold, args.tool_threshold if args.tool_threshold is not None else threshold)
+        if args.errors:
+            result["errors"] = errors
+        report["results"].append(result)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
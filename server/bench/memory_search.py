@@ -0,0 +1,182 @@
+"""Recall and latency of vector, BM25, hybrid and fast-path memory retrieval.
+
+Run from the server directory:  python -m bench.memory_search --memories 5000 --k 5
+
+Memories go into an in-memory Chroma collection through the same embedding
+interface the app uses. The embedding is offline: words of a few topics (diet,
+travel, family, ...) share a topic direction, and every other word, including
+names, emails and project codes, is hashed into the remaining dimensions, so
+paraphrases land close while rare entities are diluted like they are in real
+embeddings. Each query call waits `--embed-latency` seconds, standing in for the
+embeddings API. Entity queries ask for a name, an email address or a project
+code; topic queries paraphrase a stored fact without sharing its words.
+
+"hybrid" always fuses BM25 and vector rankings; "auto" is what
+lang.agent.retrieve_memory_from_db does: BM25 alone for entity queries it can
+answer, fusion otherwise. The report has recall@k per query kind, p50/p95
+latency per mode, the BM25 rebuild time from Chroma and the incremental add cost.
+"""
+import argparse
+import hashlib
+import json
+import random
+import statistics
+import time
+import uuid
+
+import chromadb
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+from lang.memory_search import MemorySearchIndex, is_entity_query, reciprocal_rank_fusion
+
+USER = "bench-user"
+TOPICS = {
+    "diet": "allergic allergy peanuts peanut vegetarian vegan food foods eat eating meal meals lunch dinner",
+    "travel": "flight flights fly flying trip trips travel traveling airport hotel seat seats aisle window",
+    "family": "daughter son wife husband kids family birthday mom dad sister brother",
+    "fitness": "gym run running workout workouts exercise yoga morning",
+    "music": "music song songs jazz guitar concert playlist listen",
+}
+# (fact, paraphrased query); each fact is stored once among the filler
+FACTS = [
+    ("User is allergic to peanuts", "which foods should I avoid eating"),
+    ("User prefers aisle seats on long flights", "how do I like to fly"),
+    ("User's daughter has her birthday in March", "when do we celebrate my kid"),
+    ("User goes running before work", "what is my workout routine"),
+    ("User listens to jazz while working", "what songs should I play"),
+    ("User is vegetarian", "what kind of meal should I order"),
+    ("User's husband picks the hotel for every trip", "who books travel in my family"),
+]
+FIRST = ["Priya", "Marcus", "Elena", "Tomasz", "Aiko", "Samir", "Grace", "Lucas", "Nadia", "Owen"]
+LAST = ["Kumar", "Hale", "Moreau", "Nowak", "Tanaka", "Haddad", "Okafor", "Silva", "Petrova", "Brennan"]
+FILLER = [
+    "{name} <{email}> is the contact for {code}",
+    "Review {code} with {name} on {day}",
+    "{name} from finance approved the {code} budget",
+    "Send the {code} status update to {email} every {day}",
+    "{name} said lunch on {day} works for the {code} kickoff",
+    "Flight booking for {code} is handled by {email}",
+]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+
+
+class TopicEmbeddings(Embeddings):
+    """Topic words share one direction each; other words are hashed. Queries cost `latency`."""
+
+    def __init__(self, size=256, latency=0.0):
+        self.size = size
+        self.latency = latency
+        self.topics = {word: i for i, words in enumerate(TOPICS.values()) for word in words.split()}
+
+    def _embed(self, text):
+        vector = np.zeros(self.size)
+        for word in text.lower().replace("'s", "").split():
+            word = word.strip("?.,!<>()")
+            if word in self.topics:
+                vector[self.topics[word]] += 3
+            vector[len(TOPICS) + int(hashlib.md5(word.encode()).hexdigest(), 16) % (self.size - len(TOPICS))] += 1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._embed(text)
+
+
+def corpus(count, seed=5):
+    """[(id, text)] and labeled queries [(kind, query, id)]."""
+    rng = random.Random(seed)
+    memories, queries = [], []
+    for i in range(count):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        fields = {
+            "name": f"{first} {last}",
+            "email": f"{first.lower()}.{last.lower()}{i}@example.com",
+            "code": f"PRJ-{1000 + i}",
+            "day": rng.choice(DAYS),
+        }
+        memory_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        memories.append((memory_id, rng.choice(FILLER).format(**fields)))
+        if i % max(1, count // 40) == 0:
+            queries.append(("entity", fields["code"], memory_id))
+            if fields["email"] in memories[-1][1]:
+                queries.append(("entity", fields["email"], memory_id))
+    for fact, query in FACTS:
+        memory_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        memories.insert(rng.randrange(len(memories)), (memory_id, fact))
+        queries.append(("topic", query, memory_id))
+    return memories, queries
+
+
+def retrieve(mode, db, index, embeddings, query, k):
+    """Ranked memory ids."""
+    lexical = [doc_id for doc_id, _ in index.search(USER, query, k)] if mode != "vector" else []
+    if mode == "lexical" or (mode == "auto" and lexical and is_entity_query(query)):
+        return lexical
+    docs = db.similarity_search_by_vector(embeddings.embed_query(query), k=k, filter={"user_id": USER})
+    vector = [doc.id for doc in docs]
+    return vector if mode == "vector" else reciprocal_rank_fusion(lexical, vector)[:k]
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--memories", type=int, default=5000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per query embedding")
+    args = parser.parse_args()
+
+    memories, queries = corpus(args.memories)
+    embeddings = TopicEmbeddings(latency=args.embed_latency)
+    client = chromadb.EphemeralClient()
+    db = Chroma(client=client, collection_name=f"bench_{uuid.uuid4().hex[:8]}", embedding_function=embeddings)
+    for start in range(0, len(memories), 1000):
+        batch = memories[start:start + 1000]
+        db.add_texts(texts=[text for _, text in batch], metadatas=[{"user_id": USER}] * len(batch), ids=[i for i, _ in batch])
+
+    index = MemorySearchIndex()
+    started = time.perf_counter()
+    index.rebuild(client.get_collection(db._collection.name))
+    rebuild_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    scratch = MemorySearchIndex()
+    for memory_id, text in memories:
+        scratch.add(USER, memory_id, text)
+    add_us = 1e6 * (time.perf_counter() - started) / len(memories)
+
+    report = {
+        "memories": len(memories),
+        "queries": {kind: sum(1 for q in queries if q[0] == kind) for kind in ("entity", "topic")},
+        "k": args.k,
+        "embed_latency_ms": args.embed_latency * 1000,
+        "rebuild_ms": round(1000 * rebuild_seconds, 1),
+        "incremental_add_us": round(add_us, 1),
+        "modes": {},
+    }
+    for mode in ("vector", "lexical", "hybrid", "auto"):
+        hits = {"entity": 0, "topic": 0}
+        latencies = []
+        for kind, query, expected in queries:
+            started = time.perf_counter()
+            ranking = retrieve(mode, db, index, embeddings, query, args.k)
+            latencies.append(1000 * (time.perf_counter() - started))
+            hits[kind] += expected in ranking
+        report["modes"][mode] = {
+            **{f"recall_{kind}": round(hits[kind] / report["queries"][kind], 3) for kind in hits},
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Import time and first-request latency of the app, to catch cold-start regressions.
+
+Run from the server directory:
+    python -m bench.startup --runs 3 [--ref HEAD~1] [--max-import-seconds 2.5]
+
+Each run is a fresh interpreter in an empty working directory, timing:
+`import lang.agent`, the rest of `import application`, the first /chat through
+the Flask test client, and a second /chat. A second set of runs calls
+lang.lazy.warm_up() (as /warmup does) before the first /chat.
+
+OpenAI is a local fake server (OPENAI_BASE_URL) that answers chat completions
+at once, so the timings are the app's own: imports, client construction, Chroma
+and SQLite setup, graph compilation. The embedder underneath the cache is
+swapped for a deterministic fake before the first request, because tiktoken
+would download its vocabulary. With --ref the same runs go against that git
+revision of server/ too, for a before/after comparison (cold only when that
+revision has no lang/lazy.py). --max-import-seconds makes the script exit with 1
+when the median import of application is slower.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUN = r"""
+import json, sys, time
+start = time.perf_counter()
+import lang.agent as agent_module
+agent_loaded = time.perf_counter()
+import application
+app_loaded = time.perf_counter()
+result = {"import_agent": agent_loaded - start, "import_application": app_loaded - start}
+if WARM:
+    from lang.lazy import warm_up
+    failed = [name for name, r in warm_up().items() if "error" in r]
+    if failed:
+        raise SystemExit(f"warm-up failed: {failed}")
+    result["warm_up"] = time.perf_counter() - app_loaded
+from langchain_core.embeddings import DeterministicFakeEmbedding
+client = application.app.test_client()
+for key in ("first_request", "second_request"):
+    begin = time.perf_counter()
+    if key == "first_request":
+        agent_module.embedding_function.underlying = DeterministicFakeEmbedding(size=1536)
+    response = client.post("/chat", json={"message": "hello"})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    result[key] = time.perf_counter() - begin
+print("RESULT " + json.dumps(result))
+"""
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "Hello!"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def export_ref(ref):
+    """Extracts server/ at a git revision into a temporary directory."""
+    target = tempfile.mkdtemp(prefix="bench_startup_ref_")
+    archive = subprocess.run(["git", "archive", ref, "."], cwd=SERVER_DIR, check=True, capture_output=True).stdout
+    subprocess.run(["tar", "-x", "-C", target], input=archive, check=True)
+    return target
+
+
+def measure(code_dir, warm, base_url):
+    env = {**os.environ, "PYTHONPATH": code_dir, "OPENAI_API_KEY": "sk-bench", "OPENAI_BASE_URL": base_url,
+           "FLASK_SECRET_KEY": "bench-secret"}
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    proc = subprocess.run([sys.executable, "-c", f"WARM = {warm}\n{RUN}"], cwd=workdir, env=env,
+                          capture_output=True, text=True, timeout=300)
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"run failed in {code_dir}:\n{proc.stderr[-2000:]}")
+
+
+def summarize(code_dir, runs, base_url):
+    report = {}
+    # Revisions before lang/lazy.py build everything at import; there is nothing to warm
+    modes = (("cold", False), ("warmed", True)) if os.path.exists(os.path.join(code_dir, "lang", "lazy.py")) else (("cold", False),)
+    for label, warm in modes:
+        results = [measure(code_dir, warm, base_url) for _ in range(runs)]
+        report[label] = {key: round(statistics.median(r[key] for r in results), 3) for key in results[0]}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--ref", help="also measure this git revision, e.g. HEAD~1")
+    parser.add_argument("--max-import-seconds", type=float, help="exit 1 when the median import of application is slower")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    report = {"runs": args.runs, "seconds": {"working_tree": summarize(SERVER_DIR, args.runs, base_url)}}
+    if args.ref:
+        report["seconds"][args.ref] = summarize(export_ref(args.ref), args.runs, base_url)
+    server.shutdown()
+    print(json.dumps(report, indent=2))
+    if args.max_import_seconds is not None:
+        imported = report["seconds"]["working_tree"]["cold"]["import_application"]
+        if imported > args.max_import_seconds:
+            print(f"import of application took {imported}s, limit {args.max_import_seconds}s", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Cost of the telemetry spans, and the time to render /metrics.
+
+Run from the server directory:  python -m bench.telemetry --spans 100000
+
+Times an empty block, the same block inside span() with no trace, and inside
+span() while a request trace is collecting, and reports the added cost per span.
+A chat turn opens about a dozen spans, so the per-span figure times twelve is
+the per-request overhead. Then it fills the registry with --series label sets
+per metric and times render(), which is what every Prometheus scrape pays.
+"""
+import argparse
+import json
+import time
+
+from lang import telemetry
+from lang.telemetry import count_cache, render, span, tracing
+
+
+def per_call_us(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return 1e6 * (time.perf_counter() - start) / n
+
+
+def bare():
+    pass
+
+
+def spanned():
+    with span("bench", "block"):
+        pass
+
+
+def run(spans, series):
+    baseline = per_call_us(bare, spans)
+    untraced = per_call_us(spanned, spans)
+    # A real trace holds one request; restart it so the list does not grow unboundedly
+    traced_total, rounds = 0.0, max(1, spans // 1000)
+    for _ in range(rounds):
+        with tracing(request="bench"):
+            traced_total += per_call_us(spanned, 1000)
+    traced = traced_total / rounds
+
+    for i in range(series):
+        telemetry.STAGE_SECONDS.observe(0.01 * (i % 50), "bench", f"series-{i}")
+        count_cache(f"cache-{i}", "hit")
+    start = time.perf_counter()
+    payload = render()
+    render_ms = 1000 * (time.perf_counter() - start)
+
+    return {
+        "spans": spans,
+        "us_per_call": {"bare": round(baseline, 3), "span": round(untraced, 3), "span_traced": round(traced, 3)},
+        "span_overhead_us": round(untraced - baseline, 3),
+        "traced_span_overhead_us": round(traced - baseline, 3),
+        "render": {"series": series, "lines": payload.count("\n"), "bytes": len(payload), "ms": round(render_ms, 2)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spans", type=int, default=100000)
+    parser.add_argument("--series", type=int, default=200, help="label sets per metric before timing render()")
+    args = parser.parse_args()
+    print(json.dumps(run(args.spans, args.series), indent=2))
+
+
+if __name__ == "__main__":
+    main()
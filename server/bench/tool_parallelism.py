@@ -0,0 +1,107 @@
+"""Wall time of the tools stage for multi-tool turns: one call at a time vs ScheduledToolNode.
+
+Run from the server directory:  python -m bench.tool_parallelism
+
+Tools are stand-ins with the real names that sleep for a fixed time and log when
+they start and finish. Each scenario runs through a one-node graph, sync and async,
+and reports wall time, the serial sum, the slowest single call, and the start
+order of the write tools. The last scenario sets one tool's timeout below its latency.
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from typing import Annotated, List, TypedDict
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
+
+from lang.tool_scheduler import ScheduledToolNode
+
+LATENCY = {"read_inbox": 0.3, "search_emails": 0.2, "list_calendar_events": 0.5,
+           "send_email": 0.25, "create_calendar_event": 0.25, "delete_calendar_event": 0.1}
+READ_ONLY = {"read_inbox", "search_emails", "list_calendar_events"}
+log, log_lock = [], threading.Lock()
+
+
+def stand_in(name):
+    def run(**kwargs):
+        with log_lock:
+            log.append(("start", name, time.perf_counter()))
+        time.sleep(LATENCY[name])
+        with log_lock:
+            log.append(("end", name, time.perf_counter()))
+        return f"{name} done"
+    run.__name__ = name
+    run.__doc__ = f"Stand-in for {name}."
+    return tool(run)
+
+
+TOOLS = [stand_in(name) for name in LATENCY]
+
+SCENARIOS = {
+    "three_reads": ["read_inbox", "list_calendar_events", "search_emails"],
+    "read_write_read": ["read_inbox", "send_email", "list_calendar_events", "search_emails"],
+    "two_writes_in_order": ["create_calendar_event", "delete_calendar_event", "read_inbox"],
+}
+
+
+class State(TypedDict):
+    messages: Annotated[List, add_messages]
+
+
+def build_graph(node):
+    workflow = StateGraph(State)
+    workflow.add_node("tools", node)
+    workflow.set_entry_point("tools")
+    workflow.add_edge("tools", END)
+    return workflow.compile()
+
+
+def tool_message(names):
+    return AIMessage(content="", tool_calls=[{"id": f"call_{i}", "name": n, "args": {}} for i, n in enumerate(names)])
+
+
+def measure(graph, names, use_async):
+    log.clear()
+    inputs = {"messages": [tool_message(names)]}
+    start = time.perf_counter()
+    result = asyncio.run(graph.ainvoke(inputs)) if use_async else graph.invoke(inputs)
+    wall = time.perf_counter() - start
+    writes = [name for event, name, _ in sorted(log, key=lambda e: e[2]) if event == "start" and name not in READ_ONLY]
+    return {
+        "wall_s": round(wall, 3),
+        "serial_sum_s": round(sum(LATENCY[n] for n in names), 3),
+        "slowest_call_s": max(LATENCY[n] for n in names),
+        "write_start_order": writes,
+        "results": [m.content for m in result["messages"][1:]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    scheduled = build_graph(ScheduledToolNode(TOOLS, read_only=READ_ONLY, max_workers=args.workers))
+    serial = build_graph(ScheduledToolNode(TOOLS, read_only=READ_ONLY, max_workers=1))
+    report = {}
+    for name, calls in SCENARIOS.items():
+        report[name] = {
+            "serial": measure(serial, calls, use_async=False),
+            "scheduled_sync": measure(scheduled, calls, use_async=False),
+            "scheduled_async": measure(scheduled, calls, use_async=True),
+        }
+    timeout_graph = build_graph(ScheduledToolNode(TOOLS, read_only=READ_ONLY, timeouts={"list_calendar_events": 0.1}))
+    report["timeout"] = {
+        "sync": measure(timeout_graph, SCENARIOS["three_reads"], use_async=False),
+        "async": measure(timeout_graph, SCENARIOS["three_reads"], use_async=True),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import asyncio
 import base64
 import datetime
 import uuid
@@ -6,23 +7,36 @@ from typing import TypedDict, List, Annotated
 from email.message import EmailMessage
 
 from dotenv import load_dotenv
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 
-from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage, AIMessage
+from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage, AIMessage, AIMessageChunk, RemoveMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import MemorySaver
-
-# ChromaDB imports
-import chromadb
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from langgraph.config import get_stream_writer
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.prebuilt import InjectedState
+
+from lang.attachment_cache import AttachmentCache
+from lang.cache import LRUCache
+from lang.calendar_cache import CalendarCache, format_event, free_busy, parse_time, primary_timezone
+from lang.checkpointer import TieredSqliteSaver
+from lang.context_window import ContextWindow, summary_prompt
+from lang.documents import DocumentStore
+from lang.embeddings import CachedEmbeddings, SQLiteEmbeddingStore
+from lang.llm_cache import ResponseCache
+from lang.gmail import summarize_messages
+from lang.google_clients import DEFAULT_USER, service_cache
+from lang.lazy import is_loaded, lazy, resolve
+from lang.memory_compaction import MEMORY_DEDUP_THRESHOLD, cosine_similarity
+from lang.mailbox_index import MailboxIndex
+from lang.memory_filter import MemoryFilter
+from lang.memory_queue import MemoryWorkQueue
+from lang.memory_search import MemorySearchIndex, is_entity_query, reciprocal_rank_fusion
+from lang.memory_versions import MemoryVersions
+from lang.telemetry import count_tokens, span, timed
+from lang.tool_scheduler import ScheduledToolNode
 
 load_dotenv(override=True)
 
@@ -33,20 +47,61 @@ print(f"[DEBUG] Loaded API Key: {api_key[:20]}..." if api_key else "[DEBUG] No A
 # ==========================================
 # 0. PERSISTENCE SETUP (ChromaDB)
 # ==========================================
+# Clients, stores and models below are lazy (see lang/lazy.py): importing this module
+# opens nothing, and chromadb / langchain_openai are imported by the first use.
 # Initialize ChromaDB in persistence directory
 PERSIST_DIRECTORY = os.path.join(os.getcwd(), "db")
-chroma_client = chromadb.PersistentClient(path=PERSIST_DIRECTORY)
 
-# Initialize Embedding Function (OpenAI)
-embedding_function = OpenAIEmbeddings(model="text-embedding-3-small", api_key=api_key)
+def _chroma_client():
+    import chromadb
+    return chromadb.PersistentClient(path=PERSIST_DIRECTORY)
+
+chroma_client = lazy("chroma_client", _chroma_client)
+
+# Initialize Embedding Function (OpenAI), behind a content-hash cache persisted next to the app
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.getcwd(), "cache", "embeddings.sqlite3"))
+
+def _embedding_function():
+    from langchain_openai import OpenAIEmbeddings
+    return CachedEmbeddings(
+        OpenAIEmbeddings(model=EMBEDDING_MODEL, api_key=api_key),
+        namespace=EMBEDDING_MODEL,
+        max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+        store=SQLiteEmbeddingStore(EMBEDDING_CACHE_PATH) if EMBEDDING_CACHE_PATH else None,
+    )
+
+embedding_function = lazy("embedding_function", _embedding_function)
+
+def _vector_store(name: str):
+    from langchain_chroma import Chroma
+    return Chroma(client=resolve(chroma_client), collection_name=name, embedding_function=resolve(embedding_function))
 
 # Create or Get Collection
 collection_name = "user_memory"
-db = Chroma(
-    client=chroma_client,
-    collection_name=collection_name,
-    embedding_function=embedding_function,
-)
+db = lazy("db", lambda: _vector_store(collection_name))
+
+# Chunked attachments (PDF / text), kept apart from the memory collection.
+# Parsed attachments are cached on disk by content hash.
+attachment_cache = lazy("attachment_cache", AttachmentCache)
+document_store = lazy("document_store", lambda: DocumentStore(_vector_store("user_documents"), cache=resolve(attachment_cache)))
+
+def memory_collection():
+    """The raw Chroma collection behind `db`; building `db` creates it on a fresh install."""
+    resolve(db)
+    return chroma_client.get_collection(collection_name)
+
+# Per-user stamps that change with every memory write, shared by workers and compaction
+memory_versions = lazy("memory_versions", MemoryVersions)
+
+def _memory_index():
+    index = MemorySearchIndex()
+    index.rebuild(memory_collection())
+    return index
+
+# BM25 postings of the memory texts, fused with vector search and loaded from Chroma when
+# first used (at startup with AGENT_PRELOAD=1 or /warmup); MEMORY_LEXICAL=0 turns it off
+memory_index = lazy("memory_index", _memory_index) if os.getenv("MEMORY_LEXICAL", "1") != "0" else None
 
 # ==========================================
 # 1. STATE & MEMORY FUNCTIONS
@@ -56,48 +111,166 @@ class AgentState(TypedDict):
     messages: Annotated[list, add_messages]
     user_id: str
     memory: List[str]
+    summary: str
 
 def store_memory_to_db(user_id: str, content: str, source: str = "chat"):
     """Stores a memory snippet into ChromaDB."""
-    memory_id = str(uuid.uuid4())
-    db.add_texts(
-        texts=[content],
-        metadatas=[{"user_id": user_id, "source": source, "timestamp": datetime.datetime.now().isoformat()}],
-        ids=[memory_id]
-    )
-    print(f"[Memory] Stored: {content}")
+    store_memories_to_db([(user_id, content, source)])
+
+def filter_new_memories(items: list):
+    """Drops snippets that nearly duplicate a stored memory of the same user, or each other."""
+    vectors = embedding_function.embed_documents([content for _, content, _ in items])
+    col = memory_collection()
+    kept, kept_vectors = [], []
+    for item, vector in zip(items, vectors):
+        user_id, content, _ = item
+        if any(other[0] == user_id and cosine_similarity(vector, v) >= MEMORY_DEDUP_THRESHOLD for other, v in zip(kept, kept_vectors)):
+            print(f"[Memory] Skipped near-duplicate: {content}")
+            continue
+        try:
+            with span("chroma", "dedup_query"):
+                nearest = col.query(query_embeddings=[vector], n_results=1, where={"user_id": user_id}, include=["embeddings"])
+            if len(nearest["embeddings"][0]) and cosine_similarity(vector, nearest["embeddings"][0][0]) >= MEMORY_DEDUP_THRESHOLD:
+                print(f"[Memory] Skipped near-duplicate: {content}")
+                continue
+        except Exception as e:
+            print(f"[ERROR] Duplicate check failed: {e}")
+        kept.append(item)
+        kept_vectors.append(vector)
+    return kept
+
+def store_memories_to_db(items: list):
+    """Stores many (user_id, content, source) snippets with a single embedding request."""
+    if MEMORY_DEDUP_THRESHOLD < 1:
+        items = filter_new_memories(items)
+    if not items: return
+    now = datetime.datetime.now()
+    ids = [str(uuid.uuid4()) for _ in items]
+    # "ts" (epoch seconds) lets /memory filter by time range inside Chroma
+    with span("chroma", "memory_add", memories=len(items)):
+        db.add_texts(
+            texts=[content for _, content, _ in items],
+            metadatas=[{"user_id": user_id, "source": source, "timestamp": now.isoformat(), "ts": now.timestamp()} for user_id, _, source in items],
+            ids=ids
+        )
+    memory_versions.bump(user_id for user_id, _, _ in items)
+    for memory_id, (user_id, content, _) in zip(ids, items):
+        # Before the index is built there is nothing to update: the build reads Chroma
+        if is_loaded(memory_index):
+            memory_index.add(user_id, memory_id, content)
+        print(f"[Memory] Stored: {content}")
+
+def lexical_memory_search(user_id: str, query: str, k: int):
+    """BM25 matches as [(id, text)], after syncing the user's postings with Chroma."""
+    if memory_index is None or not query:
+        return []
+    try:
+        with span("chroma", "memory_index_sync"):
+            memory_index.sync_user(memory_collection(), user_id)
+        with span("lexical", "memory_search"):
+            matches = [(doc_id, memory_index.text(user_id, doc_id)) for doc_id, _ in memory_index.search(user_id, query, k)]
+        return [(doc_id, text) for doc_id, text in matches if text]
+    except Exception as e:
+        print(f"[ERROR] Lexical memory search failed: {e}")
+        return []
+
+def fuse_memories(lexical: list, docs: list, k: int):
+    """Reciprocal rank fusion of BM25 matches and vector search results."""
+    texts = dict(lexical)
+    texts.update((doc.id, doc.page_content) for doc in docs)
+    ranking = reciprocal_rank_fusion([doc_id for doc_id, _ in lexical], [doc.id for doc in docs])
+    return [texts[doc_id] for doc_id in ranking[:k]]
 
 def retrieve_memory_from_db(user_id: str, query: str = "", k: int = 5):
-    """Retrieves relevant memories for a user."""
+    """Retrieves relevant memories for a user.
+
+    Entity lookups (names, emails, codes) that BM25 answers skip the embedding call;
+    everything else fuses BM25 with vector search.
+    """
     search_query = query if query else "user preferences and facts"
+    lexical = lexical_memory_search(user_id, query, k)
+    if lexical and is_entity_query(query):
+        return [text for _, text in lexical]
     try:
-        docs = db.similarity_search(
-            search_query,
-            k=k,
-            filter={"user_id": user_id}
-        )
-        return [doc.page_content for doc in docs]
+        with span("chroma", "memory_search"):
+            docs = db.similarity_search(
+                search_query,
+                k=k,
+                filter={"user_id": user_id}
+            )
+        return fuse_memories(lexical, docs, k)
     except Exception as e:
         print(f"[ERROR] Memory retrieval failed: {e}")
-        return []
+        return [text for _, text in lexical]
+
+async def aretrieve_memory_from_db(user_id: str, query: str = "", k: int = 5):
+    """Async retrieve_memory_from_db: the query embedding is awaited, the local Chroma search runs in a thread."""
+    search_query = query if query else "user preferences and facts"
+    lexical = await asyncio.to_thread(lexical_memory_search, user_id, query, k)
+    if lexical and is_entity_query(query):
+        return [text for _, text in lexical]
+    try:
+        vector = await embedding_function.aembed_query(search_query)
+        with span("chroma", "memory_search"):
+            docs = await asyncio.to_thread(db.similarity_search_by_vector, vector, k=k, filter={"user_id": user_id})
+        return fuse_memories(lexical, docs, k)
+    except Exception as e:
+        print(f"[ERROR] Memory retrieval failed: {e}")
+        return [text for _, text in lexical]
+
+MEMORY_FIELDS = ("id", "content", "time", "source", "type")
+MEMORY_PAGE_BATCH = 200
+
+def memory_version(user_id: str):
+    """Stamp of the user's stored memories, for /memory ETags (see lang/memory_versions.py)."""
+    return memory_versions.get(user_id)
+
+def _memory_where(user_id: str, source: str = None, since: float = None, until: float = None):
+    clauses = [{"user_id": user_id}]
+    if source:
+        clauses.append({"source": source})
+    if since is not None:
+        clauses.append({"ts": {"$gte": since}})
+    if until is not None:
+        clauses.append({"ts": {"$lt": until}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def iter_memories(user_id: str, offset: int = 0, limit: int = None, source: str = None,
+                  since: float = None, until: float = None, fields=MEMORY_FIELDS):
+    """Yields a user's memories starting at `offset`, reading Chroma in bounded batches.
+
+    Documents are only loaded when "content" is among `fields`. Time filters use the
+    "ts" metadata, so memories stored before it existed only show up unfiltered.
+    """
+    col = memory_collection()
+    include = ["metadatas", "documents"] if "content" in fields else ["metadatas"]
+    where = _memory_where(user_id, source, since, until)
+    remaining = limit
+    while remaining is None or remaining > 0:
+        batch_size = MEMORY_PAGE_BATCH if remaining is None else min(remaining, MEMORY_PAGE_BATCH)
+        with span("chroma", "memory_page"):
+            results = col.get(where=where, limit=batch_size, offset=offset, include=include)
+        for i, memory_id in enumerate(results['ids']):
+            meta = results['metadatas'][i] or {}
+            memory = {
+                "id": memory_id,
+                "content": results['documents'][i] if "content" in fields else None,
+                "time": meta.get("timestamp", "Unknown"),
+                "source": meta.get("source"),
+                "type": "memory"
+            }
+            yield {field: memory[field] for field in fields}
+        offset += len(results['ids'])
+        if remaining is not None:
+            remaining -= len(results['ids'])
+        if len(results['ids']) < batch_size:
+            return
 
 def get_all_memories(user_id: str):
     """Fetches all memories for a user (manual fetch via client)."""
     # Helper to get raw data for frontend
     try:
-        col = chroma_client.get_collection(collection_name)
-        results = col.get(where={"user_id": user_id})
-        memories = []
-        if results and results['documents']:
-            for i, doc in enumerate(results['documents']):
-                meta = results['metadatas'][i]
-                memories.append({
-                    "id": results['ids'][i],
-                    "content": doc,
-                    "time": meta.get("timestamp", "Unknown"),
-                    "type": "memory"
-                })
-        return memories
+        return list(iter_memories(user_id))
     except Exception as e:
         print(f"Error fetching all memories: {e}")
         return []
@@ -117,66 +290,59 @@ SCOPES = [
     'https://www.googleapis.com/auth/calendar.events'
 ]
 
-def authenticate_google():
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            # Server-side flow usually handled by app.py now
-            pass 
-    return creds
-
-def get_services():
-    creds = authenticate_google()
-    if not creds: return None, None
-    return build('gmail', 'v1', credentials=creds), build('calendar', 'v3', credentials=creds)
+# Tools act for the turn's user: `user_id` is injected from the graph state and hidden from the model
+CurrentUser = Annotated[str, InjectedState("user_id")]
+
+def authenticate_google(user_id: str = DEFAULT_USER):
+    services = service_cache.get(user_id)
+    return services.creds if services else None
+
+def get_services(user_id: str = DEFAULT_USER):
+    services = service_cache.get(user_id)
+    if not services: return None, None
+    return services.gmail, services.calendar
+
+# Local copy of message metadata, synced from Gmail's history feed; MAILBOX_INDEX=0 turns it off
+mailbox_index = lazy("mailbox_index", MailboxIndex) if os.getenv("MAILBOX_INDEX", "1") != "0" else None
+
+def indexed_search(service, query: str, count: int, user_id: str = DEFAULT_USER):
+    """Summary lines from the local mailbox index, or None when Gmail has to answer."""
+    if mailbox_index is None or not mailbox_index.ensure_fresh(service, user_id):
+        return None
+    return mailbox_index.search(user_id, query, count)
 
 @tool
-def read_inbox(count: int = 5):
+def read_inbox(user_id: CurrentUser, count: int = 5):
     """Reads the latest unread emails from the inbox."""
-    service, _ = get_services()
+    service, _ = get_services(user_id)
     if not service: return "Authentication required."
+    summary = indexed_search(service, "in:inbox is:unread", count, user_id)
+    if summary is not None:
+        return "\n".join(summary) or "No unread messages found."
     results = service.users().messages().list(userId='me', labelIds=['INBOX', 'UNREAD'], maxResults=count).execute()
     messages = results.get('messages', [])
     if not messages: return "No unread messages found."
     
-    summary = []
-    for msg in messages:
-        txt = service.users().messages().get(userId='me', id=msg['id']).execute()
-        headers = txt['payload']['headers']
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), "No Subject")
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), "Unknown")
-        summary.append(f"From: {sender} | Subject: {subject} | Snippet: {txt.get('snippet', '')}")
-    return "\n".join(summary)
+    return "\n".join(summarize_messages(service, messages))
 
 @tool
-def search_emails(query: str, count: int = 5):
+def search_emails(query: str, user_id: CurrentUser, count: int = 5):
     """Searches emails. Query examples: 'from:john', 'subject:meeting', 'is:unread'."""
-    service, _ = get_services()
+    service, _ = get_services(user_id)
     if not service: return "Authentication required."
+    summary = indexed_search(service, query, count, user_id)
+    if summary is not None:
+        return "\n".join(summary) or "No matching emails found."
     results = service.users().messages().list(userId='me', q=query, maxResults=count).execute()
     messages = results.get('messages', [])
     if not messages: return "No matching emails found."
     
-    summary = []
-    for msg in messages:
-        try:
-            txt = service.users().messages().get(userId='me', id=msg['id']).execute()
-            headers = txt['payload']['headers']
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), "No Subject")
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), "Unknown")
-            summary.append(f"From: {sender} | Subject: {subject} | Snippet: {txt.get('snippet', '')}")
-        except:
-            continue
-    return "\n".join(summary)
+    return "\n".join(summarize_messages(service, messages))
 
 @tool
-def send_email(to: str, subject: str, body: str):
+def send_email(to: str, subject: str, body: str, user_id: CurrentUser):
     """Sends an email to the specified recipient."""
-    service, _ = get_services()
+    service, _ = get_services(user_id)
     if not service: return "Authentication required."
     message = EmailMessage()
     message.set_content(body)
@@ -188,35 +354,102 @@ def send_email(to: str, subject: str, body: str):
     except Exception as e:
         return f"Error: {str(e)}"
 
+# Events of the primary calendar, kept current with sync tokens; CALENDAR_CACHE=0 turns it off
+calendar_cache = CalendarCache() if os.getenv("CALENDAR_CACHE", "1") != "0" else None
+
+def events_between(service, low: float, high: float, user_id: str = DEFAULT_USER):
+    """Events overlapping [low, high) (epoch seconds), from the cache when it covers the range."""
+    if calendar_cache is not None and calendar_cache.ensure_fresh(service, user_id):
+        events = calendar_cache.events_between(user_id, low, high)
+        if events is not None:
+            return events
+    events, token = [], None
+    while True:
+        page = service.events().list(
+            calendarId='primary', singleEvents=True, orderBy='startTime', pageToken=token,
+            timeMin=datetime.datetime.utcfromtimestamp(low).isoformat() + 'Z',
+            timeMax=datetime.datetime.utcfromtimestamp(high).isoformat() + 'Z',
+        ).execute()
+        events.extend(page.get('items', []))
+        token = page.get('nextPageToken')
+        if not token:
+            return events
+
+# Time zones read live while the cache has none for a user (first questions, or CALENDAR_CACHE=0)
+calendar_zones = LRUCache(max_entries=1024, ttl=3600)
+
+def calendar_timezone(service, user_id: str = DEFAULT_USER):
+    """Zone for naive times and all-day events: the cached calendar's, else the primary calendar's, read live."""
+    tz = calendar_cache.timezone(user_id) if calendar_cache is not None else None
+    if tz is not None:
+        return tz
+    try:
+        return calendar_zones.get_or_load(user_id, lambda: primary_timezone(service))
+    except Exception as e:
+        print(f"[WARN] Could not read the calendar time zone, using UTC: {e}")
+        return datetime.timezone.utc
+
 @tool
-def list_calendar_events(count: int = 5):
+def list_calendar_events(user_id: CurrentUser, count: int = 5):
     """Lists upcoming calendar events with IDs."""
-    _, service = get_services()
+    _, service = get_services(user_id)
     if not service: return "Authentication required."
-    now = datetime.datetime.utcnow().isoformat() + 'Z'
-    events_result = service.events().list(calendarId='primary', timeMin=now, maxResults=count, singleEvents=True, orderBy='startTime').execute()
-    events = events_result.get('items', [])
+    events = None
+    if calendar_cache is not None and calendar_cache.ensure_fresh(service, user_id):
+        events = calendar_cache.upcoming(user_id, count)
+    if events is None:
+        now = datetime.datetime.utcnow().isoformat() + 'Z'
+        events_result = service.events().list(calendarId='primary', timeMin=now, maxResults=count, singleEvents=True, orderBy='startTime').execute()
+        events = events_result.get('items', [])
     if not events: return "No events found."
-    return "\n".join([f"[ID: {e['id']}] {e['start'].get('dateTime', e['start'].get('date'))}: {e['summary']}" for e in events])
+    return "\n".join([format_event(e) for e in events])
+
+@tool
+def check_availability(start_time: str, end_time: str, user_id: CurrentUser):
+    """Shows busy and free time between two times, with the events that conflict.
+    start_time and end_time must be ISO 8601 strings (e.g., '2024-01-20T09:00:00').
+    Use it before scheduling, or to answer "am I free ...?" questions.
+    """
+    _, service = get_services(user_id)
+    if not service: return "Authentication required."
+    tz = calendar_timezone(service, user_id)
+    try:
+        low, high = parse_time(start_time, tz).timestamp(), parse_time(end_time, tz).timestamp()
+    except ValueError as e:
+        return f"Error: {e}"
+    if high <= low: return "Error: end_time must be after start_time."
+    busy, free = free_busy(events_between(service, low, high, user_id), low, high, tz)
+
+    def when(ts):
+        return datetime.datetime.fromtimestamp(ts, tz).isoformat(timespec='minutes')
+
+    if not busy: return f"Free from {when(low)} to {when(high)}."
+    lines = ["Busy:"]
+    for start, end, events in busy:
+        lines.append(f"- {when(start)} to {when(end)}: " + "; ".join(format_event(e) for e in events))
+    lines.append("Free:" if free else "No free time in this range.")
+    lines.extend(f"- {when(start)} to {when(end)}" for start, end in free)
+    return "\n".join(lines)
 
 @tool
-def delete_calendar_event(event_id: str):
+def delete_calendar_event(event_id: str, user_id: CurrentUser):
     """Deletes a calendar event by its ID."""
-    _, service = get_services()
+    _, service = get_services(user_id)
     if not service: return "Authentication required."
     try:
         service.events().delete(calendarId='primary', eventId=event_id).execute()
+        if calendar_cache: calendar_cache.remove(user_id, event_id)
         return f"Event {event_id} deleted."
     except Exception as e:
         return f"Error deleting event: {e}"
 
 @tool
-def create_calendar_event(summary: str, start_time: str, end_time: str, description: str = ""):
+def create_calendar_event(summary: str, start_time: str, end_time: str, user_id: CurrentUser, description: str = ""):
     """Creates a calendar event.
     start_time and end_time must be ISO 8601 strings (e.g., '2024-01-20T10:00:00').
     IMPORTANT: Provide the full date and time.
     """
-    _, service = get_services()
+    _, service = get_services(user_id)
     if not service: return "Authentication required."
     
     event_body = {
@@ -227,6 +460,7 @@ def create_calendar_event(summary: str, start_time: str, end_time: str, descript
     }
     try:
         e = service.events().insert(calendarId='primary', body=event_body).execute()
+        if calendar_cache: calendar_cache.apply(user_id, e)
         return f"Event created: {e.get('htmlLink')}"
     except Exception as e:
         return f"Error creating event: {e}"
@@ -235,55 +469,191 @@ def create_calendar_event(summary: str, start_time: str, end_time: str, descript
 # 3. GRAPH LOGIC
 # ==========================================
 
-tools = [read_inbox, send_email, search_emails, list_calendar_events, create_calendar_event, delete_calendar_event]
-# Switch to a different model (gpt-4o-mini) which may have separate quota limits
-llm = ChatOpenAI(model="gpt-4o-mini", api_key=api_key).bind_tools(tools)
+tools = [read_inbox, send_email, search_emails, list_calendar_events, check_availability, create_calendar_event, delete_calendar_event]
+# Tools without side effects; only these may run concurrently within one step (see lang/tool_scheduler.py)
+READ_ONLY_TOOLS = {"read_inbox", "search_emails", "list_calendar_events", "check_availability"}
+TOOL_TIMEOUTS = {"send_email": 30.0}
+# Repeated prompts are answered from memory (see lang/llm_cache.py); LLM_CACHE=0 turns it off.
+# Answers that call a tool outside READ_ONLY_TOOLS are never cached, so a hit cannot repeat a write.
+LLM_CACHE = os.getenv("LLM_CACHE", "1") != "0"
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "600")),
+    cacheable_tools=READ_ONLY_TOOLS,
+    name="agent",
+)
+
+def chat_model(**kwargs):
+    from langchain_openai import ChatOpenAI
+    # Switch to a different model (gpt-4o-mini) which may have separate quota limits
+    return ChatOpenAI(model="gpt-4o-mini", api_key=api_key, **kwargs)
+
+llm = lazy("llm", lambda: chat_model(cache=response_cache if LLM_CACHE else False).bind_tools(tools))
+
+# Older turns are folded into state["summary"] so the prompt stays bounded (see lang/context_window.py).
+# Tagged nostream so summary tokens never reach the /chat/stream client.
+summarizer = lazy("summarizer", lambda: chat_model().with_config(tags=[TAG_NOSTREAM]))
+
+def summarize_conversation(summary: str, transcript: str):
+    with span("llm", "summarizer"):
+        response = summarizer.invoke(summary_prompt(summary, transcript, context_window.summary_max_tokens))
+        count_tokens("summarizer", response)
+    return response.content
+
+async def asummarize_conversation(summary: str, transcript: str):
+    with span("llm", "summarizer"):
+        response = await summarizer.ainvoke(summary_prompt(summary, transcript, context_window.summary_max_tokens))
+        count_tokens("summarizer", response)
+    return response.content
+
+context_window = ContextWindow(summarize_conversation, asummarize=asummarize_conversation)
+
+LLM_UNAVAILABLE = "⚠️ The AI service is currently unavailable (quota exceeded). Please try again later."
+
+def message_text(content):
+    """Flattens multimodal message content (list of blocks) into plain text."""
+    if isinstance(content, list):
+        return " ".join(block.get("text", "") for block in content if isinstance(block, dict) and block.get("type") == "text")
+    return content or ""
+
+def memory_query(state: AgentState, config: RunnableConfig = None):
+    """The memory query for this hop, or None when state["memory"] still applies.
+
+    Memories are retrieved once per human turn, keyed on the latest HumanMessage,
+    and carried in state["memory"] across tool hops. Pass
+    `configurable.memory_refresh = "always"` to re-query on every hop instead.
+    """
+    messages = state["messages"]
+    refresh = (config or {}).get("configurable", {}).get("memory_refresh", "turn")
+    new_turn = not messages or isinstance(messages[-1], HumanMessage)
+    if state.get("memory") is not None and not new_turn and refresh != "always":
+        return None
 
-def agent_node(state: AgentState):
-    # Retrieve relevant memories from Vector Store
-    user_id = state["user_id"]
-    last_message = state["messages"][-1].content if state["messages"] else ""
-    
     # Handle multimodal content (list of dicts)
-    if isinstance(last_message, list):
-         text_parts = [block.get("text", "") for block in last_message if block.get("type") == "text"]
-         last_message = " ".join(text_parts)
-    
-    # Retrieve memories relevant to the current context
-    memories = retrieve_memory_from_db(user_id, query=last_message)
+    last_human = next((m for m in reversed(messages) if isinstance(m, HumanMessage)), None)
+    return message_text(last_human.content) if last_human else ""
+
+def turn_memories(state: AgentState, config: RunnableConfig = None):
+    """Returns (memories, refreshed) for the current human turn."""
+    query = memory_query(state, config)
+    if query is None:
+        return state["memory"], False
+    return retrieve_memory_from_db(state["user_id"], query=query), True
+
+async def aturn_memories(state: AgentState, config: RunnableConfig = None):
+    query = memory_query(state, config)
+    if query is None:
+        return state["memory"], False
+    return await aretrieve_memory_from_db(state["user_id"], query=query), True
+
+def build_prompt(memories: list, window):
     memory_str = "\n".join(memories) if memories else "No relevant memories found."
     
-    current_time = datetime.datetime.now().astimezone().isoformat()
+    # Minute precision: finer adds nothing for the model and would make every prompt unique
+    current_time = datetime.datetime.now().astimezone().isoformat(timespec='minutes')
     system_prompt = f"You are a Chief of Staff AI.\nCurrent DateTime: {current_time}\nRelevant Memories:\n{memory_str}\n\nUse these memories and current time to personalize your response and actions."
-    
-    messages = [SystemMessage(content=system_prompt)] + state["messages"]
+    if window.summary:
+        system_prompt += f"\n\nSummary of the earlier conversation:\n{window.summary}"
+    return [SystemMessage(content=system_prompt)] + window.messages
+
+def check_response(response_msg):
+    # If the model returned an empty message (no content and no tool calls), treat it as a failure
+    has_content = getattr(response_msg, "content", None)
+    has_tool_calls = getattr(response_msg, "tool_calls", None)
+    if not has_content and not has_tool_calls:
+        raise ValueError("Empty response from LLM")
+    return response_msg
+
+def agent_update(response_msg, window, memories, refreshed):
+    update = {"messages": [response_msg]}
+    if window.folded:
+        update["messages"] = [RemoveMessage(id=m.id) for m in window.folded] + update["messages"]
+        update["summary"] = window.summary
+    if refreshed:
+        update["memory"] = memories
+    return update
+
+@timed("node", "agent")
+def agent_node(state: AgentState, config: RunnableConfig = None):
+    # Retrieve relevant memories from Vector Store (once per human turn)
+    memories, refreshed = turn_memories(state, config)
+    window = context_window.fit(state["messages"], state.get("summary", ""))
     try:
-        response_msg = llm.invoke(messages)
-        # If the model returned an empty message (no content and no tool calls), treat it as a failure
-        has_content = getattr(response_msg, "content", None)
-        has_tool_calls = getattr(response_msg, "tool_calls", None)
-        if not has_content and not has_tool_calls:
-            raise ValueError("Empty response from LLM")
+        with span("llm", "agent"):
+            response_msg = llm.invoke(build_prompt(memories, window))
+            count_tokens("agent", response_msg)
+        response_msg = check_response(response_msg)
     except Exception as e:
         # Log the error and provide a graceful fallback with non‑empty content
         print(f"[ERROR] OpenAI request failed: {e}")
-        response_msg = AIMessage(content="⚠️ The AI service is currently unavailable (quota exceeded). Please try again later.")
-    return {"messages": [response_msg]}
+        response_msg = AIMessage(content=LLM_UNAVAILABLE)
+    return agent_update(response_msg, window, memories, refreshed)
+
+@timed("node", "agent")
+async def aagent_node(state: AgentState, config: RunnableConfig = None):
+    """agent_node for ainvoke/astream: LLM, embedding and summary calls are awaited."""
+    memories, refreshed = await aturn_memories(state, config)
+    window = await context_window.afit(state["messages"], state.get("summary", ""))
+    try:
+        with span("llm", "agent"):
+            response_msg = await llm.ainvoke(build_prompt(memories, window))
+            count_tokens("agent", response_msg)
+        response_msg = check_response(response_msg)
+    except Exception as e:
+        print(f"[ERROR] OpenAI request failed: {e}")
+        response_msg = AIMessage(content=LLM_UNAVAILABLE)
+    return agent_update(response_msg, window, memories, refreshed)
+
+# The same tool outputs and greetings come back constantly; LLM_CACHE_SIMILARITY (e.g. 0.97)
+# also reuses the answer for a near-identical message, compared by embedding.
+extraction_cache = ResponseCache(
+    max_entries=int(os.getenv("EXTRACTION_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("EXTRACTION_CACHE_TTL", "86400")),
+    embeddings=embedding_function,
+    similarity=float(os.getenv("LLM_CACHE_SIMILARITY", "0")) or None,
+    name="extraction",
+)
+extractor = lazy("extractor", lambda: chat_model(cache=extraction_cache if LLM_CACHE else False))
+
+# Instructions and content go in separate messages, so the cache's similarity tier compares content only
+EXTRACTION_INSTRUCTIONS = "Extract important personal preferences, facts, or tasks from the user's text.\nReturn ONLY the fact/preference as a concise sentence. If nothing worth remembering, return 'None'."
+
+def extraction_prompt(content: str):
+    return [SystemMessage(content=EXTRACTION_INSTRUCTIONS), HumanMessage(content=content)]
+
+def extract_memory(content: str):
+    """Asks the LLM for a rememberable fact in `content`; returns None if there is none."""
+    with span("llm", "extractor"):
+        response = extractor.invoke(extraction_prompt(content))
+        count_tokens("extractor", response)
+    extraction = response.content
+    return None if "None" in extraction else extraction
+
+memory_queue = MemoryWorkQueue(
+    extract_memory,
+    store_memories_to_db,
+    workers=int(os.getenv("MEMORY_WORKERS", "2")),
+    max_pending=int(os.getenv("MEMORY_QUEUE_SIZE", "256")),
+    batch_size=int(os.getenv("MEMORY_BATCH_SIZE", "16")),
+)
 
+# Greetings, lookups and tool output rarely hold a memory; they are scored locally and
+# skipped without an LLM call (see lang/memory_filter.py). MEMORY_FILTER=0 turns it off.
+memory_filter = MemoryFilter() if os.getenv("MEMORY_FILTER", "1") != "0" else None
+
+@timed("node", "update_memory")
 def update_memory_node(state: AgentState):
     if not state["messages"]: return {}
     last_msg = state["messages"][-1]
     content = last_msg.content if isinstance(last_msg, (HumanMessage, ToolMessage)) else ""
     if not content: return {}
+    text = message_text(content)
+    kind = "tool" if isinstance(last_msg, ToolMessage) else "human"
+    if memory_filter and not memory_filter.worth_extracting(text, kind): return {}
 
-    extractor = ChatOpenAI(model="gpt-4o-mini", api_key=api_key)
-    prompt = f"Extract important personal preferences, facts, or tasks from this text: '{content}'.\nReturn ONLY the fact/preference as a concise sentence. If nothing worth remembering, return 'None'."
-    try:
-        extraction = extractor.invoke(prompt).content
-        if "None" not in extraction:
-            # Store in Vector DB
-            store_memory_to_db(state["user_id"], extraction, source="conversation_insight")
-    except: pass
+    # Extraction and the Vector DB write happen on the background queue
+    if memory_queue.submit(state["user_id"], text, source="conversation_insight"):
+        get_stream_writer()({"event": "memory_queued", "source": "conversation_insight"})
     return {}
 
 def should_continue(state: AgentState):
@@ -291,8 +661,9 @@ def should_continue(state: AgentState):
 
 # Compile Graph
 workflow = StateGraph(AgentState)
-workflow.add_node("agent", agent_node)
-workflow.add_node("tools", ToolNode(tools))
+# Sync and async implementations; LangGraph picks one for invoke/stream vs ainvoke/astream
+workflow.add_node("agent", RunnableLambda(agent_node, afunc=aagent_node, name="agent"))
+workflow.add_node("tools", ScheduledToolNode(tools, read_only=READ_ONLY_TOOLS, timeouts=TOOL_TIMEOUTS))
 workflow.add_node("update_memory", update_memory_node)
 
 workflow.set_entry_point("update_memory")
@@ -300,4 +671,52 @@ workflow.add_edge("update_memory", "agent")
 workflow.add_conditional_edges("agent", should_continue, {"tools": "tools", END: END})
 workflow.add_edge("tools", "update_memory")
 
-agent = workflow.compile(checkpointer=MemorySaver())
+# Conversation state is persisted to db/checkpoints.sqlite3 (see lang/checkpointer.py)
+checkpointer = lazy("checkpointer", TieredSqliteSaver.from_path)
+agent = lazy("agent", lambda: workflow.compile(checkpointer=resolve(checkpointer)))
+
+# ==========================================
+# 4. STREAMING
+# ==========================================
+
+STREAM_MODES = ["messages", "updates", "custom"]
+
+def stream_agent_events(inputs: dict, config: dict):
+    """Runs the graph and yields (event, data) pairs as the turn progresses.
+
+    Events: `token` (LLM output from the agent node), `tool_start` / `tool_end`,
+    `memory_queued`, and a final `done` carrying the complete response text.
+    """
+    turn = {}
+    for mode, chunk in agent.stream(inputs, config=config, stream_mode=STREAM_MODES):
+        yield from _translate_stream_item(mode, chunk, turn)
+    yield "done", {"response": message_text(turn["final"].content) if turn.get("final") else ""}
+
+async def astream_agent_events(inputs: dict, config: dict):
+    """Async stream_agent_events, driven by agent.astream."""
+    turn = {}
+    async for mode, chunk in agent.astream(inputs, config=config, stream_mode=STREAM_MODES):
+        for event in _translate_stream_item(mode, chunk, turn):
+            yield event
+    yield "done", {"response": message_text(turn["final"].content) if turn.get("final") else ""}
+
+def _translate_stream_item(mode, chunk, turn):
+    """Maps one graph stream item to events; the agent's latest message is kept in turn["final"]."""
+    if mode == "messages":
+        msg, metadata = chunk
+        # Only the answering model streams; the memory extractor runs silently
+        if metadata.get("langgraph_node") == "agent" and isinstance(msg, AIMessageChunk) and msg.content:
+            yield "token", {"content": message_text(msg.content)}
+    elif mode == "updates":
+        for node, update in chunk.items():
+            if not isinstance(update, dict):
+                continue
+            for msg in update.get("messages", []):
+                if node == "agent":
+                    turn["final"] = msg
+                    for call in getattr(msg, "tool_calls", None) or []:
+                        yield "tool_start", {"id": call["id"], "name": call["name"], "args": call["args"]}
+                elif node == "tools":
+                    yield "tool_end", {"id": msg.tool_call_id, "name": msg.name, "content": message_text(msg.content)}
+    elif mode == "custom" and isinstance(chunk, dict):
+        yield chunk.get("event", "custom"), {k: v for k, v in chunk.items() if k != "event"}
@@ -1,5 +1,5 @@
 from langchain_core.messages import HumanMessage
-from agent import agent
+from lang.agent import agent, memory_queue
 
 USER_ID = "demo_user"
 
@@ -25,3 +25,6 @@ while True:
     # Get the last message
     last_msg = result["messages"][-1]
     print("Agent:", last_msg.content)
+
+# Let queued memory extraction finish before exiting
+memory_queue.flush()
@@ -0,0 +1,122 @@
+"""Disk-backed, size-bounded LRU cache of parsed attachments, keyed by content hash.
+
+Each entry is one JSON file named after the sha256 of the attachment bytes. For
+documents it holds the extracted text plus per-page offsets, so re-attaching the
+same PDF skips PdfReader entirely. Recency is tracked through file mtimes, so
+the LRU order survives restarts.
+"""
+import hashlib
+import json
+import os
+import threading
+
+ATTACHMENT_CACHE_DIR = os.getenv("ATTACHMENT_CACHE_DIR", os.path.join(os.getcwd(), "cache", "attachments"))
+ATTACHMENT_CACHE_MAX_BYTES = int(os.getenv("ATTACHMENT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def digest_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def digest_stream(stream, block_size=1 << 20):
+    """Hashes a seekable stream without reading it into memory, then rewinds it."""
+    h = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(block_size), b""):
+        h.update(block)
+    stream.seek(0)
+    return h.hexdigest()
+
+
+def pack_pages(pages):
+    """[(page_number, text)] -> {"text", "page_offsets"} with pages numbered from 1."""
+    parts, offsets, position = [], [], 0
+    for _, text in pages:
+        offsets.append(position)
+        parts.append(text)
+        position += len(text)
+    return {"text": "".join(parts), "page_offsets": offsets}
+
+
+def unpack_pages(entry):
+    """Inverse of pack_pages: yields (page_number, text)."""
+    text, offsets = entry["text"], entry["page_offsets"]
+    for i, start in enumerate(offsets):
+        end = offsets[i + 1] if i + 1 < len(offsets) else len(text)
+        yield i + 1, text[start:end]
+
+
+class AttachmentCache:
+    def __init__(self, directory=ATTACHMENT_CACHE_DIR, max_bytes=ATTACHMENT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # digest -> (size, last_access), rebuilt from the files already on disk
+        self._index = {}
+        for fname in os.listdir(directory):
+            if fname.endswith(".json"):
+                st = os.stat(os.path.join(directory, fname))
+                self._index[fname[:-5]] = (st.st_size, st.st_mtime)
+        self._total = sum(size for size, _ in self._index.values())
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, digest):
+        path = self._path(digest)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if digest in self._index:
+                self._index[digest] = (self._index[digest][0], os.stat(path).st_mtime)
+        return entry
+
+    def put(self, digest, entry):
+        data = json.dumps(entry).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(digest)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            old_size, _ = self._index.get(digest, (0, 0))
+            self._index[digest] = (len(data), os.stat(path).st_mtime)
+            self._total += len(data) - old_size
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock
+        while self._total > self.max_bytes and self._index:
+            oldest = min(self._index, key=lambda d: self._index[d][1])
+            size, _ = self._index.pop(oldest)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(oldest))
+            except OSError:
+                pass
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "bytes": self._total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,82 @@
+"""Small thread-safe in-memory LRU cache with optional TTL and hit/miss counters."""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._entries.get(key, _MISSING)
+            if item is not _MISSING and self.ttl is not None and time.monotonic() - item[0] > self.ttl:
+                del self._entries[key]
+                item = _MISSING
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Returns the cached value, or calls `loader()` and caches a non-None result.
+
+        Loader calls are timed so the cost of misses shows up in `stats()`.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        start = time.perf_counter()
+        value = loader()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.loads += 1
+            self.load_seconds += elapsed
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._entries.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "loads": self.loads,
+            "avg_load_ms": round(1000 * self.load_seconds / self.loads, 3) if self.loads else 0.0,
+        }
@@ -0,0 +1,359 @@
+"""Per-user cache of primary-calendar events, kept current with Calendar sync tokens.
+
+A full sync lists single (expanded) events from CALENDAR_PAST_DAYS ago to
+CALENDAR_HORIZON_DAYS ahead and keeps the `nextSyncToken`. A read older than
+CALENDAR_FRESH_SECONDS replays only the changes since that token; when Google
+answers 410 (token expired) the window is listed again. Events are held in an
+IntervalIndex, so an overlap query over any range inside the window costs a
+bisect plus the events it returns. Writes made through the agent are applied
+straight away (`apply` / `remove`); the next sync then confirms them.
+
+Like lang/mailbox_index.py, the first read for a user starts the full sync in the
+background and is answered live. At most CALENDAR_CACHE_USERS calendars are held;
+the least recently used one goes first, and calendars idle for longer than
+CALENDAR_IDLE_SECONDS are dropped and fully synced again on their next read.
+"""
+import bisect
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+from zoneinfo import ZoneInfo
+
+from googleapiclient.errors import HttpError
+
+CALENDAR_FRESH_SECONDS = float(os.getenv("CALENDAR_FRESH_SECONDS", "60"))
+CALENDAR_PAST_DAYS = int(os.getenv("CALENDAR_PAST_DAYS", "30"))
+CALENDAR_HORIZON_DAYS = int(os.getenv("CALENDAR_HORIZON_DAYS", "365"))
+CALENDAR_CACHE_USERS = int(os.getenv("CALENDAR_CACHE_USERS", "512"))
+CALENDAR_IDLE_SECONDS = float(os.getenv("CALENDAR_IDLE_SECONDS", "3600"))
+CALENDAR_PAGE_SIZE = 250
+
+
+def parse_time(value, tz=datetime.timezone.utc):
+    """ISO 8601 date or datetime -> aware datetime; naive values are read in `tz`."""
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=tz)
+
+
+def event_span(event, tz=datetime.timezone.utc):
+    """(start, end) of an event in epoch seconds; all-day events run midnight to midnight in `tz`."""
+    start, end = event["start"], event["end"]
+    return (parse_time(start.get("dateTime") or start["date"], tz).timestamp(),
+            parse_time(end.get("dateTime") or end["date"], tz).timestamp())
+
+
+def is_busy(event):
+    """Whether an event blocks time: not marked "free", and not declined by the user."""
+    if event.get("transparency") == "transparent":
+        return False
+    return not any(a.get("self") and a.get("responseStatus") == "declined" for a in event.get("attendees", []))
+
+
+def primary_timezone(service):
+    """Time zone of the user's primary calendar, read live (UTC when it has none or it is unknown)."""
+    return _zone(service.calendars().get(calendarId='primary').execute().get("timeZone"))
+
+
+def format_event(event):
+    return f"[ID: {event['id']}] {event['start'].get('dateTime', event['start'].get('date'))}: {event.get('summary', '(No title)')}"
+
+
+def free_busy(events, low, high, tz=datetime.timezone.utc):
+    """Busy blocks and free gaps within [low, high) (epoch seconds).
+
+    Returns (busy, free): busy is a list of (start, end, events) with overlapping
+    events merged into one block, free a list of (start, end).
+    """
+    spans = sorted((max(s, low), min(e, high), event) for event in events if is_busy(event)
+                   for s, e in [event_span(event, tz)] if s < high and e > low)
+    busy = []
+    for start, end, event in spans:
+        if busy and start <= busy[-1][1]:
+            busy[-1] = (busy[-1][0], max(busy[-1][1], end), busy[-1][2] + [event])
+        else:
+            busy.append((start, end, [event]))
+    free, cursor = [], low
+    for start, end, _ in busy:
+        if start > cursor:
+            free.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < high:
+        free.append((cursor, high))
+    return busy, free
+
+
+class IntervalIndex:
+    """Intervals sorted by start.
+
+    An overlap query for [low, high) bisects to the first interval that could still
+    reach `low` (start >= low minus the longest interval seen) and scans up to `high`.
+    """
+
+    def __init__(self):
+        self._entries = []  # (start, end, key), sorted
+        self._spans = {}
+        self._longest = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key, start, end):
+        self.remove(key)
+        bisect.insort(self._entries, (start, end, key))
+        self._spans[key] = (start, end)
+        self._longest = max(self._longest, end - start)
+
+    def remove(self, key):
+        span = self._spans.pop(key, None)
+        if span:
+            del self._entries[bisect.bisect_left(self._entries, (*span, key))]
+
+    def overlapping(self, low, high):
+        """Keys of intervals with start < high and end > low, by start."""
+        first = bisect.bisect_left(self._entries, (low - self._longest,))
+        last = bisect.bisect_left(self._entries, (high,))
+        return [key for start, end, key in self._entries[first:last] if end > low]
+
+
+class _Calendar:
+    """Cached state of one user's primary calendar."""
+
+    def __init__(self, tz, sync_token, low, high):
+        self.tz = tz
+        self.sync_token = sync_token
+        self.low, self.high = low, high
+        self.synced_at = time.time()
+        self.used_at = time.monotonic()
+        self.events = {}
+        self.index = IntervalIndex()
+
+    def apply(self, event):
+        if event.get("status") == "cancelled":
+            self.remove(event["id"])
+            return
+        self.events[event["id"]] = event
+        self.index.add(event["id"], *event_span(event, self.tz))
+
+    def remove(self, event_id):
+        self.events.pop(event_id, None)
+        self.index.remove(event_id)
+
+
+class CalendarCache:
+    def __init__(self, fresh_seconds=CALENDAR_FRESH_SECONDS, past_days=CALENDAR_PAST_DAYS, horizon_days=CALENDAR_HORIZON_DAYS,
+                 max_users=CALENDAR_CACHE_USERS, idle_seconds=CALENDAR_IDLE_SECONDS):
+        self.fresh_seconds = fresh_seconds
+        self.past_days = past_days
+        self.horizon_days = horizon_days
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._calendars = OrderedDict()  # user_id -> _Calendar, least recently used first
+        self._sync_locks = {}
+        self._full_syncs_running = set()
+        self.local_answers = 0
+        self.live_fallbacks = 0
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.write_throughs = 0
+        self.evictions = 0
+
+    # ---- bookkeeping ------------------------------------------------------
+
+    def _get(self, user_id):
+        # Caller holds the lock; marks the calendar as used
+        calendar = self._calendars.get(user_id)
+        if calendar is not None:
+            calendar.used_at = time.monotonic()
+            self._calendars.move_to_end(user_id)
+        return calendar
+
+    def _evict(self):
+        # Caller holds the lock
+        while len(self._calendars) > self.max_users:
+            self._drop(next(iter(self._calendars)))
+        # Drop idle calendars from the cold end
+        now = time.monotonic()
+        while self._calendars:
+            user_id, calendar = next(iter(self._calendars.items()))
+            if now - calendar.used_at <= self.idle_seconds:
+                break
+            self._drop(user_id)
+
+    def _drop(self, user_id):
+        # Caller holds the lock
+        del self._calendars[user_id]
+        if user_id not in self._full_syncs_running:
+            self._sync_locks.pop(user_id, None)
+        self.evictions += 1
+
+    # ---- sync -------------------------------------------------------------
+
+    def _pages(self, service, **params):
+        token = None
+        while True:
+            page = service.events().list(calendarId='primary', singleEvents=True, maxResults=CALENDAR_PAGE_SIZE,
+                                         pageToken=token, **params).execute()
+            yield page
+            token = page.get("nextPageToken")
+            if not token:
+                return
+
+    def full_sync(self, service, user_id):
+        now = time.time()
+        low, high = now - self.past_days * 86400, now + self.horizon_days * 86400
+        items, page = [], {}
+        for page in self._pages(service, timeMin=_rfc3339(low), timeMax=_rfc3339(high)):
+            items.extend(page.get("items", []))
+        calendar = _Calendar(_zone(page.get("timeZone")), page.get("nextSyncToken"), low, high)
+        for event in items:
+            calendar.apply(event)
+        with self._lock:
+            self._calendars[user_id] = calendar
+            self._calendars.move_to_end(user_id)
+            self._evict()
+        self.full_syncs += 1
+
+    def incremental_sync(self, service, user_id, calendar):
+        changes, page = [], {}
+        for page in self._pages(service, syncToken=calendar.sync_token):
+            changes.extend(page.get("items", []))
+        with self._lock:
+            for event in changes:
+                calendar.apply(event)
+            calendar.sync_token = page.get("nextSyncToken", calendar.sync_token)
+            calendar.synced_at = time.time()
+        self.incremental_syncs += 1
+
+    def sync(self, service, user_id):
+        calendar = self._calendars.get(user_id)
+        # Slide the window forward once half the horizon has passed. Without a sync token
+        # (Google did not send one) the bounded window is listed again: an incremental list
+        # with syncToken=None would return the whole calendar, unbounded.
+        if calendar is None or calendar.sync_token is None or calendar.high - time.time() < self.horizon_days * 86400 / 2:
+            return self.full_sync(service, user_id)
+        try:
+            self.incremental_sync(service, user_id, calendar)
+        except HttpError as e:
+            if e.resp.status != 410:
+                raise
+            # The sync token expired; Google asks for a full sync
+            self.full_sync(service, user_id)
+
+    def _sync_lock(self, user_id):
+        with self._lock:
+            return self._sync_locks.setdefault(user_id, threading.Lock())
+
+    def _background_full_sync(self, service, user_id):
+        try:
+            with self._sync_lock(user_id):
+                self.full_sync(service, user_id)
+        except Exception as e:
+            print(f"[ERROR] Calendar cache sync failed: {e}")
+        finally:
+            with self._lock:
+                self._full_syncs_running.discard(user_id)
+
+    def ensure_fresh(self, service, user_id):
+        """True when the cache may answer for this user right now."""
+        with self._lock:
+            self._evict()
+            calendar = self._get(user_id)
+        if calendar is None:
+            with self._lock:
+                start = user_id not in self._full_syncs_running
+                if start:
+                    self._full_syncs_running.add(user_id)
+            if start:
+                threading.Thread(target=self._background_full_sync, args=(service, user_id), daemon=True).start()
+            return False
+        if time.time() - calendar.synced_at <= self.fresh_seconds:
+            return True
+        with self._sync_lock(user_id):
+            # Another caller may have synced while this one waited
+            calendar = self._calendars.get(user_id)
+            if calendar and time.time() - calendar.synced_at <= self.fresh_seconds:
+                return True
+            try:
+                self.sync(service, user_id)
+                return True
+            except Exception as e:
+                print(f"[ERROR] Calendar cache sync failed: {e}")
+                return False
+
+    # ---- writes -----------------------------------------------------------
+
+    def apply(self, user_id, event):
+        """Write-through for an event created or updated through the API."""
+        with self._lock:
+            calendar = self._get(user_id)
+            if calendar:
+                calendar.apply(event)
+                self.write_throughs += 1
+
+    def remove(self, user_id, event_id):
+        with self._lock:
+            calendar = self._get(user_id)
+            if calendar:
+                calendar.remove(event_id)
+                self.write_throughs += 1
+
+    def forget(self, user_id):
+        with self._lock:
+            self._calendars.pop(user_id, None)
+
+    # ---- queries ----------------------------------------------------------
+
+    def timezone(self, user_id):
+        """The calendar's time zone, or None before the first sync for this user."""
+        with self._lock:
+            calendar = self._get(user_id)
+            return calendar.tz if calendar else None
+
+    def events_between(self, user_id, low, high):
+        """Events overlapping [low, high) by start time, or None when the range is not cached."""
+        with self._lock:
+            calendar = self._get(user_id)
+            if calendar is None or low < calendar.low or high > calendar.high:
+                self.live_fallbacks += 1
+                return None
+            self.local_answers += 1
+            return [calendar.events[key] for key in calendar.index.overlapping(low, high)]
+
+    def upcoming(self, user_id, count):
+        """The next `count` events that have not ended, or None when the window may hold fewer."""
+        with self._lock:
+            calendar = self._get(user_id)
+            keys = calendar.index.overlapping(time.time(), calendar.high)[:count] if calendar else []
+            if len(keys) < count:
+                self.live_fallbacks += 1
+                return None
+            self.local_answers += 1
+            return [calendar.events[key] for key in keys]
+
+    def stats(self):
+        with self._lock:
+            cached = sum(len(c.events) for c in self._calendars.values())
+        return {
+            "users": len(self._calendars),
+            "events": cached,
+            "local_answers": self.local_answers,
+            "live_fallbacks": self.live_fallbacks,
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "write_throughs": self.write_throughs,
+            "evictions": self.evictions,
+        }
+
+
+def _rfc3339(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _zone(name):
+    try:
+        return ZoneInfo(name) if name else datetime.timezone.utc
+    except Exception:
+        return datetime.timezone.utc
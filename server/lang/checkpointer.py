@@ -0,0 +1,253 @@
+"""Disk-backed LangGraph checkpointer with a small hot tier and bounded history.
+
+Replaces the in-process MemorySaver. Checkpoints live in SQLite (WAL mode), so
+threads survive restarts and several workers can share one file. On top of the
+stock SqliteSaver:
+
+* a hot tier keeps the latest checkpoint of recently active threads in memory
+  (serialized, so callers never share objects). Idle threads are evicted, and an
+  entry is only served while it is still the newest checkpoint on disk.
+* each thread keeps at most `max_checkpoints` checkpoints. Older ones and their
+  writes are pruned every `compact_every` writes, and `compact()` does it for all
+  threads and reclaims the WAL.
+
+Run `python -m lang.checkpointer --vacuum` from the server directory for an offline
+compaction.
+
+The pruning queries read SqliteSaver's `checkpoints` and `writes` tables directly,
+so requirements.txt pins langgraph-checkpoint-sqlite to the version they match.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import CheckpointTuple, get_checkpoint_id, get_checkpoint_metadata
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", os.path.join(os.getcwd(), "db", "checkpoints.sqlite3"))
+MAX_CHECKPOINTS_PER_THREAD = int(os.getenv("MAX_CHECKPOINTS_PER_THREAD", "20"))
+HOT_THREADS = int(os.getenv("CHECKPOINT_HOT_THREADS", "512"))
+HOT_IDLE_SECONDS = int(os.getenv("CHECKPOINT_HOT_IDLE_SECONDS", "900"))
+
+
+class TieredSqliteSaver(SqliteSaver):
+    def __init__(self, conn, max_checkpoints=MAX_CHECKPOINTS_PER_THREAD, hot_threads=HOT_THREADS,
+                 hot_idle_seconds=HOT_IDLE_SECONDS, compact_every=10, **kwargs):
+        super().__init__(conn, **kwargs)
+        self.max_checkpoints = max_checkpoints
+        self.hot_threads = hot_threads
+        self.hot_idle_seconds = hot_idle_seconds
+        self.compact_every = compact_every
+        # (thread_id, checkpoint_ns) -> (last_used, checkpoint_id, parent_id, typed checkpoint, metadata json)
+        self._hot = OrderedDict()
+        self._hot_lock = threading.Lock()
+        # thread_id -> writes since its last prune, most recent last; capped like the hot tier
+        self._puts = OrderedDict()
+        self.hot_hits = 0
+        self.hot_misses = 0
+
+    @classmethod
+    def from_path(cls, path=CHECKPOINT_DB, **kwargs):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return cls(sqlite3.connect(path, check_same_thread=False), **kwargs)
+
+    # ---- hot tier ---------------------------------------------------------
+
+    def _hot_get(self, key):
+        now = time.monotonic()
+        with self._hot_lock:
+            entry = self._hot.get(key)
+            if entry is None:
+                return None
+            if now - entry[0] > self.hot_idle_seconds:
+                del self._hot[key]
+                return None
+            self._hot[key] = (now, *entry[1:])
+            self._hot.move_to_end(key)
+            return entry
+
+    def _hot_set(self, key, checkpoint_id, parent_id, typed_checkpoint, metadata):
+        now = time.monotonic()
+        with self._hot_lock:
+            self._hot[key] = (now, checkpoint_id, parent_id, typed_checkpoint, metadata)
+            self._hot.move_to_end(key)
+            while len(self._hot) > self.hot_threads:
+                self._hot.popitem(last=False)
+            # Drop idle threads from the cold end
+            while self._hot:
+                oldest_key = next(iter(self._hot))
+                if now - self._hot[oldest_key][0] <= self.hot_idle_seconds:
+                    break
+                del self._hot[oldest_key]
+
+    def _hot_drop(self, key):
+        with self._hot_lock:
+            self._hot.pop(key, None)
+
+    def _latest_checkpoint_id(self, thread_id, checkpoint_ns):
+        with self.cursor(transaction=False) as cur:
+            cur.execute(
+                "SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            )
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    # ---- BaseCheckpointSaver ----------------------------------------------
+
+    def get_tuple(self, config):
+        if get_checkpoint_id(config):
+            return super().get_tuple(config)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = (thread_id, checkpoint_ns)
+        entry = self._hot_get(key)
+        # Another worker may have written since; only serve the entry if it is still the newest
+        if entry is not None and entry[1] == self._latest_checkpoint_id(thread_id, checkpoint_ns):
+            self.hot_hits += 1
+            _, checkpoint_id, parent_id, typed_checkpoint, metadata = entry
+            return CheckpointTuple(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+                self.serde.loads_typed(typed_checkpoint),
+                json.loads(metadata),
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None,
+                [],
+            )
+        self.hot_misses += 1
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        self._hot_set(
+            (thread_id, checkpoint_ns),
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            self.serde.dumps_typed(checkpoint),
+            json.dumps(get_checkpoint_metadata(config, metadata), ensure_ascii=False),
+        )
+        if self._count_put(thread_id):
+            self.prune_thread(thread_id)
+        return next_config
+
+    def _count_put(self, thread_id):
+        """Counts a write; True when the thread is due for pruning (its count then restarts).
+
+        Counts of the least recently written threads are dropped beyond `hot_threads`,
+        which only delays their pruning; `compact()` catches up with them.
+        """
+        with self._hot_lock:
+            count = self._puts.pop(thread_id, 0) + 1
+            if count >= self.compact_every:
+                return True
+            self._puts[thread_id] = count
+            while len(self._puts) > self.hot_threads:
+                self._puts.popitem(last=False)
+            return False
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        super().put_writes(config, writes, task_id, task_path)
+        # The hot entry carries no pending writes, so it cannot serve a checkpoint that has some
+        key = (str(config["configurable"]["thread_id"]), config["configurable"].get("checkpoint_ns", ""))
+        entry = self._hot_get(key)
+        if entry is not None and entry[1] == config["configurable"].get("checkpoint_id"):
+            self._hot_drop(key)
+
+    def delete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        with self._hot_lock:
+            self._puts.pop(str(thread_id), None)
+            for key in [k for k in self._hot if k[0] == str(thread_id)]:
+                del self._hot[key]
+
+    # The stock SqliteSaver has no async API; run the sync one off the event loop
+    # so the graph can also be driven with ainvoke/astream.
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # ---- compaction -------------------------------------------------------
+
+    def prune_thread(self, thread_id):
+        """Deletes all but the newest `max_checkpoints` checkpoints (and their writes) of a thread."""
+        with self.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM checkpoints WHERE thread_id = ? AND (checkpoint_ns, checkpoint_id) IN (
+                    SELECT checkpoint_ns, checkpoint_id FROM (
+                        SELECT checkpoint_ns, checkpoint_id, ROW_NUMBER() OVER (
+                            PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC
+                        ) AS age
+                        FROM checkpoints WHERE thread_id = ?
+                    ) WHERE age > ?
+                )
+                """,
+                (thread_id, thread_id, self.max_checkpoints),
+            )
+            removed = cur.rowcount
+            cur.execute(
+                """
+                DELETE FROM writes WHERE thread_id = ? AND NOT EXISTS (
+                    SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id
+                    AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """,
+                (thread_id,),
+            )
+        return removed
+
+    def compact(self, vacuum=False):
+        """Prunes every thread to its cap and truncates the WAL; returns a small report."""
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT DISTINCT thread_id FROM checkpoints")
+            threads = [row[0] for row in cur.fetchall()]
+        removed = sum(self.prune_thread(thread_id) for thread_id in threads)
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if vacuum:
+                self.conn.execute("VACUUM")
+        return {"threads": len(threads), "checkpoints_removed": removed}
+
+    def stats(self):
+        lookups = self.hot_hits + self.hot_misses
+        return {
+            "hot_threads": len(self._hot),
+            "counted_threads": len(self._puts),
+            "hot_hits": self.hot_hits,
+            "hot_misses": self.hot_misses,
+            "hot_hit_rate": round(self.hot_hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune old conversation checkpoints.")
+    parser.add_argument("--path", default=CHECKPOINT_DB)
+    parser.add_argument("--keep", type=int, default=MAX_CHECKPOINTS_PER_THREAD, help="checkpoints kept per thread")
+    parser.add_argument("--vacuum", action="store_true", help="also VACUUM the database file")
+    args = parser.parse_args()
+    saver = TieredSqliteSaver.from_path(args.path, max_checkpoints=args.keep)
+    print(json.dumps(saver.compact(vacuum=args.vacuum), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Bounded prompt history: recent turns verbatim, older turns folded into a rolling summary.
+
+History is split into turns, each starting at a HumanMessage. Turns are never cut,
+so an AIMessage with tool calls always travels with its ToolMessages. Once a thread
+grows past `max_turns` turns or `max_tokens` tokens, the oldest turns are handed to
+`summarize(previous_summary, transcript)` until the remainder is back down to
+`keep_turns` turns and `target_tokens` tokens. The caller then removes them from state.
+This hysteresis means the summarizer runs every few turns, not on every hop.
+
+The current turn is always kept. If it alone is over `max_tokens` (a pasted document,
+a large tool result), its largest messages are clipped in the prompt copy only, so the
+prompt stays within `max_tokens` plus the summary while state keeps the full text.
+"""
+import asyncio
+import json
+import os
+from typing import NamedTuple
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "6000"))
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "6"))
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "12"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "600"))
+IMAGE_TOKENS = 765  # gpt-4o cost of one high-detail 512px image
+TRANSCRIPT_CHARS_PER_MESSAGE = 2000
+CLIPPED_MARK = " … [clipped to fit the context window]"
+
+
+def _text(content):
+    if isinstance(content, list):
+        return " ".join(block.get("text", "") for block in content if isinstance(block, dict) and block.get("type") == "text")
+    return content or ""
+
+
+def approx_tokens(messages):
+    """Cheap token estimate (~4 chars per token) used when no tokenizer hook is given.
+
+    Image parts are charged a flat cost instead of the length of their data URI.
+    """
+    total = 0
+    for m in messages:
+        total += 4
+        if isinstance(m.content, list):
+            for block in m.content:
+                if isinstance(block, dict) and block.get("type") == "image_url":
+                    total += IMAGE_TOKENS
+                elif isinstance(block, dict):
+                    total += len(block.get("text", "")) // 4
+        else:
+            total += len(m.content or "") // 4
+        for call in getattr(m, "tool_calls", None) or []:
+            total += (len(call["name"]) + len(json.dumps(call["args"]))) // 4
+    return total
+
+
+def split_turns(messages):
+    """Groups messages into turns, each starting at a HumanMessage."""
+    turns = []
+    for m in messages:
+        if isinstance(m, HumanMessage) or not turns:
+            turns.append([m])
+        else:
+            turns[-1].append(m)
+    return turns
+
+
+def render_transcript(messages, max_chars=TRANSCRIPT_CHARS_PER_MESSAGE):
+    """Plain-text transcript fed to the summarizer; long messages are clipped."""
+    lines = []
+    for m in messages:
+        text = _text(m.content)
+        if isinstance(m.content, list) and any(isinstance(b, dict) and b.get("type") == "image_url" for b in m.content):
+            text += " [image]"
+        if len(text) > max_chars:
+            text = text[:max_chars] + " …"
+        if isinstance(m, HumanMessage):
+            lines.append(f"User: {text}")
+        elif isinstance(m, ToolMessage):
+            lines.append(f"Tool {m.name} returned: {text}")
+        elif isinstance(m, AIMessage):
+            for call in m.tool_calls or []:
+                lines.append(f"Assistant called {call['name']}({json.dumps(call['args'])})")
+            if text:
+                lines.append(f"Assistant: {text}")
+        elif not isinstance(m, SystemMessage):
+            lines.append(text)
+    return "\n".join(lines)
+
+
+def _clip_content(content, max_chars):
+    if isinstance(content, list):
+        clipped = []
+        for block in content:
+            if isinstance(block, dict) and block.get("type") == "text":
+                text = block.get("text", "")
+                if len(text) > max_chars:
+                    block = {**block, "text": text[:max_chars] + CLIPPED_MARK}
+                max_chars = max(max_chars - len(text), 0)
+            clipped.append(block)
+        return clipped
+    content = content or ""
+    return content if len(content) <= max_chars else content[:max_chars] + CLIPPED_MARK
+
+
+def clip_message(message, max_tokens, count_tokens=approx_tokens):
+    """Copy of `message` whose text is cut until it counts at most `max_tokens`.
+
+    Ids, tool calls and images are kept, so tool call pairs stay intact.
+    """
+    max_chars = max_tokens * 4
+    while True:
+        clipped = message.model_copy(update={"content": _clip_content(message.content, max_chars)})
+        tokens = count_tokens([clipped])
+        if max_chars == 0 or tokens <= max_tokens:
+            return clipped
+        max_chars = min(max_chars - 1, max_chars * max_tokens // tokens)
+
+
+class Window(NamedTuple):
+    messages: list   # what goes into the prompt
+    folded: list     # messages now covered by the summary (to be removed from state)
+    summary: str
+
+
+class ContextWindow:
+    def __init__(self, summarize, count_tokens=approx_tokens, max_tokens=CONTEXT_MAX_TOKENS,
+                 keep_turns=CONTEXT_KEEP_TURNS, max_turns=CONTEXT_MAX_TURNS, summary_max_tokens=SUMMARY_MAX_TOKENS,
+                 target_ratio=0.6, asummarize=None):
+        """summarize(previous_summary, transcript) -> str; count_tokens(messages) -> int.
+
+        asummarize is the coroutine version used by afit(); without it the sync one runs in a thread.
+        """
+        self.summarize = summarize
+        self.asummarize = asummarize
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.target_tokens = int(max_tokens * target_ratio)
+        self.keep_turns = keep_turns
+        self.max_turns = max(max_turns, keep_turns)
+        self.summary_max_tokens = summary_max_tokens
+        self.folds = 0
+        self.summarized_turns = 0
+        self.clipped_messages = 0
+
+    def _plan(self, messages):
+        """Returns (turns, sizes, start); turns[:start] are to be folded into the summary."""
+        turns = split_turns(messages)
+        sizes = [self.count_tokens(turn) for turn in turns]
+        if len(turns) <= self.max_turns and sum(sizes) <= self.max_tokens:
+            return turns, sizes, 0
+        # Keep the newest turns; the current one is kept even if it alone is over budget
+        start = max(len(turns) - self.keep_turns, 0)
+        while start < len(turns) - 1 and sum(sizes[start:]) > self.target_tokens:
+            start += 1
+        return turns, sizes, start
+
+    def _batches(self, turns, sizes, start):
+        """Transcripts of the turns to fold, about max_tokens each, oldest first."""
+        batch, batch_tokens = [], 0
+        for turn, size in zip(turns[:start], sizes[:start]):
+            batch.extend(turn)
+            batch_tokens += size
+            if batch_tokens >= self.max_tokens:
+                yield render_transcript(batch)
+                batch, batch_tokens = [], 0
+        if batch:
+            yield render_transcript(batch)
+
+    def _clip(self, summary):
+        max_chars = self.summary_max_tokens * 4
+        return summary if len(summary) <= max_chars else summary[:max_chars] + " …"
+
+    def _kept(self, turns, sizes, start):
+        """Messages of turns[start:]. Only the current turn can be over budget (see _plan);
+        then the text of its largest messages is clipped until it fits next to the earlier kept turns."""
+        kept = [m for turn in turns[start:-1] for m in turn]
+        budget = self.max_tokens - sum(sizes[start:-1])
+        if sizes[-1] <= budget:
+            return kept + turns[-1]
+        current = turns[-1]
+        message_sizes = [self.count_tokens([m]) for m in current]
+        # What each message still costs with no text left (framing, tool calls, images)
+        floors = [self.count_tokens([m.model_copy(update={"content": _clip_content(m.content, 0)})]) for m in current]
+        texts = [max(size - floor, 0) for size, floor in zip(message_sizes, floors)]
+        # Largest per-message text allowance whose clipped sizes still add up to the budget
+        share, left = 0, budget - sum(floors)
+        for i, text in enumerate(sorted(texts)):
+            share = max(left, 0) // (len(texts) - i)
+            if text > share:
+                break
+            left -= text
+        else:
+            share = max(texts)
+        for m, text, floor in zip(current, texts, floors):
+            if text > share:
+                self.clipped_messages += 1
+                m = clip_message(m, floor + share, self.count_tokens)
+            kept.append(m)
+        return kept
+
+    def _window(self, turns, sizes, start, summary, folded=True):
+        kept = self._kept(turns, sizes, start)
+        if not folded:
+            return Window(kept, [], summary)
+        self.folds += 1
+        self.summarized_turns += start
+        return Window(kept, [m for turn in turns[:start] for m in turn], summary)
+
+    def fit(self, messages, summary=""):
+        turns, sizes, start = self._plan(messages)
+        if not start:
+            return Window(self._kept(turns, sizes, 0) if turns else [], [], summary)
+        try:
+            new_summary = summary
+            for transcript in self._batches(turns, sizes, start):
+                new_summary = self._clip(self.summarize(new_summary, transcript) or new_summary)
+        except Exception as e:
+            # Still send a bounded prompt; folding is retried on the next hop
+            print(f"[ERROR] Conversation summary failed: {e}")
+            return self._window(turns, sizes, start, summary, folded=False)
+        return self._window(turns, sizes, start, new_summary)
+
+    async def afit(self, messages, summary=""):
+        turns, sizes, start = self._plan(messages)
+        if not start:
+            return Window(self._kept(turns, sizes, 0) if turns else [], [], summary)
+        try:
+            new_summary = summary
+            for transcript in self._batches(turns, sizes, start):
+                if self.asummarize:
+                    result = await self.asummarize(new_summary, transcript)
+                else:
+                    result = await asyncio.to_thread(self.summarize, new_summary, transcript)
+                new_summary = self._clip(result or new_summary)
+        except Exception as e:
+            print(f"[ERROR] Conversation summary failed: {e}")
+            return self._window(turns, sizes, start, summary, folded=False)
+        return self._window(turns, sizes, start, new_summary)
+
+    def stats(self):
+        return {"folds": self.folds, "summarized_turns": self.summarized_turns,
+                "clipped_messages": self.clipped_messages}
+
+
+def summary_prompt(summary, transcript, max_tokens=SUMMARY_MAX_TOKENS):
+    return (
+        "You maintain a running summary of a conversation between a user and their Chief of Staff assistant.\n"
+        f"Current summary:\n{summary or '(empty)'}\n\n"
+        f"New conversation to fold in:\n{transcript}\n\n"
+        f"Rewrite the summary to include the new conversation in at most {max_tokens * 3 // 4} words. "
+        "Keep names, dates, commitments, open tasks and decisions; drop small talk. Return only the summary."
+    )
@@ -0,0 +1,211 @@
+"""Per-user Google OAuth credentials, encrypted at rest in SQLite, behind an in-memory cache.
+
+Replaces the single token.json: every logged-in user has a row holding the
+authorized-user JSON of their credentials (Credentials.to_json()), encrypted with
+Fernet. CREDENTIAL_KEY holds one or more comma-separated Fernet keys; the first
+encrypts, all of them decrypt, so a key can be rotated by putting the new one
+first. Without CREDENTIAL_KEY a key is generated into CREDENTIAL_KEY_FILE on
+first use, with a warning: fine for development, but then the key sits next to
+the data it protects.
+
+Lookups go through an LRU cache (CREDENTIAL_CACHE_TTL bounds how long another
+instance's login or logout takes to show up), so a tool call does not touch
+SQLite. `refresh_lock(user_id)` serializes token refreshes per user within the
+process; see lang/google_clients.py. Nothing is opened until the first lookup.
+
+Sign-ins are rows too: `start_session(user_id)` records a random session id that
+the app puts into the user's sign-in token, and `session_user(session_id)` checks
+it on every request, uncached, so `delete()` at logout revokes every token of
+the user on every instance at once.
+
+Run from the server directory to move a legacy token.json into the store:
+    python -m lang.credential_store --import-token token.json --user EMAIL
+    python -m lang.credential_store --list
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from cryptography.fernet import Fernet, MultiFernet
+from google.oauth2.credentials import Credentials
+
+from lang.cache import LRUCache
+
+CREDENTIAL_STORE_PATH = os.getenv("CREDENTIAL_STORE_PATH", os.path.join(os.getcwd(), "db", "credentials.sqlite3"))
+CREDENTIAL_KEY_FILE = os.getenv("CREDENTIAL_KEY_FILE", CREDENTIAL_STORE_PATH + ".key")
+CREDENTIAL_CACHE_TTL = int(os.getenv("CREDENTIAL_CACHE_TTL", "300"))
+CREDENTIAL_CACHE_SIZE = int(os.getenv("CREDENTIAL_CACHE_SIZE", "1024"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS credentials (user_id TEXT PRIMARY KEY, token BLOB NOT NULL, updated REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, created REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS sessions_by_user ON sessions (user_id);
+"""
+
+_NO_CREDENTIALS = False  # cached for users without a row, so anonymous lookups stay in memory too
+
+
+def load_key(key_file=CREDENTIAL_KEY_FILE):
+    """MultiFernet from CREDENTIAL_KEY, else from `key_file`, generating it if missing."""
+    keys = [k.strip() for k in os.getenv("CREDENTIAL_KEY", "").split(",") if k.strip()]
+    if not keys:
+        if not os.path.exists(key_file):
+            print(f"[WARN] CREDENTIAL_KEY is not set; generating a key in {key_file}")
+            os.makedirs(os.path.dirname(os.path.abspath(key_file)), exist_ok=True)
+            try:
+                fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(Fernet.generate_key())
+            except FileExistsError:
+                pass  # another process created it first
+        with open(key_file, "rb") as f:
+            keys = [f.read().strip()]
+    return MultiFernet([Fernet(k) for k in keys])
+
+
+class CredentialStore:
+    def __init__(self, path=CREDENTIAL_STORE_PATH, key=None, key_file=CREDENTIAL_KEY_FILE,
+                 cache_ttl=CREDENTIAL_CACHE_TTL, cache_size=CREDENTIAL_CACHE_SIZE):
+        """key: a Fernet / MultiFernet; by default load_key(key_file) on first use."""
+        self.path = path
+        self.key_file = key_file
+        self._fernet = key
+        self._conn = None
+        self._lock = threading.Lock()
+        self._cache = LRUCache(max_entries=cache_size, ttl=cache_ttl)
+        self._refresh_locks = {}
+        self.reads = 0
+        self.writes = 0
+        self.undecryptable = 0
+
+    def _db(self):
+        # Caller holds the lock
+        if self._conn is None:
+            if self._fernet is None:
+                self._fernet = load_key(self.key_file)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _read(self, user_id):
+        with self._lock:
+            self.reads += 1
+            row = self._db().execute("SELECT token FROM credentials WHERE user_id = ?", (user_id,)).fetchone()
+            fernet = self._fernet
+        if row is None:
+            return _NO_CREDENTIALS
+        try:
+            info = json.loads(fernet.decrypt(row[0]))
+        except Exception as e:
+            # Wrong or rotated-out key: treat as logged out rather than failing every request
+            print(f"[ERROR] Stored credentials for {user_id} could not be decrypted: {e}")
+            self.undecryptable += 1
+            return _NO_CREDENTIALS
+        return Credentials.from_authorized_user_info(info)
+
+    def load(self, user_id):
+        """The user's Credentials, or None if they never logged in."""
+        creds = self._cache.get(user_id)
+        if creds is None:
+            creds = self._read(user_id)
+            self._cache.set(user_id, creds)
+        return creds or None
+
+    def save(self, user_id, creds):
+        with self._lock:
+            conn = self._db()
+            token = self._fernet.encrypt(creds.to_json().encode())
+            conn.execute(
+                "INSERT INTO credentials (user_id, token, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET token = excluded.token, updated = excluded.updated",
+                (user_id, token, time.time()),
+            )
+            conn.commit()
+            self.writes += 1
+        self._cache.set(user_id, creds)
+
+    def delete(self, user_id):
+        """Removes the user's credentials and ends all of their sessions."""
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM credentials WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            conn.commit()
+            self.writes += 1
+        self._cache.set(user_id, _NO_CREDENTIALS)
+
+    def start_session(self, user_id, max_age=None):
+        """Records a new sign-in for the user; returns its session id.
+
+        max_age: seconds a sign-in token stays valid; older sessions of any user are pruned.
+        """
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            if max_age is not None:
+                conn.execute("DELETE FROM sessions WHERE created < ?", (now - max_age,))
+            conn.execute("INSERT INTO sessions (session_id, user_id, created) VALUES (?, ?, ?)", (session_id, user_id, now))
+            conn.commit()
+        return session_id
+
+    def session_user(self, session_id):
+        """The user a live session belongs to, or None once it was ended."""
+        with self._lock:
+            row = self._db().execute("SELECT user_id FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def forget_cached(self, user_id=None):
+        """Drops cached entries (one user, or all) so the next load reads SQLite."""
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(user_id)
+
+    def refresh_lock(self, user_id):
+        """Per-user lock that token refreshes hold, so concurrent requests refresh once."""
+        with self._lock:
+            return self._refresh_locks.setdefault(user_id, threading.Lock())
+
+    def users(self):
+        with self._lock:
+            return [row[0] for row in self._db().execute("SELECT user_id FROM credentials ORDER BY user_id")]
+
+    def stats(self):
+        cache = self._cache.stats()
+        return {
+            **{key: cache[key] for key in ("size", "hits", "misses", "evictions", "hit_rate")},
+            "sqlite_reads": self.reads,
+            "sqlite_writes": self.writes,
+            "undecryptable": self.undecryptable,
+        }
+
+
+credential_store = CredentialStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the encrypted Google credential store.")
+    parser.add_argument("--import-token", metavar="PATH", help="authorized-user JSON to store (e.g. a legacy token.json)")
+    parser.add_argument("--user", help="user id (the Google account email) for --import-token")
+    parser.add_argument("--list", action="store_true", help="list the users with stored credentials")
+    args = parser.parse_args()
+
+    if args.import_token:
+        if not args.user:
+            parser.error("--import-token needs --user")
+        credential_store.save(args.user, Credentials.from_authorized_user_file(args.import_token))
+        print(f"Stored credentials for {args.user}; {args.import_token} can be deleted.")
+    if args.list:
+        print(json.dumps(credential_store.users(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Bounded ingestion of PDF and text attachments into a chunked per-user document store.
+
+Attachments are parsed page by page (never concatenated into one string), cut into
+overlapping chunks and embedded into their own Chroma collection. A chat turn then
+pulls only the chunks relevant to the question into the prompt.
+"""
+import hashlib
+import io
+import itertools
+import os
+
+from pypdf import PdfReader
+
+from lang.attachment_cache import digest_stream, pack_pages, unpack_pages
+from lang.telemetry import span
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_DOCUMENT_PAGES = int(os.getenv("MAX_DOCUMENT_PAGES", "300"))
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 150
+TEXT_PAGE_CHARS = 4000  # plain text has no pages; read it in slices of this size
+INGEST_BATCH = 64
+DOCUMENT_CONTEXT_CHUNKS = int(os.getenv("DOCUMENT_CONTEXT_CHUNKS", "6"))
+
+
+class DocumentTooLarge(ValueError):
+    pass
+
+
+class UnreadableDocument(ValueError):
+    pass
+
+
+def check_size(name, size, max_bytes=MAX_UPLOAD_BYTES):
+    if size > max_bytes:
+        raise DocumentTooLarge(f"{name} is larger than the {max_bytes / 2**20:.1f} MB upload limit")
+
+
+def _stream_size(stream):
+    position = stream.tell()
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def iter_pdf_pages(reader, max_pages=MAX_DOCUMENT_PAGES):
+    """Yields (page_number, text) one page at a time, stopping at the page budget."""
+    # Malformed files make pypdf raise more than its own errors (KeyError, struct.error,
+    # RecursionError, ...); any of them means the upload cannot be read
+    try:
+        for number, page in enumerate(reader.pages, start=1):
+            if number > max_pages:
+                return
+            yield number, page.extract_text() or ""
+    except Exception as e:
+        raise UnreadableDocument(f"Could not read the PDF: {e}") from e
+
+
+def text_length(stream, block_chars=1 << 16):
+    """Characters in a UTF-8 byte stream, decoded the way iter_text_pages reads it; rewinds it."""
+    text = io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+    try:
+        return sum(len(block) for block in iter(lambda: text.read(block_chars), ""))
+    finally:
+        text.detach()
+        stream.seek(0)
+
+
+def iter_text_pages(stream, max_pages=MAX_DOCUMENT_PAGES):
+    """Yields (slice_number, text) for a UTF-8 byte stream, TEXT_PAGE_CHARS at a time."""
+    text = io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+    try:
+        for number in range(1, max_pages + 1):
+            part = text.read(TEXT_PAGE_CHARS)
+            if not part:
+                return
+            yield number, part
+    finally:
+        text.detach()
+
+
+def iter_chunks(pages, size=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Cuts page texts into overlapping chunks; yields (page_number, chunk)."""
+    step = size - overlap
+    for number, text in pages:
+        text = " ".join(text.split())
+        for start in range(0, max(len(text) - overlap, 1), step):
+            chunk = text[start:start + size]
+            if chunk.strip():
+                yield number, chunk
+
+
+class DocumentStore:
+    """Chunks of user attachments in a vector store, filtered by user and document id."""
+
+    def __init__(self, vectorstore, cache=None):
+        """cache: optional AttachmentCache holding parsed page texts by content hash."""
+        self.vectorstore = vectorstore
+        self.cache = cache
+
+    def ingest(self, user_id, name, mime_type, stream, max_bytes=MAX_UPLOAD_BYTES, max_pages=MAX_DOCUMENT_PAGES):
+        """Parses `stream` incrementally and stores its chunks; returns a summary dict.
+
+        The document id is derived from the user and the content hash, so attaching
+        the same file again reuses its stored chunks and (via the cache) its parsed text.
+        """
+        size = _stream_size(stream)
+        check_size(name, size, max_bytes)
+        if mime_type != 'application/pdf' and not mime_type.startswith('text/'):
+            raise ValueError(f"Unsupported document type: {mime_type}")
+
+        digest = digest_stream(stream)
+        doc_id = hashlib.sha256(f"{user_id}\0{digest}".encode('utf-8')).hexdigest()[:32]
+
+        cached = self.cache.get(digest) if self.cache else None
+        parsed = None
+        if cached and cached["pages"] >= min(cached["total_pages"], max_pages):
+            total_pages = cached["total_pages"]
+            pages = itertools.islice(unpack_pages(cached), max_pages)
+        else:
+            if mime_type == 'application/pdf':
+                try:
+                    reader = PdfReader(stream)
+                    total_pages = len(reader.pages)
+                except Exception as e:
+                    raise UnreadableDocument(f"{name} is not a readable PDF: {e}") from e
+                pages = iter_pdf_pages(reader, max_pages)
+            else:
+                # Pages are slices of decoded characters, so count characters, not bytes
+                total_pages = -(-text_length(stream) // TEXT_PAGE_CHARS)
+                pages = iter_text_pages(stream, max_pages)
+            # Keep the page texts as they stream past so the parse can be cached
+            parsed = []
+            pages = (parsed.append(page) or page for page in pages)
+
+        stored = self.vectorstore.get(where={"doc_id": doc_id}, include=[])["ids"]
+        if stored:
+            chunk_count = len(stored)
+            parsed = None
+        else:
+            chunk_count = self._store_chunks(user_id, doc_id, name, pages)
+
+        if parsed is not None and self.cache:
+            self.cache.put(digest, {
+                "kind": "document",
+                "mime_type": mime_type,
+                "total_pages": total_pages,
+                "pages": len(parsed),
+                **pack_pages(parsed),
+            })
+
+        return {
+            "doc_id": doc_id,
+            "name": name,
+            "pages": min(total_pages, max_pages),
+            "total_pages": total_pages,
+            "chunks": chunk_count,
+            "truncated": total_pages > max_pages,
+        }
+
+    def _store_chunks(self, user_id, doc_id, name, pages):
+        texts, metadatas = [], []
+        chunk_count = 0
+
+        def flush():
+            self.vectorstore.add_texts(
+                texts=texts,
+                metadatas=metadatas,
+                ids=[f"{doc_id}:{m['chunk']}" for m in metadatas],
+            )
+            texts.clear()
+            metadatas.clear()
+
+        for page, chunk in iter_chunks(pages):
+            texts.append(chunk)
+            metadatas.append({"user_id": user_id, "doc_id": doc_id, "name": name, "page": page, "chunk": chunk_count})
+            chunk_count += 1
+            if len(texts) >= INGEST_BATCH:
+                flush()
+        if texts:
+            flush()
+        return chunk_count
+
+    def relevant_chunks(self, user_id, doc_ids, query, k=DOCUMENT_CONTEXT_CHUNKS):
+        """Returns up to k (metadata, text) chunks of the given documents, most relevant first.
+
+        Without a question there is nothing to rank by, so the opening chunks are used.
+        """
+        if not doc_ids:
+            return []
+        where = {"$and": [{"user_id": user_id}, {"doc_id": {"$in": list(doc_ids)}}]}
+        if not query:
+            results = self.vectorstore.get(where={"$and": [*where["$and"], {"chunk": {"$lt": k}}]}, include=["documents", "metadatas"])
+            chunks = sorted(zip(results["metadatas"], results["documents"]), key=lambda c: (c[0]["doc_id"], c[0]["chunk"]))
+            return chunks[:k]
+        with span("chroma", "document_search"):
+            docs = self.vectorstore.similarity_search(query, k=k, filter=where)
+        return [(doc.metadata, doc.page_content) for doc in docs]
+
+
+def format_document_context(summary, chunks):
+    """Renders retrieved chunks as the text block appended to the user's message."""
+    header = f"[Attached document: {summary['name']} — {summary['pages']} pages"
+    if summary.get("truncated"):
+        header += f", only the first {summary['pages']} were read"
+    header += f"; showing the {len(chunks)} most relevant excerpts]"
+    return "\n\n" + header + "\n" + format_excerpts(chunks)
+
+
+def format_excerpts(chunks):
+    return "\n\n".join(f"({meta['name']}, page {meta['page']}) {text}" for meta, text in chunks)
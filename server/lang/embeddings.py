@@ -0,0 +1,172 @@
+"""Content-addressed embedding cache in front of any LangChain `Embeddings`.
+
+Vectors are keyed by sha256(model + text), kept in an in-memory LRU and optionally
+persisted to a local SQLite file (capped at EMBEDDING_STORE_MAX_ROWS), so repeated
+memory queries and re-stored texts never pay for another embedding request.
+Misses are sent to the wrapped embedder in batches.
+"""
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from lang.cache import LRUCache
+from lang.telemetry import annotate, count_cache, span
+
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_STORE_MAX_ROWS = int(os.getenv("EMBEDDING_STORE_MAX_ROWS", "100000"))  # about 600 MB of 1536-d vectors
+
+
+class SQLiteEmbeddingStore:
+    """Persistent key -> vector store (float32 blobs) backing the in-memory LRU.
+
+    Holds at most `max_rows` vectors. Reads refresh a row's `used_at`, and a write
+    that goes over the cap drops the least recently used rows down to 90% of it, so
+    pruning runs once per tenth of the cap rather than on every miss. The row count
+    is read once at open and then kept from the insert and delete counts; rows added
+    by other processes sharing the file are only seen after a restart.
+    """
+
+    def __init__(self, path, max_rows=EMBEDDING_STORE_MAX_ROWS):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_rows = max_rows
+        self.evictions = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, used_at REAL NOT NULL DEFAULT 0)"
+        )
+        # Files written before the cap existed have no used_at; their rows count as least recently used
+        if "used_at" not in [row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")]:
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_by_use ON embeddings (used_at)")
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._lock = threading.Lock()
+
+    def mget(self, keys):
+        found = {}
+        with self._lock, self._conn:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array.array('f', blob).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET used_at = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time()] + [key for key, _ in rows],
+                    )
+        return found
+
+    def mset(self, pairs):
+        now = time.time()
+        with self._lock, self._conn:
+            # Keys are content hashes, so an existing row already holds the same vector
+            cur = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, used_at) VALUES (?, ?, ?)",
+                [(key, array.array('f', vector).tobytes(), now) for key, vector in pairs],
+            )
+            self._rows += max(cur.rowcount, 0)
+            if self.max_rows and self._rows > self.max_rows:
+                cur = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY used_at LIMIT ?)",
+                    (self._rows - int(self.max_rows * 0.9),),
+                )
+                self._rows -= cur.rowcount
+                self.evictions += cur.rowcount
+
+    def stats(self):
+        return {"rows": self._rows, "max_rows": self.max_rows, "evictions": self.evictions}
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, underlying, namespace, max_entries=10000, store=None, batch_size=EMBEDDING_BATCH_SIZE):
+        """
+        underlying: the real embedder (OpenAI, or a deterministic fake offline)
+        namespace: usually the model name, so vectors of different models never mix
+        store: optional persistent store with mget(keys) / mset(pairs)
+        """
+        self.underlying = underlying
+        self.namespace = namespace
+        self.store = store
+        self.batch_size = batch_size
+        self.memory = LRUCache(max_entries=max_entries)
+        self.store_hits = 0
+        self.embedding_calls = 0
+        self.embedded_texts = 0
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, keys):
+        """Returns (vectors found in memory or the store, keys still missing)."""
+        vectors = {}
+        for key in set(keys):
+            vector = self.memory.get(key)
+            if vector is not None:
+                vectors[key] = vector
+
+        missing = [k for k in dict.fromkeys(keys) if k not in vectors]
+        if missing and self.store is not None:
+            for key, vector in self.store.mget(missing).items():
+                vectors[key] = vector
+                self.memory.set(key, vector)
+                self.store_hits += 1
+            missing = [k for k in missing if k not in vectors]
+        return vectors, missing
+
+    def _remember(self, vectors, chunk, embedded):
+        self.embedding_calls += 1
+        self.embedded_texts += len(chunk)
+        for key, vector in zip(chunk, embedded):
+            vectors[key] = vector
+            self.memory.set(key, vector)
+        if self.store is not None:
+            self.store.mset(list(zip(chunk, embedded)))
+
+    def _record(self, keys, missing):
+        count_cache("embedding", "hit", len(set(keys)) - len(missing))
+        count_cache("embedding", "miss", len(missing))
+        annotate(texts=len(keys), cache_misses=len(missing))
+
+    def embed_documents(self, texts):
+        with span("embedding", self.namespace):
+            keys = [self._key(t) for t in texts]
+            vectors, missing = self._lookup(keys)
+            self._record(keys, missing)
+            text_by_key = dict(zip(keys, texts))
+            for start in range(0, len(missing), self.batch_size):
+                chunk = missing[start:start + self.batch_size]
+                self._remember(vectors, chunk, self.underlying.embed_documents([text_by_key[k] for k in chunk]))
+            return [vectors[k] for k in keys]
+
+    async def aembed_documents(self, texts):
+        # Cache lookups are local; only the embedding request itself is awaited
+        with span("embedding", self.namespace):
+            keys = [self._key(t) for t in texts]
+            vectors, missing = self._lookup(keys)
+            self._record(keys, missing)
+            text_by_key = dict(zip(keys, texts))
+            for start in range(0, len(missing), self.batch_size):
+                chunk = missing[start:start + self.batch_size]
+                self._remember(vectors, chunk, await self.underlying.aembed_documents([text_by_key[k] for k in chunk]))
+            return [vectors[k] for k in keys]
+
+    def embed_query(self, text):
+        # text-embedding-3 models embed queries and documents identically, so they share entries
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self):
+        stats = {**self.memory.stats(), "store_hits": self.store_hits, "embedding_calls": self.embedding_calls, "embedded_texts": self.embedded_texts}
+        if hasattr(self.store, "stats"):
+            stats["store"] = self.store.stats()
+        return stats
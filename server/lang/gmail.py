@@ -0,0 +1,70 @@
+"""Gmail fetch helpers shared by the inbox tools in lang/agent.py."""
+from lang.telemetry import span
+
+# Gmail accepts up to 100 calls per batch but starts rate limiting above ~50.
+GMAIL_BATCH_SIZE = 50
+METADATA_HEADERS = ['Subject', 'From']
+
+
+def get_header(headers, name, default):
+    return next((h['value'] for h in headers if h['name'] == name), default)
+
+
+def format_summary(sender, subject, snippet):
+    return f"From: {sender} | Subject: {subject} | Snippet: {snippet}"
+
+
+def fetch_message_metadata(service, message_ids, batch_size=GMAIL_BATCH_SIZE):
+    """Fetches Subject/From/snippet for many messages through Gmail batch requests.
+
+    Only `format='metadata'` is requested, so message bodies never leave Google.
+    Returns a list of (message_id, message, error) tuples in the same order as
+    `message_ids`; a failed message carries its exception instead of being dropped.
+    """
+    responses = {}
+
+    def _on_response(request_id, response, exception):
+        responses[request_id] = (response, exception)
+
+    for start in range(0, len(message_ids), batch_size):
+        batch = service.new_batch_http_request(callback=_on_response)
+        for i in range(start, min(start + batch_size, len(message_ids))):
+            batch.add(
+                service.users().messages().get(
+                    userId='me',
+                    id=message_ids[i],
+                    format='metadata',
+                    metadataHeaders=METADATA_HEADERS,
+                ),
+                request_id=str(i),
+            )
+        try:
+            with span("google", "gmail.batch", requests=min(batch_size, len(message_ids) - start)):
+                batch.execute()
+        except Exception as e:
+            # Transport-level failure: every message of this batch without a response failed
+            for i in range(start, min(start + batch_size, len(message_ids))):
+                responses.setdefault(str(i), (None, e))
+
+    results = []
+    for i, msg_id in enumerate(message_ids):
+        message, error = responses.get(str(i), (None, None))
+        if message is None and error is None:
+            error = RuntimeError("No response in batch")
+        results.append((msg_id, message, error))
+    return results
+
+
+def summarize_messages(service, messages):
+    """Formats `messages().list()` results as one summary line per message."""
+    summary = []
+    fetched = fetch_message_metadata(service, [msg['id'] for msg in messages])
+    for msg_id, message, error in fetched:
+        if error is not None:
+            summary.append(f"[Could not fetch message {msg_id}: {error}]")
+            continue
+        headers = message.get('payload', {}).get('headers', [])
+        subject = get_header(headers, 'Subject', "No Subject")
+        sender = get_header(headers, 'From', "Unknown")
+        summary.append(format_summary(sender, subject, message.get('snippet', '')))
+    return summary
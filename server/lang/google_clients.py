@@ -0,0 +1,181 @@
+"""Process-wide cache of Google credentials and built API service objects.
+
+Building a discovery-based service costs tens of milliseconds, so it happens once
+per user and the result is reused until the entry expires, is evicted (LRU), or
+is invalidated on logout. Credentials live in the encrypted per-user store of
+lang/credential_store.py. Token refreshes are single-flight per user: one request
+refreshes and saves, the others wait and reuse the new token.
+"""
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+
+from lang.credential_store import credential_store
+from lang.telemetry import span
+
+DEFAULT_USER = "default"
+
+SERVICE_CACHE_TTL = int(os.getenv("GOOGLE_SERVICE_CACHE_TTL", "1800"))
+SERVICE_CACHE_MAX_USERS = int(os.getenv("GOOGLE_SERVICE_CACHE_MAX_USERS", "256"))
+# Refresh a little before Google's own expiry check would force a refresh mid-request
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# httplib2.Http is not thread-safe, so every worker thread gets one connection pool
+# that it shares across all users and all services.
+_thread_local = threading.local()
+
+
+def _thread_http():
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = _thread_local.http = httplib2.Http()
+    return http
+
+
+def load_credentials(user_id=DEFAULT_USER):
+    """Stored OAuth credentials; None if the user never logged in."""
+    return credential_store.load(user_id)
+
+
+def save_credentials(user_id, creds):
+    credential_store.save(user_id, creds)
+
+
+def delete_credentials(user_id=DEFAULT_USER):
+    credential_store.delete(user_id)
+
+
+def needs_refresh(creds):
+    """True when the access token is expired or about to expire and can be refreshed."""
+    if not creds.refresh_token:
+        return False
+    if creds.expiry is None:
+        return not creds.valid
+    return creds.expiry - REFRESH_MARGIN <= datetime.datetime.utcnow()
+
+
+class TimedHttpRequest(HttpRequest):
+    """HttpRequest whose execute() is a "google" telemetry span named after the API method."""
+
+    def execute(self, *args, **kwargs):
+        with span("google", self.methodId or "unknown"):
+            return super().execute(*args, **kwargs)
+
+
+class UserServices:
+    """Credentials plus lazily built service objects for one user."""
+
+    def __init__(self, user_id, creds):
+        self.user_id = user_id
+        self.creds = creds
+        self.created = time.monotonic()
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def _build_request(self, http, *args, **kwargs):
+        # Each request runs on the calling thread's shared pool with this user's credentials
+        authed = google_auth_httplib2.AuthorizedHttp(self.creds, http=_thread_http())
+        return TimedHttpRequest(authed, *args, **kwargs)
+
+    def refresh_if_needed(self):
+        """Refreshes the access token if it is expired or about to expire.
+
+        The lock is the user's, not this entry's, so entries rebuilt after an
+        eviction or invalidation still share one refresh.
+        """
+        if needs_refresh(self.creds):
+            with credential_store.refresh_lock(self.user_id):
+                stored = load_credentials(self.user_id)
+                if stored is not None and stored is not self.creds and not needs_refresh(stored):
+                    self.creds = stored  # refreshed by another entry while this one waited
+                elif needs_refresh(self.creds):
+                    self.creds.refresh(Request())
+                    save_credentials(self.user_id, self.creds)
+
+    def service(self, name, version):
+        key = (name, version)
+        svc = self._services.get(key)
+        if svc is None:
+            with self._lock:
+                svc = self._services.get(key)
+                if svc is None:
+                    svc = build(
+                        name, version,
+                        http=google_auth_httplib2.AuthorizedHttp(self.creds, http=_thread_http()),
+                        requestBuilder=self._build_request,
+                        cache_discovery=False,
+                    )
+                    self._services[key] = svc
+        return svc
+
+    @property
+    def gmail(self):
+        return self.service('gmail', 'v1')
+
+    @property
+    def calendar(self):
+        return self.service('calendar', 'v3')
+
+    @property
+    def oauth2(self):
+        return self.service('oauth2', 'v2')
+
+
+class GoogleServiceCache:
+    """LRU + TTL cache of UserServices keyed by user id."""
+
+    def __init__(self, max_users=SERVICE_CACHE_MAX_USERS, ttl=SERVICE_CACHE_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id=DEFAULT_USER):
+        """Returns the user's UserServices, or None if there are no stored credentials."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry.created > self.ttl:
+                del self._entries[user_id]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+
+        if entry is None:
+            creds = load_credentials(user_id)
+            if not creds:
+                return None
+            entry = UserServices(user_id, creds)
+            with self._lock:
+                # Another thread may have loaded the same user meanwhile; keep the first one
+                entry = self._entries.setdefault(user_id, entry)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+
+        try:
+            entry.refresh_if_needed()
+        except Exception as e:
+            print(f"[ERROR] Google token refresh failed for {user_id}: {e}")
+            self.invalidate(user_id)
+            return None
+        return entry
+
+    def invalidate(self, user_id=None):
+        """Drops one user's entry, or every entry when user_id is None."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+service_cache = GoogleServiceCache()
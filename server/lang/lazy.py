@@ -0,0 +1,87 @@
+"""Thread-safe lazy singletons for the agent's heavy components.
+
+`lazy(name, factory)` returns a stand-in that builds the real object on first
+attribute access, exactly once even when several threads get there together,
+and forwards every attribute get/set to it afterwards. The stand-in has no public
+attributes of its own (they would shadow the real object's, e.g. a cache's
+`get`); use `resolve()` and `is_loaded()` instead. Module-level names in
+lang/agent.py (vector store, embedder, chat models, checkpointer, compiled graph)
+are such stand-ins, so importing the module opens no files and no clients. A
+factory that raises is retried on the next access instead of poisoning the name.
+
+`warm_up()` builds the registered components in registration order and reports
+the time each took; /warmup and `python -m lang.warmup` expose it.
+"""
+import threading
+import time
+
+_registry = {}
+
+
+class Lazy:
+    __slots__ = ("_name", "_factory", "_value", "_lock", "_loaded", "_build_seconds")
+
+    def __init__(self, name, factory):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_value", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "_loaded", False)
+        object.__setattr__(self, "_build_seconds", None)
+
+    def _get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    object.__setattr__(self, "_value", self._factory())
+                    object.__setattr__(self, "_build_seconds", time.perf_counter() - start)
+                    object.__setattr__(self, "_loaded", True)
+        return self._value
+
+    def __getattr__(self, attr):
+        return getattr(self._get(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._get(), attr, value)
+
+    def __repr__(self):
+        return repr(self._value) if self._loaded else f"<lazy {self._name}>"
+
+
+def lazy(name, factory):
+    """Registers `factory` under `name` and returns its Lazy stand-in."""
+    component = Lazy(name, factory)
+    _registry[name] = component
+    return component
+
+
+def resolve(obj):
+    """The real object behind a stand-in (building it), or `obj` itself."""
+    return obj._get() if isinstance(obj, Lazy) else obj
+
+
+def is_loaded(obj):
+    """False only for a stand-in that has not been built yet."""
+    return obj._loaded if isinstance(obj, Lazy) else obj is not None
+
+
+def warm_up(names=None):
+    """Builds the named components (default: all); {name: {"seconds"} or {"error"}} in build order."""
+    report = {}
+    for name, component in list(_registry.items()):
+        if names is not None and name not in names:
+            continue
+        start = time.perf_counter()
+        try:
+            component._get()
+            report[name] = {"seconds": round(time.perf_counter() - start, 4)}
+        except Exception as e:
+            print(f"[ERROR] Warm-up of {name} failed: {e}")
+            report[name] = {"error": str(e)}
+    return report
+
+
+def status():
+    return {name: {"loaded": component._loaded, "build_seconds": component._build_seconds and round(component._build_seconds, 4)}
+            for name, component in _registry.items()}
@@ -0,0 +1,225 @@
+"""LLM response cache plugged into LangChain's `cache=` hook on chat models.
+
+LangChain hands every call to `lookup` / `update` as (prompt, llm_string). The
+prompt is the serialized message list with message ids already removed. The
+llm_string covers the model, its parameters and the bound tool schema. Entries are
+keyed by a hash of the llm_string plus the prompt, normalized further: tool call
+ids and whitespace runs do not count. Eviction is LRU with a TTL.
+
+An optional second tier compares embeddings. Within the same model, tools and
+earlier messages, a prompt whose last message embeds within `similarity` (cosine)
+of a cached one gets that answer. It is off unless a threshold is given, because
+near-identical text can still differ in the one detail that matters.
+
+Responses are only stored when replaying them is harmless. A response that
+calls a tool outside `cacheable_tools` (one that sends mail, writes the
+calendar, ...) is never stored. Neither is an empty response.
+"""
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.caches import BaseCache
+
+from lang.telemetry import annotate, count_cache
+
+_WHITESPACE = re.compile(r"\s+")
+_VOLATILE_KEYS = {"id", "tool_call_id"}
+
+
+def _normalize(value):
+    """Drops per-call ids and collapses whitespace inside a serialized message tree."""
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if k not in _VOLATILE_KEYS or not isinstance(v, str)}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    if isinstance(value, str):
+        return _WHITESPACE.sub(" ", value).strip()
+    return value
+
+
+def _split_prompt(prompt):
+    """(earlier messages, last message, text of the last message) of a serialized prompt, canonicalized."""
+    try:
+        messages = _normalize(json.loads(prompt))
+    except ValueError:
+        text = _WHITESPACE.sub(" ", prompt).strip()
+        return "", text, text
+    if not isinstance(messages, list) or not messages:
+        return "", json.dumps(messages, sort_keys=True), ""
+    content = messages[-1].get("kwargs", {}).get("content", "") if isinstance(messages[-1], dict) else ""
+    if isinstance(content, list):
+        content = " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return json.dumps(messages[:-1], sort_keys=True), json.dumps(messages[-1], sort_keys=True), content
+
+
+def _digest(*parts):
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class _Bucket:
+    """Unit vectors of the cached prompts that share a model and earlier messages."""
+
+    def __init__(self):
+        self.vectors = {}
+        self._keys, self._matrix = [], None
+
+    def add(self, key, vector):
+        self.vectors[key] = vector
+        self._matrix = None
+
+    def discard(self, key):
+        if self.vectors.pop(key, None) is not None:
+            self._matrix = None
+
+    def nearest(self, vector):
+        if not self.vectors:
+            return None, 0.0
+        if self._matrix is None:
+            self._keys = list(self.vectors)
+            self._matrix = np.stack([self.vectors[k] for k in self._keys])
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        return self._keys[best], float(scores[best])
+
+
+class ResponseCache(BaseCache):
+    def __init__(self, max_entries=2048, ttl=3600, cacheable_tools=(), embeddings=None, similarity=None, name="llm"):
+        """cacheable_tools: tools whose calls may be replayed; embeddings + similarity enable the semantic tier.
+
+        name: the cache label in /metrics
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cacheable_tools = frozenset(cacheable_tools)
+        self.embeddings = embeddings if similarity else None
+        self.similarity = similarity
+        self._entries = OrderedDict()  # key -> (stored_at, generations, bucket id)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.not_cacheable = 0
+        self.evictions = 0
+
+    def _keys(self, prompt, llm_string):
+        earlier, last, text = _split_prompt(prompt)
+        return _digest(llm_string, earlier, last), _digest(llm_string, earlier), text
+
+    def _embed(self, text):
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=float)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, key):
+        # Caller holds the lock
+        _, _, bucket_id = self._entries.pop(key)
+        bucket = self._buckets.get(bucket_id)
+        if bucket:
+            bucket.discard(key)
+            if not bucket.vectors:
+                del self._buckets[bucket_id]
+
+    def _fresh(self, key):
+        # Caller holds the lock; returns the generations of a live entry, dropping an expired one
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if self.ttl is not None and time.monotonic() - item[0] > self.ttl:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return item[1]
+
+    def lookup(self, prompt, llm_string):
+        key, bucket_id, text = self._keys(prompt, llm_string)
+        with self._lock:
+            generations = self._fresh(key)
+            if generations is not None:
+                self.exact_hits += 1
+                self._record("hit")
+                return _copies(generations)
+            bucket = self._buckets.get(bucket_id)
+        if bucket is not None and self.embeddings is not None and text:
+            vector = self._embed(text)
+            with self._lock:
+                nearest, score = bucket.nearest(vector)
+                generations = self._fresh(nearest) if nearest and score >= self.similarity else None
+                if generations is not None:
+                    self.semantic_hits += 1
+                    self._record("semantic_hit")
+                    return _copies(generations)
+        with self._lock:
+            self.misses += 1
+        self._record("miss")
+        return None
+
+    def _record(self, result):
+        count_cache(self.name, result)
+        annotate(cache_hit=result != "miss")
+
+    def cacheable(self, generations):
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is None:
+                continue
+            calls = getattr(message, "tool_calls", None) or []
+            if getattr(message, "invalid_tool_calls", None) or any(c["name"] not in self.cacheable_tools for c in calls):
+                return False
+            if not calls and not message.content:
+                return False
+        return bool(generations)
+
+    def update(self, prompt, llm_string, return_val):
+        if not self.cacheable(return_val):
+            with self._lock:
+                self.not_cacheable += 1
+            return
+        key, bucket_id, text = self._keys(prompt, llm_string)
+        vector = self._embed(text) if self.embeddings is not None and text else None
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic(), _copies(return_val), bucket_id)
+            if vector is not None:
+                self._buckets.setdefault(bucket_id, _Bucket()).add(key, vector)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "not_cacheable": self.not_cacheable,
+            "evictions": self.evictions,
+        }
+
+
+def _copies(generations):
+    """Deep copies without message ids, so a replayed answer never replaces an earlier message in state."""
+    copies = copy.deepcopy(generations)
+    for generation in copies:
+        if getattr(generation, "message", None) is not None:
+            generation.message.id = None
+    return copies
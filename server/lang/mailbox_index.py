@@ -0,0 +1,320 @@
+"""Local per-user index of Gmail message metadata, kept fresh from the Gmail history feed.
+
+The first lookup for a user starts a full sync in the background and is answered live.
+That sync lists up to MAILBOX_MAX_MESSAGES recent messages and stores From, Subject,
+snippet, labels and date. After that, a
+lookup older than MAILBOX_FRESH_SECONDS first replays `history.list` from the stored
+historyId. When nothing changed that is one small round trip. If the historyId has
+expired (404), the index is rebuilt.
+
+`search()` answers queries made only of structured operators: from:, subject:, is:,
+in:/label: system labels, newer_than:/older_than: and after:/before:. It returns None
+(meaning: ask Gmail) for anything else, including plain words and "phrases": Gmail
+matches those against the message body, which the index does not hold. It also
+returns None when a short result might be incomplete, because a truncated index may
+be missing older matches.
+"""
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+from lang.gmail import fetch_message_metadata, format_summary, get_header
+
+MAILBOX_INDEX_PATH = os.getenv("MAILBOX_INDEX_PATH", os.path.join(os.getcwd(), "cache", "mailbox.sqlite3"))
+MAILBOX_FRESH_SECONDS = float(os.getenv("MAILBOX_FRESH_SECONDS", "60"))
+MAILBOX_MAX_MESSAGES = int(os.getenv("MAILBOX_MAX_MESSAGES", "2000"))
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+HIDDEN_LABELS = {"SPAM", "TRASH"}  # Gmail leaves these out of searches by default
+SYSTEM_LABELS = {"inbox", "unread", "starred", "important", "sent", "draft"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    rowid INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    internal_date INTEGER NOT NULL,
+    sender TEXT,
+    subject TEXT,
+    snippet TEXT,
+    labels TEXT NOT NULL,
+    UNIQUE (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (user_id, internal_date DESC);
+DROP TABLE IF EXISTS messages_fts;
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id TEXT PRIMARY KEY,
+    history_id TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    complete INTEGER NOT NULL
+);
+"""
+
+
+class UnsupportedQuery(ValueError):
+    pass
+
+
+_TOKEN = re.compile(r'-?\w+:"[^"]*"|-?\w+:\([^)]*\)|"[^"]*"|\S+')
+_AGE_UNITS = {"d": 1, "m": 30, "y": 365}
+
+
+def _day(value):
+    return datetime.datetime.strptime(value.replace("-", "/"), "%Y/%m/%d").timestamp() * 1000
+
+
+def _like(value):
+    """LIKE pattern matching `value` anywhere, with its own % and _ taken literally."""
+    return "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def parse_query(query, now=None):
+    """Gmail query -> (sql clauses, params). Raises UnsupportedQuery.
+
+    Plain words and "phrases" are unsupported: Gmail also matches them against the
+    message body, and the index only holds sender, subject and snippet.
+    """
+    now = now or time.time()
+    clauses, params = [], []
+    for token in _TOKEN.findall(query or ""):
+        if token.startswith(("-", "(", '"')) or ":" not in token or token in ("OR", "AND") or "{" in token:
+            raise UnsupportedQuery(token)
+        op, value = token.split(":", 1)
+        op, value = op.lower(), value.strip('"')
+        if op == "from":
+            clauses.append("sender LIKE ? ESCAPE '\\'")
+            params.append(_like(value))
+        elif op == "subject":
+            clauses.append("subject LIKE ? ESCAPE '\\'")
+            params.append(_like(value.strip('()')))
+        elif op == "is" and value.lower() == "read":
+            clauses.append("labels NOT LIKE '% UNREAD %'")
+        elif op in ("is", "in", "label") and value.lower() in SYSTEM_LABELS:
+            clauses.append("labels LIKE ?")
+            params.append(f"% {value.upper()} %")
+        elif op in ("newer_than", "older_than") and re.fullmatch(r"\d+[dmy]", value):
+            cutoff = (now - int(value[:-1]) * _AGE_UNITS[value[-1]] * 86400) * 1000
+            clauses.append("internal_date >= ?" if op == "newer_than" else "internal_date < ?")
+            params.append(cutoff)
+        elif op in ("after", "before") and re.fullmatch(r"\d{4}[/-]\d{1,2}[/-]\d{1,2}", value):
+            clauses.append("internal_date >= ?" if op == "after" else "internal_date < ?")
+            params.append(_day(value))
+        else:
+            raise UnsupportedQuery(token)
+    return clauses, params
+
+
+class MailboxIndex:
+    def __init__(self, path=MAILBOX_INDEX_PATH, fresh_seconds=MAILBOX_FRESH_SECONDS, max_messages=MAILBOX_MAX_MESSAGES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._sync_locks = {}
+        self._full_syncs_running = set()
+        self.fresh_seconds = fresh_seconds
+        self.max_messages = max_messages
+        self.local_answers = 0
+        self.live_fallbacks = 0
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.history_records = 0
+        self._query_seconds = 0.0
+
+    # ---- storage ----------------------------------------------------------
+
+    def _state(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history_id, synced_at, complete FROM sync_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return {"history_id": row[0], "synced_at": row[1], "complete": bool(row[2])} if row else None
+
+    def _delete(self, user_id, ids):
+        # Caller holds the lock, inside a transaction
+        for msg_id in ids:
+            row = self._conn.execute("SELECT rowid FROM messages WHERE user_id = ? AND id = ?", (user_id, msg_id)).fetchone()
+            if row:
+                self._conn.execute("DELETE FROM messages WHERE rowid = ?", row)
+
+    def _upsert(self, user_id, message):
+        # Caller holds the lock, inside a transaction
+        self._delete(user_id, [message["id"]])
+        labels = message.get("labelIds", [])
+        if HIDDEN_LABELS & set(labels):
+            return
+        headers = message.get("payload", {}).get("headers", [])
+        sender, subject = get_header(headers, "From", "Unknown"), get_header(headers, "Subject", "No Subject")
+        self._conn.execute(
+            "INSERT INTO messages (user_id, id, internal_date, sender, subject, snippet, labels) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, message["id"], int(message.get("internalDate", 0)), sender, subject,
+             message.get("snippet", ""), f" {' '.join(labels)} "),
+        )
+
+    def _relabel(self, user_id, msg_id, labels):
+        # Caller holds the lock, inside a transaction
+        if HIDDEN_LABELS & set(labels):
+            self._delete(user_id, [msg_id])
+        else:
+            self._conn.execute(
+                "UPDATE messages SET labels = ? WHERE user_id = ? AND id = ?", (f" {' '.join(labels)} ", user_id, msg_id)
+            )
+
+    def _trim(self, user_id):
+        """Drops the oldest messages beyond max_messages; returns True if any were dropped."""
+        rows = self._conn.execute(
+            "SELECT id FROM messages WHERE user_id = ? ORDER BY internal_date DESC LIMIT -1 OFFSET ?",
+            (user_id, self.max_messages),
+        ).fetchall()
+        self._delete(user_id, [r[0] for r in rows])
+        return bool(rows)
+
+    def _save_state(self, user_id, history_id, complete):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sync_state (user_id, history_id, synced_at, complete) VALUES (?, ?, ?, ?)",
+            (user_id, str(history_id), time.time(), int(complete)),
+        )
+
+    def forget(self, user_id):
+        """Removes everything stored for a user (on logout)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            self._conn.execute("DELETE FROM sync_state WHERE user_id = ?", (user_id,))
+
+    # ---- sync -------------------------------------------------------------
+
+    def full_sync(self, service, user_id):
+        # Read the historyId first so changes made while listing are replayed later
+        history_id = service.users().getProfile(userId='me').execute()["historyId"]
+        ids, token = [], None
+        while len(ids) < self.max_messages:
+            page = service.users().messages().list(
+                userId='me', maxResults=min(500, self.max_messages - len(ids)), pageToken=token
+            ).execute()
+            ids.extend(m["id"] for m in page.get("messages", []))
+            token = page.get("nextPageToken")
+            if not token:
+                break
+        fetched = fetch_message_metadata(service, ids)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            for _, message, error in fetched:
+                if error is None:
+                    self._upsert(user_id, message)
+            self._save_state(user_id, history_id, complete=token is None)
+        self.full_syncs += 1
+
+    def incremental_sync(self, service, user_id, state):
+        added, deleted, relabeled = set(), set(), {}
+        token, page = None, {}
+        while True:
+            page = service.users().history().list(
+                userId='me', startHistoryId=state["history_id"], historyTypes=HISTORY_TYPES, pageToken=token
+            ).execute()
+            for record in page.get("history", []):
+                self.history_records += 1
+                for item in record.get("messagesAdded", []):
+                    added.add(item["message"]["id"])
+                    deleted.discard(item["message"]["id"])
+                for item in record.get("messagesDeleted", []):
+                    deleted.add(item["message"]["id"])
+                    added.discard(item["message"]["id"])
+                    relabeled.pop(item["message"]["id"], None)
+                for item in record.get("labelsAdded", []) + record.get("labelsRemoved", []):
+                    relabeled[item["message"]["id"]] = item["message"].get("labelIds", [])
+            token = page.get("nextPageToken")
+            if not token:
+                break
+
+        fetched = fetch_message_metadata(service, sorted(added)) if added else []
+        with self._lock, self._conn:
+            self._delete(user_id, deleted)
+            for _, message, error in fetched:
+                if error is None:
+                    self._upsert(user_id, message)
+            for msg_id, labels in relabeled.items():
+                if msg_id not in added:
+                    self._relabel(user_id, msg_id, labels)
+            complete = state["complete"] and not self._trim(user_id)
+            self._save_state(user_id, page.get("historyId", state["history_id"]), complete)
+        self.incremental_syncs += 1
+
+    def sync(self, service, user_id):
+        state = self._state(user_id)
+        if state is None:
+            return self.full_sync(service, user_id)
+        try:
+            self.incremental_sync(service, user_id, state)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # The stored historyId is too old for Gmail to replay
+            self.full_sync(service, user_id)
+
+    def _background_full_sync(self, service, user_id):
+        try:
+            with self._sync_locks.setdefault(user_id, threading.Lock()):
+                self.full_sync(service, user_id)
+        except Exception as e:
+            print(f"[ERROR] Mailbox index sync failed: {e}")
+        finally:
+            self._full_syncs_running.discard(user_id)
+
+    def ensure_fresh(self, service, user_id):
+        """True when the index may answer for this user right now."""
+        state = self._state(user_id)
+        if state is None:
+            if user_id not in self._full_syncs_running:
+                self._full_syncs_running.add(user_id)
+                threading.Thread(target=self._background_full_sync, args=(service, user_id), daemon=True).start()
+            return False
+        if time.time() - state["synced_at"] <= self.fresh_seconds:
+            return True
+        with self._sync_locks.setdefault(user_id, threading.Lock()):
+            # Another caller may have synced while this one waited
+            state = self._state(user_id)
+            if time.time() - state["synced_at"] <= self.fresh_seconds:
+                return True
+            try:
+                self.sync(service, user_id)
+                return True
+            except Exception as e:
+                print(f"[ERROR] Mailbox index sync failed: {e}")
+                return False
+
+    # ---- queries ----------------------------------------------------------
+
+    def search(self, user_id, query, count):
+        """Summary lines of the newest `count` matches, or None when Gmail should answer."""
+        start = time.perf_counter()
+        try:
+            clauses, params = parse_query(query)
+        except UnsupportedQuery:
+            self.live_fallbacks += 1
+            return None
+        state = self._state(user_id)
+        where = " AND ".join(["user_id = ?"] + clauses)
+        sql = f"SELECT sender, subject, snippet FROM messages WHERE {where} ORDER BY internal_date DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, [user_id] + params + [count]).fetchall()
+        self._query_seconds += time.perf_counter() - start
+        if len(rows) < count and not (state and state["complete"]):
+            self.live_fallbacks += 1
+            return None
+        self.local_answers += 1
+        return [format_summary(*row) for row in rows]
+
+    def stats(self):
+        return {
+            "local_answers": self.local_answers,
+            "live_fallbacks": self.live_fallbacks,
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "history_records": self.history_records,
+            "avg_query_ms": round(1000 * self._query_seconds / self.local_answers, 3) if self.local_answers else 0.0,
+        }
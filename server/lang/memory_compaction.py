@@ -0,0 +1,163 @@
+"""Near-duplicate detection for the `user_memory` collection, plus an offline compaction job.
+
+Run from the server directory:
+    python -m lang.memory_compaction [--user EMAIL] [--threshold 0.92] [--rebuild] [--dry-run]
+
+For every user the job groups memories whose embeddings are closer than the
+threshold, keeps the newest memory of each group, deletes the rest, and with
+--rebuild copies the survivors into a fresh collection so the HNSW segment is
+rebuilt without tombstones (stop the server first: it holds the old collection).
+It prints before/after counts and query latency.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+MEMORY_DEDUP_THRESHOLD = float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.92"))
+
+
+def cosine_similarity(a, b):
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / denom) if denom else 0.0
+
+
+def find_duplicates(ids, embeddings, timestamps, threshold=MEMORY_DEDUP_THRESHOLD):
+    """Greedy clustering, newest first; returns {kept_id: [duplicate ids merged into it]}."""
+    if not ids:
+        return {}
+    vectors = np.asarray(embeddings, dtype=float)
+    vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    order = sorted(range(len(ids)), key=lambda i: timestamps[i] or "", reverse=True)
+    kept, groups = [], {}
+    for i in order:
+        if kept:
+            sims = vectors[kept] @ vectors[i]
+            best = int(np.argmax(sims))
+            if sims[best] >= threshold:
+                groups[ids[kept[best]]].append(ids[i])
+                continue
+        kept.append(i)
+        groups[ids[i]] = []
+    return groups
+
+
+def _query_latency_ms(col, user_ids, samples=20, k=5):
+    """Average latency of a k-NN query filtered to one user, using stored vectors as probes."""
+    timings = []
+    for user_id in user_ids:
+        probe = col.get(where={"user_id": user_id}, limit=1, include=["embeddings"])
+        if not len(probe["embeddings"]):
+            continue
+        for _ in range(samples):
+            start = time.perf_counter()
+            col.query(query_embeddings=[probe["embeddings"][0]], n_results=k, where={"user_id": user_id})
+            timings.append(time.perf_counter() - start)
+    return round(1000 * sum(timings) / len(timings), 3) if timings else 0.0
+
+
+def _collection_names(client):
+    return {c if isinstance(c, str) else c.name for c in client.list_collections()}
+
+
+def _rebuild_collection(client, name, batch_size=1000):
+    """Copies every record into a fresh collection and swaps it in under the same name.
+
+    The original is renamed to `<name>_backup` rather than deleted, and only dropped
+    once the copy holds exactly the same ids under the live name. If anything fails
+    before that, the original is put back and the copy removed.
+    """
+    old = client.get_collection(name)
+    tmp_name, backup_name = f"{name}_rebuild", f"{name}_backup"
+    existing = _collection_names(client)
+    if backup_name in existing:
+        raise RuntimeError(f"{backup_name} exists from an earlier rebuild; check it and delete it first")
+    if tmp_name in existing:
+        client.delete_collection(tmp_name)  # a partial copy left by an interrupted run
+    new = client.create_collection(tmp_name, metadata=old.metadata)
+    swapped = False
+    try:
+        total = old.count()
+        for offset in range(0, total, batch_size):
+            page = old.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+            new.add(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"], metadatas=page["metadatas"])
+        if set(new.get(include=[])["ids"]) != set(old.get(include=[])["ids"]):
+            raise RuntimeError(f"rebuilt copy of {name} does not match the original")
+        old.modify(name=backup_name)
+        swapped = True
+        new.modify(name=name)
+    except Exception:
+        if swapped:
+            old.modify(name=name)
+        client.delete_collection(tmp_name)
+        raise
+    client.delete_collection(backup_name)
+    return client.get_collection(name)
+
+
+def compact(client, collection_name, user=None, threshold=MEMORY_DEDUP_THRESHOLD, rebuild=False, dry_run=False,
+            versions=None):
+    """versions: optional MemoryVersions, bumped for every user whose memories changed."""
+    col = client.get_collection(collection_name)
+    if user:
+        users = [user]
+    else:
+        users = sorted({m.get("user_id") for m in col.get(include=["metadatas"])["metadatas"] if m.get("user_id")})
+
+    report = {"users": {}, "before": col.count(), "query_ms_before": _query_latency_ms(col, users)}
+    to_delete, changed = [], []
+    for user_id in users:
+        records = col.get(where={"user_id": user_id}, include=["embeddings", "metadatas"])
+        groups = find_duplicates(
+            records["ids"],
+            records["embeddings"],
+            [m.get("timestamp") for m in records["metadatas"]],
+            threshold,
+        )
+        duplicates = [d for dups in groups.values() for d in dups]
+        report["users"][user_id] = {"before": len(records["ids"]), "after": len(records["ids"]) - len(duplicates)}
+        to_delete.extend(duplicates)
+        if duplicates:
+            changed.append(user_id)
+        if not dry_run:
+            merged = [(kept, len(dups)) for kept, dups in groups.items() if dups]
+            if merged:
+                metas = {i: m for i, m in zip(records["ids"], records["metadatas"])}
+                col.update(
+                    ids=[kept for kept, _ in merged],
+                    metadatas=[{**metas[kept], "merged": metas[kept].get("merged", 0) + n} for kept, n in merged],
+                )
+
+    if not dry_run:
+        for start in range(0, len(to_delete), 1000):
+            col.delete(ids=to_delete[start:start + 1000])
+        if versions is not None and changed:
+            versions.bump(changed)
+        if rebuild:
+            col = _rebuild_collection(client, collection_name)
+
+    report["duplicates"] = len(to_delete)
+    report["after"] = report["before"] - len(to_delete)
+    report["query_ms_after"] = _query_latency_ms(col, users)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge near-duplicate memories in the Chroma user_memory collection.")
+    parser.add_argument("--user", help="only compact this user's memories")
+    parser.add_argument("--threshold", type=float, default=MEMORY_DEDUP_THRESHOLD, help="cosine similarity treated as duplicate")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the collection (and its HNSW index) afterwards")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be merged without changing anything")
+    args = parser.parse_args()
+
+    from lang.agent import chroma_client, collection_name, memory_versions
+    report = compact(chroma_client, collection_name, args.user, args.threshold, args.rebuild, args.dry_run,
+                     versions=memory_versions)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
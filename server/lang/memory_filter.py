@@ -0,0 +1,89 @@
+"""Local scorer that decides whether a message is worth an LLM memory-extraction call.
+
+Most messages reaching update_memory_node hold nothing to remember: greetings,
+acknowledgements, questions about the inbox, and tool output such as inbox
+listings or "Event created: <link>". Each message gets a score from weighted
+regex features (first-person statements, preferences, personal facts, requests
+to remember vs. acknowledgements, tool-output shapes, bare questions), squashed
+to 0..1. Only messages at or above the threshold for their kind go to extraction.
+Tool output starts from a strong negative prior; its threshold is separate.
+
+Thresholds come from MEMORY_FILTER_THRESHOLD / MEMORY_FILTER_TOOL_THRESHOLD;
+`python -m bench.memory_filter` reports precision and recall on labeled samples
+for a range of thresholds.
+"""
+import math
+import os
+import re
+import threading
+
+MEMORY_FILTER_THRESHOLD = float(os.getenv("MEMORY_FILTER_THRESHOLD", "0.5"))
+MEMORY_FILTER_TOOL_THRESHOLD = float(os.getenv("MEMORY_FILTER_TOOL_THRESHOLD", "0.5"))
+
+PRIORS = {"human": -1.0, "tool": -3.0}
+
+# (name, pattern, weight); a feature counts once per message
+FEATURES = [
+    # Something about the user
+    ("first_person", r"\b(i|i'm|i've|i'd|i'll|im|my|mine|me|we|our|us)\b", 1.0),
+    ("preference", r"\b(prefer|prefers|like|likes|love|loves|hate|hates|dislike|favou?rite|enjoy|can't stand|rather)\b", 1.5),
+    ("habit", r"\b(always|never|usually|every (day|morning|evening|week|month|monday|tuesday|wednesday|thursday|friday|saturday|sunday))\b", 1.0),
+    ("identity", r"\b(my name is|call me|i live|i'm based|i work|i'm from|i am from|my (job|role|title|company|team|manager|boss|wife|husband|partner|son|daughter|kids?|mom|dad|mother|father|sister|brother|birthday|address|phone|email|dog|cat))\b", 2.0),
+    ("health_diet", r"\b(allergic|allergy|vegetarian|vegan|gluten|lactose|diet|kosher|halal)\b", 2.0),
+    ("remember_request", r"\b(remember|remind me|don't forget|do not forget|note that|keep in mind|for future reference)\b", 3.0),
+    ("obligation", r"\b(need to|have to|must|deadline|due (on|by)|by (monday|tuesday|wednesday|thursday|friday|saturday|sunday|tomorrow|next week|end of))\b", 1.0),
+    ("plan", r"\b(i'm (going|flying|traveling|travelling|moving|starting)|i will be|i'll be|we're (going|moving)|my (flight|trip|vacation|holiday|appointment))\b", 1.5),
+    # Nothing to remember
+    ("short_ack", r"^\W*(hi|hello|hey|thanks?( you)?|thx|ok(ay)?|sure|yes|no|yep|nope|cool|great|got it|sounds good|perfect|bye|good (morning|afternoon|evening|night))\W*$", -4.0),
+    ("question", r"\?\s*$", -1.0),
+    ("lookup_request", r"^\W*(what|what's|whats|when|where|who|how|do i|did i|can you|could you|show|list|check|read|search|find|any)\b", -0.5),
+    ("tool_request", r"\b(inbox|unread|emails?|calendar|events?|schedule)\b", -0.5),
+    # Tool output shapes
+    ("email_listing", r"^From: .* \| Subject: .* \| Snippet: ", -1.0),
+    ("event_listing", r"^\[ID: [^\]]+\] ", -3.0),
+    ("status_line", r"^(Event created: |Event [^ ]+ deleted\.|Email sent to |No (unread|matching) (messages|emails) found\.|No events found\.|Authentication required\.|Error\b|Busy:|Free from )", -4.0),
+    ("url_only", r"^\s*https?://\S+\s*$", -3.0),
+]
+# Only for tool output: mail about the user's own bookings and obligations is worth a look
+TOOL_FEATURES = [
+    ("personal_notice", r"\b(confirmed|confirmation|your (flight|appointment|reservation|booking|rent|lease|order|itinerary|ticket|trip)|has been (booked|scheduled|rescheduled|cancelled))\b", 4.0),
+]
+
+
+def _compile(table):
+    return [(name, re.compile(pattern, re.IGNORECASE | re.MULTILINE), weight) for name, pattern, weight in table]
+
+
+_COMPILED = {"human": _compile(FEATURES), "tool": _compile(FEATURES + TOOL_FEATURES)}
+
+
+def features(content, kind="human"):
+    """Names and weights of the features present in `content`."""
+    return [(name, weight) for name, regex, weight in _COMPILED.get(kind, _COMPILED["human"]) if regex.search(content)]
+
+
+def score(content, kind="human"):
+    """Probability-like 0..1 score that `content` holds something worth remembering."""
+    total = PRIORS.get(kind, PRIORS["human"]) + sum(weight for _, weight in features(content, kind))
+    return 1 / (1 + math.exp(-total))
+
+
+class MemoryFilter:
+    def __init__(self, threshold=MEMORY_FILTER_THRESHOLD, tool_threshold=MEMORY_FILTER_TOOL_THRESHOLD):
+        self.thresholds = {"human": threshold, "tool": tool_threshold}
+        self._lock = threading.Lock()
+        self.counters = {"checked": 0, "passed": 0, "skipped_human": 0, "skipped_tool": 0}
+
+    def worth_extracting(self, content, kind="human"):
+        """kind: "human" for user messages, "tool" for tool results."""
+        passed = bool(content.strip()) and score(content, kind) >= self.thresholds.get(kind, self.thresholds["human"])
+        with self._lock:
+            self.counters["checked"] += 1
+            key = "passed" if passed else f"skipped_{kind}"
+            self.counters[key] = self.counters.get(key, 0) + 1
+        return passed
+
+    def stats(self):
+        with self._lock:
+            checked = self.counters["checked"]
+            return {**self.counters, "pass_rate": round(self.counters["passed"] / checked, 4) if checked else 0.0}
@@ -0,0 +1,100 @@
+"""Background queue that keeps memory extraction and storage off the request path.
+
+Messages are submitted from the graph and handled by a small pool of extraction
+workers (one LLM call each). Extracted facts go through a single store worker
+that writes them in batches, so one embedding request covers many snippets.
+"""
+import queue
+import threading
+import time
+
+
+class MemoryWorkQueue:
+    def __init__(self, extract, store, workers=2, max_pending=256, batch_size=16, batch_wait=0.2, submit_timeout=0.05):
+        """
+        extract: callable(content) -> fact string, or None when nothing is worth keeping
+        store: callable(list of (user_id, fact, source)) -> None, writes one batch
+        """
+        self._extract = extract
+        self._store = store
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.submit_timeout = submit_timeout
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._extracted = queue.Queue()
+        self._started = False
+        self._lock = threading.Lock()
+        self.counters = {"submitted": 0, "dropped": 0, "extracted": 0, "stored": 0, "failed": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                threading.Thread(target=self._extract_loop, name=f"memory-extract-{i}", daemon=True).start()
+            threading.Thread(target=self._store_loop, name="memory-store", daemon=True).start()
+            self._started = True
+
+    def submit(self, user_id, content, source="conversation_insight"):
+        """Queues a message for extraction; returns False if it was shed under backpressure."""
+        self._ensure_started()
+        try:
+            self._pending.put((user_id, content, source), timeout=self.submit_timeout)
+        except queue.Full:
+            self._count("dropped")
+            print(f"[Memory] Queue full, skipping extraction for {user_id}")
+            return False
+        self._count("submitted")
+        return True
+
+    def _extract_loop(self):
+        while True:
+            user_id, content, source = self._pending.get()
+            try:
+                fact = self._extract(content)
+                if fact:
+                    self._count("extracted")
+                    self._extracted.put((user_id, fact, source))
+            except Exception as e:
+                self._count("failed")
+                print(f"[ERROR] Memory extraction failed: {e}")
+            finally:
+                self._pending.task_done()
+
+    def _store_loop(self):
+        while True:
+            batch = [self._extracted.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._extracted.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._store(batch)
+                self._count("stored", len(batch))
+            except Exception as e:
+                self._count("failed", len(batch))
+                print(f"[ERROR] Memory store failed for {len(batch)} snippets: {e}")
+            finally:
+                for _ in batch:
+                    self._extracted.task_done()
+
+    def flush(self):
+        """Blocks until everything submitted so far has been extracted and stored."""
+        self._pending.join()
+        self._extracted.join()
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "pending": self._pending.qsize(), "awaiting_store": self._extracted.qsize()}
@@ -0,0 +1,202 @@
+"""In-process BM25 index over the `user_memory` collection, and rank fusion with vector search.
+
+Embedding search is weak at exact entities: a name, an email address or a project
+code like "PRJ-2041" rarely decides nearest neighbours, and each lookup costs an
+embedding call. The index keeps per-user postings of the memory texts, updated as
+memories are stored. lang/agent.py builds it with `rebuild()` when the component
+is first used, which AGENT_PRELOAD and /warmup do at startup. Before a user's
+postings are searched they are checked against that user's ids in Chroma (at
+most every MEMORY_INDEX_FRESH_SECONDS), so memories written by other workers or
+removed by compaction are picked up. Retrieval in lang/agent.py fuses the BM25
+and vector rankings (reciprocal rank fusion). When the query is mostly entities
+and BM25 finds them, the embedding call is skipped.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # rank offset in reciprocal rank fusion; 60 is the usual choice
+MEMORY_INDEX_FRESH_SECONDS = float(os.getenv("MEMORY_INDEX_FRESH_SECONDS", "10"))
+
+_ENTITY = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+|\b[A-Za-z]+[-_]?\d[\w-]*\b|\b\d{3,}\b")
+_WORD = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+|\w+(?:[-_]\w+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from has have how i in is it me my of on or our that the their "
+    "this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """Lowercased terms; emails and hyphenated codes are kept whole and also split into parts."""
+    terms = []
+    for token in _WORD.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        parts = re.findall(r"[a-z0-9]+", token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p not in STOPWORDS)
+    return terms
+
+
+def is_entity_query(query, min_share=0.5):
+    """True when most of the query is names, emails, codes or numbers, so exact terms decide relevance."""
+    words = [w for w in re.findall(r"\S+", query) if w.lower().strip("?.,!") not in STOPWORDS]
+    if not words:
+        return False
+    # A capital at the start of a sentence says nothing, unless the query is that one word
+    entities = sum(1 for i, w in enumerate(words)
+                   if _ENTITY.search(w) or (w[:1].isupper() and (i > 0 or len(words) == 1)))
+    return entities / len(words) >= min_share
+
+
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """Merges ranked id lists into one ranking by sum of 1 / (k + rank)."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class _UserIndex:
+    def __init__(self):
+        self.texts = {}
+        self.lengths = {}
+        self.postings = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self.total_length = 0
+        self.checked_at = 0.0
+
+    def add(self, doc_id, text):
+        if doc_id in self.texts:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        self.texts[doc_id] = text
+        self.lengths[doc_id] = sum(terms.values())
+        self.total_length += self.lengths[doc_id]
+        for term, count in terms.items():
+            self.postings[term][doc_id] = count
+
+    def remove(self, doc_id):
+        if doc_id not in self.texts:
+            return
+        for term in set(tokenize(self.texts.pop(doc_id))):
+            postings = self.postings.get(term)
+            if postings:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id)
+
+
+class MemorySearchIndex:
+    def __init__(self, k1=BM25_K1, b=BM25_B, fresh_seconds=MEMORY_INDEX_FRESH_SECONDS):
+        self.k1 = k1
+        self.b = b
+        self.fresh_seconds = fresh_seconds
+        self._users = defaultdict(_UserIndex)
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.rebuilds = 0
+        self.user_syncs = 0
+
+    def _apply(self, users, op, user_id, doc_id, text=None):
+        # Caller holds the lock
+        if op == "add":
+            users[user_id].add(doc_id, text)
+        elif user_id in users:
+            users[user_id].remove(doc_id)
+
+    def add(self, user_id, doc_id, text):
+        with self._lock:
+            self._apply(self._users, "add", user_id, doc_id, text)
+
+    def remove(self, user_id, doc_id):
+        with self._lock:
+            self._apply(self._users, "remove", user_id, doc_id)
+
+    def rebuild(self, collection, batch_size=1000):
+        """Reloads every user's postings from a Chroma collection.
+
+        The new index is built without holding the lock, so searches keep using the
+        old one meanwhile. A write that lands during the build may be missing from
+        the new index; `sync_user` adds it back before that user's next search.
+        """
+        users = defaultdict(_UserIndex)
+        offset = 0
+        while True:
+            page = collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+            for doc_id, text, meta in zip(page["ids"], page["documents"], page["metadatas"]):
+                if meta and meta.get("user_id") and text:
+                    users[meta["user_id"]].add(doc_id, text)
+            offset += len(page["ids"])
+            if len(page["ids"]) < batch_size:
+                break
+        with self._lock:
+            self._users = users
+            self.rebuilds += 1
+
+    def sync_user(self, collection, user_id):
+        """Brings one user's postings in line with Chroma, at most once per `fresh_seconds`.
+
+        Memories stored by other workers are loaded and ones deleted elsewhere (by
+        compaction, say) are dropped. Only the ids are listed unless something differs.
+        """
+        with self._lock:
+            index = self._users.get(user_id)
+            if index and time.time() - index.checked_at <= self.fresh_seconds:
+                return
+            # Snapshot before listing Chroma: memories are stored there before they are added here
+            known = set(index.texts) if index else set()
+        stored = set(collection.get(where={"user_id": user_id}, include=[])["ids"])
+        missing, deleted = stored - known, known - stored
+        fetched = collection.get(ids=sorted(missing), include=["documents"]) if missing else {"ids": [], "documents": []}
+        with self._lock:
+            for doc_id in deleted:
+                self._apply(self._users, "remove", user_id, doc_id)
+            for doc_id, text in zip(fetched["ids"], fetched["documents"]):
+                if text:
+                    self._apply(self._users, "add", user_id, doc_id, text)
+            self._users[user_id].checked_at = time.time()
+            if missing or deleted:
+                self.user_syncs += 1
+
+    def text(self, user_id, doc_id):
+        index = self._users.get(user_id)
+        return index.texts.get(doc_id) if index else None
+
+    def search(self, user_id, query, k=5):
+        """[(doc_id, bm25 score)] of the user's best matches, best first."""
+        with self._lock:
+            self.searches += 1
+            index = self._users.get(user_id)
+            if index is None or not index.texts:
+                return []
+            count = len(index.texts)
+            average = index.total_length / count
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = index.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * index.lengths[doc_id] / average)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "documents": sum(len(index.texts) for index in self._users.values()),
+                "terms": sum(len(index.postings) for index in self._users.values()),
+                "searches": self.searches,
+                "rebuilds": self.rebuilds,
+                "user_syncs": self.user_syncs,
+            }
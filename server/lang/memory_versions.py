@@ -0,0 +1,45 @@
+"""Per-user version stamps of the memory collection, for cheap /memory ETags.
+
+Every change to a user's memories (storing new ones, compaction) calls `bump()`
+after the Chroma write, which saves a fresh random stamp in a small SQLite table
+shared by all workers and by the offline compaction job. Reading a stamp is one
+primary-key lookup, so a poll answered 304 never lists the collection. A user
+without a row gets a stamp on first read; stamps are random, so a recreated file
+cannot hand out a stamp a client already holds.
+"""
+import os
+import sqlite3
+import threading
+import uuid
+
+MEMORY_VERSIONS_PATH = os.getenv("MEMORY_VERSIONS_PATH", os.path.join(os.getcwd(), "db", "memory_versions.sqlite3"))
+
+
+class MemoryVersions:
+    def __init__(self, path=MEMORY_VERSIONS_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS memory_versions (user_id TEXT PRIMARY KEY, stamp TEXT NOT NULL)")
+        self._lock = threading.Lock()
+        self.bumps = 0
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._conn.execute("SELECT stamp FROM memory_versions WHERE user_id = ?", (user_id,)).fetchone()
+            if row:
+                return row[0]
+            with self._conn:
+                self._conn.execute("INSERT OR IGNORE INTO memory_versions (user_id, stamp) VALUES (?, ?)",
+                                   (user_id, uuid.uuid4().hex))
+            return self._conn.execute("SELECT stamp FROM memory_versions WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def bump(self, user_ids):
+        """Gives each of `user_ids` a new stamp; call it after their memories changed."""
+        rows = [(user_id, uuid.uuid4().hex) for user_id in set(user_ids)]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO memory_versions (user_id, stamp) VALUES (?, ?)", rows)
+            self.bumps += len(rows)
+
+    def stats(self):
+        return {"bumps": self.bumps}
@@ -0,0 +1,238 @@
+"""Timing spans, token and cache counters for chat turns, exported in Prometheus text format.
+
+`span(stage, name)` times a block and observes it in the `agent_stage_seconds`
+histogram. Stages in use:
+- request: /chat and /chat/stream
+- node: update_memory, agent, tools
+- tool: one per tool call
+- llm: agent, summarizer, extractor
+- embedding
+- chroma: vector store reads and writes
+- lexical: the BM25 memory index
+- google: one per Google API request or batch
+
+`annotate(**attrs)` adds attributes (cache hits, token counts, sizes) to the
+innermost open span. `count_tokens()` feeds `agent_llm_tokens_total` and adds the
+counts to the span; `count_cache()` feeds `agent_cache_lookups_total`.
+`render()` is the /metrics payload; metrics are per process, so every gunicorn
+worker is scraped (or summed) separately.
+
+Within `tracing()` every span closed in the request's context is also appended to
+that request's trace, with its start offset, duration, parent and attributes.
+The context reaches LangGraph's worker threads and the tool pool, because both
+copy contextvars. /chat returns the trace when asked (`X-Trace: 1` or `?trace=1`);
+TRACE_REQUESTS=1 logs every trace as one `[Trace]` JSON line.
+"""
+import bisect
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_REQUESTS = os.getenv("TRACE_REQUESTS", "0") == "1"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, le=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, values)} {total:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., count, sum]; cumulated in render()
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        """{label values: (count, sum)}"""
+        with self._lock:
+            return {values: (series[-2], series[-1]) for values, series in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, values, f'{bound:g}')} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, '+Inf')} {series[-2]}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-1]:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labels, values)} {series[-2]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("agent_stage_seconds", "Time spent per pipeline stage.", ("stage", "name"))
+STAGE_ERRORS = Counter("agent_stage_errors_total", "Stages that raised.", ("stage", "name"))
+LLM_TOKENS = Counter("agent_llm_tokens_total", "LLM tokens; source is api for billed calls, cache for replayed answers.", ("name", "kind", "source"))
+CACHE_LOOKUPS = Counter("agent_cache_lookups_total", "Cache lookups by result.", ("cache", "result"))
+METRICS = [STAGE_SECONDS, STAGE_ERRORS, LLM_TOKENS, CACHE_LOOKUPS]
+
+_span_ids = itertools.count(1)
+_current = contextvars.ContextVar("telemetry_span", default=None)
+_trace = contextvars.ContextVar("telemetry_trace", default=None)
+
+
+class Span:
+    __slots__ = ("id", "stage", "name", "parent", "attrs", "start")
+
+    def __init__(self, stage, name, parent, attrs):
+        self.id = next(_span_ids)
+        self.stage, self.name, self.parent, self.attrs = stage, name, parent, attrs
+        self.start = time.perf_counter()
+
+
+class Trace:
+    def __init__(self, request=None):
+        self.request = request
+        self.start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span, seconds):
+        with self._lock:
+            self.spans.append({
+                "id": span.id,
+                "parent": span.parent.id if span.parent else None,
+                "stage": span.stage,
+                "name": span.name,
+                "start_ms": round(1000 * (span.start - self.start), 2),
+                "ms": round(1000 * seconds, 2),
+                **span.attrs,
+            })
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {"request": self.request, "total_ms": round(1000 * (time.perf_counter() - self.start), 2), "spans": spans}
+
+
+@contextmanager
+def span(stage, name, **attrs):
+    parent = _current.get()
+    record = Span(stage, name, parent, attrs)
+    # set() back to the parent instead of reset(): a span may close in a copied context (generators, pools)
+    _current.set(record)
+    try:
+        yield record
+    except BaseException:
+        STAGE_ERRORS.inc(1, stage, name)
+        record.attrs["error"] = True
+        raise
+    finally:
+        seconds = time.perf_counter() - record.start
+        _current.set(parent)
+        STAGE_SECONDS.observe(seconds, stage, name)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(record, seconds)
+
+
+def timed(stage, name):
+    """Decorator form of span() for plain and async functions."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage, name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def annotate(**attrs):
+    record = _current.get()
+    if record is not None:
+        record.attrs.update(attrs)
+
+
+def count_cache(cache, result, amount=1):
+    """result: "hit", "semantic_hit" or "miss"."""
+    if amount:
+        CACHE_LOOKUPS.inc(amount, cache, result)
+
+
+def count_tokens(name, message):
+    """Counts the usage_metadata of an LLM answer; answers replayed by the cache count as source="cache"."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    record = _current.get()
+    source = "cache" if record is not None and record.attrs.get("cache_hit") else "api"
+    LLM_TOKENS.inc(usage.get("input_tokens", 0), name, "input", source)
+    LLM_TOKENS.inc(usage.get("output_tokens", 0), name, "output", source)
+    annotate(input_tokens=usage.get("input_tokens", 0), output_tokens=usage.get("output_tokens", 0))
+
+
+@contextmanager
+def tracing(request=None, enabled=True):
+    """Collects the spans of this request; yields the Trace, or None when not enabled (and not TRACE_REQUESTS)."""
+    if not (enabled or TRACE_REQUESTS):
+        yield None
+        return
+    trace = Trace(request)
+    previous = _trace.get()
+    _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.set(previous)
+        if TRACE_REQUESTS:
+            print(f"[Trace] {json.dumps(trace.to_dict())}")
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
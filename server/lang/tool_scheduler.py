@@ -0,0 +1,124 @@
+"""Tools stage that runs independent read-only calls concurrently and keeps writes in order.
+
+The calls of one AIMessage are cut into segments in the order the model emitted
+them. Up to `max_workers` consecutive read-only calls share a segment and run in
+parallel. Every other call (sending mail, creating or deleting events, any tool
+not declared read-only) gets a segment of its own. It runs only after
+everything before it has finished, and nothing after it starts until it is done.
+Each call has a timeout; a call that times out is answered with an error
+ToolMessage so the model can react, while the underlying request finishes in the
+background.
+
+ScheduledToolNode overrides private ToolNode methods (`_func`, `_afunc`,
+`_run_one`, `_arun_one`), whose signatures change between releases, so
+requirements.txt pins langgraph and langgraph-prebuilt to the tested versions.
+"""
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.prebuilt import ToolNode
+
+from lang.telemetry import span
+
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "8"))  # parallel calls within one step
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "20"))
+
+# Runs sync tool calls so the step can stop waiting on one that overruns its timeout
+_pool = ThreadPoolExecutor(int(os.getenv("TOOL_POOL_SIZE", "32")), thread_name_prefix="tool")
+
+
+def plan_segments(tool_calls, read_only, max_parallel=TOOL_WORKERS):
+    """Splits calls into ordered segments: runs of up to max_parallel read-only calls, and single writes."""
+    segments = []
+    for call in tool_calls:
+        if (call["name"] in read_only and segments and segments[-1][0]["name"] in read_only
+                and len(segments[-1]) < max_parallel):
+            segments[-1].append(call)
+        else:
+            segments.append([call])
+    return segments
+
+
+class ScheduledToolNode(ToolNode):
+    def __init__(self, tools, read_only=(), timeouts=None, default_timeout=TOOL_TIMEOUT, max_workers=TOOL_WORKERS, **kwargs):
+        """read_only: names of tools without side effects; timeouts: {tool name: seconds}."""
+        super().__init__(tools, **kwargs)
+        self.read_only = frozenset(read_only)
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = default_timeout
+        self.max_workers = max_workers
+        self.timed_out = 0
+
+    def timeout_for(self, name):
+        return self.timeouts.get(name, self.default_timeout)
+
+    def _timeout_message(self, call):
+        self.timed_out += 1
+        seconds = self.timeout_for(call["name"])
+        note = "" if call["name"] in self.read_only else " It may still complete; check before retrying."
+        return ToolMessage(
+            content=f"Error: {call['name']} did not finish within {seconds:g}s.{note}",
+            name=call["name"],
+            tool_call_id=call["id"],
+            status="error",
+        )
+
+    def _segment_inputs(self, input):
+        """Yields a copy of the graph state per segment, with the AIMessage cut down to that segment."""
+        messages = input[self._messages_key]
+        index = next(i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], AIMessage))
+        for segment in plan_segments(messages[index].tool_calls, self.read_only, self.max_workers):
+            narrowed = messages[index].model_copy(update={"tool_calls": segment})
+            yield {**input, self._messages_key: messages[:index] + [narrowed] + messages[index + 1:]}
+
+    def _merge(self, outputs):
+        """Joins per-segment results in call order (lists appear when tools return Commands)."""
+        if all(isinstance(output, dict) for output in outputs):
+            return {self._messages_key: [m for output in outputs for m in output[self._messages_key]]}
+        combined = []
+        for output in outputs:
+            combined.extend(output if isinstance(output, list) else [output])
+        return combined
+
+    def _func(self, input, config, runtime):
+        if not isinstance(input, dict) or self._messages_key not in input:
+            return super()._func(input, config, runtime)
+        config = {**config, "max_concurrency": self.max_workers}
+        outputs = []
+        with span("node", "tools"):
+            for part in self._segment_inputs(input):
+                outputs.append(super()._func(part, config, runtime))
+        return self._merge(outputs)
+
+    async def _afunc(self, input, config, runtime):
+        if not isinstance(input, dict) or self._messages_key not in input:
+            return await super()._afunc(input, config, runtime)
+        outputs = []
+        with span("node", "tools"):
+            for part in self._segment_inputs(input):
+                outputs.append(await super()._afunc(part, config, runtime))
+        return self._merge(outputs)
+
+    def _run_one(self, call, input_type, tool_runtime):
+        # The calling thread only waits; the tool itself runs on the bounded pool
+        def run():
+            with span("tool", call["name"]):
+                return super(ScheduledToolNode, self)._run_one(call, input_type, tool_runtime)
+
+        future = _pool.submit(contextvars.copy_context().run, run)
+        try:
+            return future.result(timeout=self.timeout_for(call["name"]))
+        except FuturesTimeout:
+            print(f"[ERROR] Tool {call['name']} timed out")
+            return self._timeout_message(call)
+
+    async def _arun_one(self, call, input_type, tool_runtime):
+        try:
+            with span("tool", call["name"]):
+                return await asyncio.wait_for(super()._arun_one(call, input_type, tool_runtime), self.timeout_for(call["name"]))
+        except asyncio.TimeoutError:
+            print(f"[ERROR] Tool {call['name']} timed out")
+            return self._timeout_message(call)
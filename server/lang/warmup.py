@@ -0,0 +1,53 @@
+"""Preloads the agent's lazy components, in a running server or in this process.
+
+Run from the server directory:
+    python -m lang.warmup --url http://localhost:5000 --token TOKEN   # POST /warmup on a running instance
+    python -m lang.warmup [--components db llm agent]   # build them here
+
+Against a server it is a post-start hook for autoscaled instances: the first chat
+then finds the vector store, models and graph ready. /warmup needs a sign-in token
+(--token, or WARMUP_TOKEN); AGENT_PRELOAD=1 preloads without one. In-process it opens Chroma,
+the checkpoint and cache databases, and builds the models, which checks a fresh
+image or volume before it takes traffic. Prints the per-component report; exits
+with 1 when any component failed.
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preload the agent's vector store, models and compiled graph.")
+    parser.add_argument("--url", help="base URL of a running server; omit to warm up in this process")
+    parser.add_argument("--components", nargs="+", help="only these components (default: all)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--token", default=os.getenv("WARMUP_TOKEN"), help="sign-in token sent as a bearer token with --url")
+    args = parser.parse_args()
+
+    if args.url:
+        body = json.dumps({"components": args.components} if args.components else {}).encode()
+        headers = {"Content-Type": "application/json"}
+        if args.token:
+            headers["Authorization"] = f"Bearer {args.token}"
+        req = urllib.request.Request(args.url.rstrip("/") + "/warmup", data=body, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=args.timeout) as resp:
+                report = json.load(resp)["components"]
+        except urllib.error.HTTPError as e:
+            payload = json.load(e)
+            if "components" not in payload:
+                sys.exit(f"/warmup answered {e.code}: {payload.get('error')}")
+            report = payload["components"]
+    else:
+        import lang.agent  # noqa: F401  registers the components
+        from lang.lazy import warm_up
+        report = warm_up(args.components)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if any("error" in result for result in report.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()